@@ -18,6 +18,49 @@
 # permissions and limitations under the Licence.
 # 
 
+from .redis_finalize_queue import finalize_queue_ack  # noqa
+from .redis_finalize_queue import finalize_queue_add  # noqa
+from .redis_finalize_queue import finalize_queue_claim  # noqa
+from .redis_finalize_queue import finalize_queue_create_group  # noqa
+from .redis_finalize_queue import finalize_queue_read  # noqa
+from .redis_finalize_queue import finalize_queue_touch  # noqa
 from .redis_project_session_job import SessionJob  # noqa
 from .redis_project_session_job import SrvAioRedisSingleton  # noqa
+from .redis_project_session_job import session_job_get_by_key  # noqa
 from .redis_project_session_job import session_job_get_status  # noqa
+from .redis_project_session_job import session_job_set_status  # noqa
+from .redis_staging_reservations import memory_reserve  # noqa
+from .redis_staging_reservations import staging_grow  # noqa
+from .redis_staging_reservations import staging_release  # noqa
+from .redis_staging_reservations import staging_reserve  # noqa
+from .redis_upload_state import get_missing_chunks  # noqa
+from .redis_upload_state import get_upload_manifest_key  # noqa
+from .redis_upload_state import get_upload_progress  # noqa
+from .redis_upload_state import upload_chunks_check  # noqa
+from .redis_upload_state import upload_chunks_get  # noqa
+from .redis_upload_state import upload_chunks_set  # noqa
+from .redis_upload_state import upload_digests_get  # noqa
+from .redis_upload_state import upload_finalize_claim  # noqa
+from .redis_upload_state import upload_manifest_get  # noqa
+from .redis_upload_state import upload_manifest_set  # noqa
+from .redis_upload_state import upload_memory_chunk_set  # noqa
+from .redis_upload_state import upload_memory_chunks_delete  # noqa
+from .redis_upload_state import upload_memory_chunks_get  # noqa
+from .redis_upload_state import upload_parts_get  # noqa
+from .redis_upload_state import upload_parts_set  # noqa
+from .redis_upload_state import upload_pipeline_claim  # noqa
+from .redis_upload_state import upload_pipeline_get  # noqa
+from .redis_upload_state import upload_pipeline_refresh  # noqa
+from .redis_upload_state import upload_pipeline_release  # noqa
+from .redis_upload_state import upload_pipeline_set  # noqa
+from .redis_upload_state import upload_progress_get_many  # noqa
+from .redis_upload_state import upload_progress_set_signed  # noqa
+from .redis_upload_state import upload_progress_set_stage  # noqa
+from .redis_upload_state import upload_session_stats_get  # noqa
+from .redis_upload_state import upload_session_stats_record  # noqa
+from .redis_upload_state import upload_state_delete  # noqa
+from .redis_upload_state import upload_tus_advance  # noqa
+from .redis_upload_state import upload_tus_claim  # noqa
+from .redis_upload_state import upload_tus_create  # noqa
+from .redis_upload_state import upload_tus_get  # noqa
+from .redis_upload_state import upload_tus_release  # noqa
@@ -21,6 +21,7 @@
 from enum import Enum
 
 from aioredis import StrictRedis
+from aioredis.exceptions import ResponseError
 
 from app.commons.logger_services.logger_factory_service import SrvLoggerFactory
 from app.config import ConfigClass
@@ -66,6 +67,81 @@ class SrvAioRedisSingleton:
         keys = await self.__instance.keys(query)
         return await self.__instance.mget(keys)
 
+    async def scan_by_prefix(self, prefix: str):
+        """return the keys under the prefix without blocking the server like KEYS."""
+        query = '{}:*'.format(prefix)
+        return [key async for key in self.__instance.scan_iter(match=query, count=1000)]
+
+    async def mget_by_keys(self, keys: list):
+        return await self.__instance.mget(keys) if keys else []
+
+    async def hincrby_by_key(self, key: str, field: str, amount: int):
+        return await self.__instance.hincrby(key, field, amount)
+
+    async def hset_by_key(self, key: str, field: str = None, content: str = None, mapping: dict = None):
+        await self.__instance.hset(key, field, content, mapping=mapping)
+
+    async def hdel_by_key(self, key: str, *fields):
+        return await self.__instance.hdel(key, *fields)
+
+    async def zrem_by_key(self, key: str, *members):
+        return await self.__instance.zrem(key, *members)
+
+    async def hmget_by_key(self, key: str, fields: list):
+        return await self.__instance.hmget(key, fields)
+
+    async def hgetall_by_key(self, key: str):
+        return await self.__instance.hgetall(key)
+
+    async def hgetall_many(self, keys: list):
+        pipeline = self.__instance.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hgetall(key)
+        return await pipeline.execute()
+
+    async def xadd_by_key(self, key: str, fields: dict):
+        return await self.__instance.xadd(key, fields)
+
+    async def xgroup_create_by_key(self, key: str, group: str):
+        """create the consumer group of the stream, and the stream, unless the group exists."""
+        try:
+            await self.__instance.xgroup_create(key, group, id='0', mkstream=True)
+        except ResponseError as exce:
+            if not str(exce).startswith('BUSYGROUP'):
+                raise
+
+    async def xreadgroup_by_key(self, key: str, group: str, consumer: str, count: int, block: int):
+        """return the entries never delivered to the group as [(entry_id, fields)]."""
+        streams = await self.__instance.xreadgroup(group, consumer, {key: '>'}, count=count, block=block)
+        return streams[0][1] if streams else []
+
+    async def xpending_by_key(self, key: str, group: str, count: int):
+        return await self.__instance.xpending_range(key, group, '-', '+', count)
+
+    async def xclaim_by_key(self, key: str, group: str, consumer: str, min_idle: int, entry_ids: list, justid=False):
+        return await self.__instance.xclaim(key, group, consumer, min_idle, entry_ids, justid=justid)
+
+    async def xack_by_key(self, key: str, group: str, *entry_ids):
+        return await self.__instance.xack(key, group, *entry_ids)
+
+    async def xdel_by_key(self, key: str, *entry_ids):
+        return await self.__instance.xdel(key, *entry_ids)
+
+    async def setbit_by_key(self, key: str, offset: int, value: int):
+        return await self.__instance.setbit(key, offset, value)
+
+    async def getbit_by_key(self, key: str, offset: int):
+        return await self.__instance.getbit(key, offset)
+
+    async def bitcount_by_key(self, key: str):
+        return await self.__instance.bitcount(key)
+
+    async def set_by_key_if_absent(self, key: str, content: str, expire: int):
+        return await self.__instance.set(key, content, nx=True, ex=expire)
+
+    async def eval_script(self, script: str, keys: list, args: list):
+        return await self.__instance.eval(script, len(keys), *keys, *args)
+
     async def check_by_key(self, key: str):
         return await self.__instance.exists(key)
 
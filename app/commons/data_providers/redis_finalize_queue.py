@@ -0,0 +1,108 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import json
+
+from .redis import SrvAioRedisSingleton
+
+# the finalize requests wait in a redis stream until a finalize worker of the
+# consumer group takes them. An entry stays pending until the worker acks it,
+# the entries of a worker which stopped acking are claimed by another one.
+_FINALIZE_QUEUE_KEY = 'finalizequeue'
+_FINALIZE_QUEUE_GROUP = 'finalizers'
+# pending entries looked at to find the ones to take over, the others are still in progress
+_FINALIZE_QUEUE_PENDING_SCAN = 100
+
+
+def parse_finalize_entry(fields: dict) -> dict:
+    message = {field.decode('utf-8'): value.decode('utf-8') for field, value in fields.items()}
+    message['finalize_request'] = json.loads(message['finalize_request'])
+    # the tokens are optional, redis streams have no null
+    message['access_token'] = message['access_token'] or None
+    message['refresh_token'] = message['refresh_token'] or None
+    return message
+
+
+async def finalize_queue_create_group():
+    """create the stream and the consumer group of the finalize workers if they do not exist."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.xgroup_create_by_key(_FINALIZE_QUEUE_KEY, _FINALIZE_QUEUE_GROUP)
+
+
+async def finalize_queue_add(job_key: str, finalize_request: dict, access_token: str, refresh_token: str) -> str:
+    """queue the finalize of the job stored at job_key, return the id of the entry."""
+    srv_redis = SrvAioRedisSingleton()
+    entry_id = await srv_redis.xadd_by_key(
+        _FINALIZE_QUEUE_KEY,
+        {
+            'job_key': job_key,
+            'finalize_request': json.dumps(finalize_request),
+            'access_token': access_token or '',
+            'refresh_token': refresh_token or '',
+        },
+    )
+    return entry_id.decode('utf-8')
+
+
+async def finalize_queue_read(consumer: str, count: int, block: int) -> list:
+    """take up to count new finalize requests for the consumer, waiting block milliseconds at most.
+
+    return [(entry_id, message, deliveries)].
+    """
+    srv_redis = SrvAioRedisSingleton()
+    entries = await srv_redis.xreadgroup_by_key(_FINALIZE_QUEUE_KEY, _FINALIZE_QUEUE_GROUP, consumer, count, block)
+    return [(entry_id.decode('utf-8'), parse_finalize_entry(fields), 1) for entry_id, fields in entries]
+
+
+async def finalize_queue_claim(consumer: str, min_idle: int, count: int) -> list:
+    """take over up to count finalize requests pending for min_idle milliseconds, like finalize_queue_read."""
+    srv_redis = SrvAioRedisSingleton()
+    pending = await srv_redis.xpending_by_key(_FINALIZE_QUEUE_KEY, _FINALIZE_QUEUE_GROUP, _FINALIZE_QUEUE_PENDING_SCAN)
+    stalled = [entry for entry in pending if entry['time_since_delivered'] >= min_idle][:count]
+    deliveries = {entry['message_id'].decode('utf-8'): entry['times_delivered'] for entry in stalled}
+    if not deliveries:
+        return []
+    entries = await srv_redis.xclaim_by_key(
+        _FINALIZE_QUEUE_KEY, _FINALIZE_QUEUE_GROUP, consumer, min_idle, list(deliveries)
+    )
+    claimed = []
+    for entry_id, fields in entries:
+        entry_id = entry_id.decode('utf-8')
+        if fields is None:
+            # the entry was deleted while it was pending, nothing is left to finalize
+            await finalize_queue_ack(entry_id)
+            continue
+        claimed.append((entry_id, parse_finalize_entry(fields), deliveries[entry_id] + 1))
+    return claimed
+
+
+async def finalize_queue_touch(consumer: str, entry_ids: list):
+    """reset the idle time of the entries the consumer is working on, so they are not claimed by another one."""
+    if not entry_ids:
+        return
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.xclaim_by_key(_FINALIZE_QUEUE_KEY, _FINALIZE_QUEUE_GROUP, consumer, 0, entry_ids, justid=True)
+
+
+async def finalize_queue_ack(entry_id: str):
+    """mark a finalize request done and delete it, the tokens it carries do not stay in redis."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.xack_by_key(_FINALIZE_QUEUE_KEY, _FINALIZE_QUEUE_GROUP, entry_id)
+    await srv_redis.xdel_by_key(_FINALIZE_QUEUE_KEY, entry_id)
@@ -96,6 +96,21 @@ class SessionJob:
         self.progress = job_read['progress']
         self.payload = job_read['payload']
 
+    async def read_by_key(self, key: str):
+        """read from redis by the key of the job, one GET instead of the prefix scan of read."""
+        job_read = await session_job_get_by_key(key)
+        if not job_read:
+            raise Exception('[SessionJob] Not found job: {}'.format(key))
+        self.session_id = job_read['session_id']
+        self.job_id = job_read['job_id']
+        self.project_code = job_read['project_code']
+        self.action = job_read['action']
+        self.operator = job_read['operator']
+        self.source = job_read['source']
+        self.status = job_read['status']
+        self.progress = job_read['progress']
+        self.payload = job_read['payload']
+
     async def check_job_id(self):
         """check if job_id already been used."""
         fetched = await session_job_get_status(
@@ -163,3 +178,10 @@ async def session_job_get_status(session_id, job_id, project_code, action, opera
         my_key = 'dataaction:{}:{}:{}:{}:{}'.format(session_id, job_id, action, project_code, operator)
     res_binary = await srv_redis.mget_by_prefix(my_key)
     return [json.loads(record.decode('utf-8')) for record in res_binary] if res_binary else []
+
+
+async def session_job_get_by_key(key: str) -> dict:
+    """return the session job stored at key, empty if there is none."""
+    srv_redis = SrvAioRedisSingleton()
+    record = await srv_redis.get_by_key(key)
+    return json.loads(record) if record else {}
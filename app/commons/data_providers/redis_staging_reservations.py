@@ -0,0 +1,134 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import time
+
+from app.config import ConfigClass
+
+from .redis import SrvAioRedisSingleton
+
+# bytes reserved on the staging disk, or in the memory tier, by the uploads
+# which are not finalized yet, as a hash {resumable_identifier: bytes} with
+# the expiry time of every reservation in a sorted set, so the reservations
+# of abandoned uploads go away on their own.
+_STAGING_RESERVATIONS_KEY = 'stagingreservations'
+_STAGING_RESERVATIONS_EXPIRY_KEY = 'stagingreservations:expiry'
+_MEMORY_RESERVATIONS_KEY = 'memoryreservations'
+_MEMORY_RESERVATIONS_EXPIRY_KEY = 'memoryreservations:expiry'
+
+# drop the expired reservations, then add the new ones only if all of them fit
+# in the budget along the current reservations
+_RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+for _, resumable_identifier in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('HDEL', KEYS[1], resumable_identifier)
+    redis.call('ZREM', KEYS[2], resumable_identifier)
+end
+local reserved = 0
+for _, size in ipairs(redis.call('HVALS', KEYS[1])) do
+    reserved = reserved + tonumber(size)
+end
+local requested = 0
+for i = 4, #ARGV, 2 do
+    requested = requested + tonumber(ARGV[i + 1])
+end
+if reserved + requested > tonumber(ARGV[3]) then
+    return 0
+end
+for i = 4, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), ARGV[i])
+end
+return 1
+"""
+
+# raise the reservation of the upload ARGV[1] to cover ARGV[2] bytes, with up
+# to ARGV[3] bytes ahead for its next chunks, as long as it fits in the budget
+# along the reservations of the other uploads
+_GROW_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or 0)
+local needed = tonumber(ARGV[2])
+if current >= needed then
+    return 1
+end
+local others = -current
+for _, size in ipairs(redis.call('HVALS', KEYS[1])) do
+    others = others + tonumber(size)
+end
+local grown = math.min(needed + tonumber(ARGV[3]), tonumber(ARGV[4]) - others)
+if grown < needed then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], grown)
+redis.call('ZADD', KEYS[2], tonumber(ARGV[5]) + tonumber(ARGV[6]), ARGV[1])
+return 1
+"""
+
+
+async def reserve_bytes(keys: list, reservations: dict, budget: int) -> bool:
+    srv_redis = SrvAioRedisSingleton()
+    args = [int(time.time() * 1000), ConfigClass.STAGING_RESERVATION_EXPIRE * 1000, budget]
+    for resumable_identifier, size in reservations.items():
+        args += [resumable_identifier, size]
+    return await srv_redis.eval_script(_RESERVE_SCRIPT, keys, args) == 1
+
+
+async def staging_reserve(reservations: dict, budget: int) -> bool:
+    """reserve {resumable_identifier: bytes} on the staging disk, all or none of them.
+
+    return False when the reservations do not fit in the budget along the reservations of the other uploads.
+    """
+    return await reserve_bytes([_STAGING_RESERVATIONS_KEY, _STAGING_RESERVATIONS_EXPIRY_KEY], reservations, budget)
+
+
+async def staging_grow(resumable_identifier: str, size: int, step: int, budget: int) -> bool:
+    """make the staging disk reserved by an upload cover size bytes, with up to step bytes more for its next chunks.
+
+    return False when size does not fit in the budget along the reservations of the other uploads.
+    """
+    srv_redis = SrvAioRedisSingleton()
+    keys = [_STAGING_RESERVATIONS_KEY, _STAGING_RESERVATIONS_EXPIRY_KEY]
+    args = [
+        resumable_identifier,
+        size,
+        step,
+        budget,
+        int(time.time() * 1000),
+        ConfigClass.STAGING_RESERVATION_EXPIRE * 1000,
+    ]
+    return await srv_redis.eval_script(_GROW_SCRIPT, keys, args) == 1
+
+
+async def memory_reserve(reservations: dict, budget: int) -> bool:
+    """reserve {resumable_identifier: bytes} in the memory staging tier like staging_reserve."""
+    return await reserve_bytes([_MEMORY_RESERVATIONS_KEY, _MEMORY_RESERVATIONS_EXPIRY_KEY], reservations, budget)
+
+
+async def staging_release(resumable_identifiers: list):
+    """give back the staging disk and memory reserved by the uploads, once they are finalized or failed."""
+    if not resumable_identifiers:
+        return
+    srv_redis = SrvAioRedisSingleton()
+    for reservations_key, expiry_key in (
+        (_STAGING_RESERVATIONS_KEY, _STAGING_RESERVATIONS_EXPIRY_KEY),
+        (_MEMORY_RESERVATIONS_KEY, _MEMORY_RESERVATIONS_EXPIRY_KEY),
+    ):
+        await srv_redis.hdel_by_key(reservations_key, *resumable_identifiers)
+        await srv_redis.zrem_by_key(expiry_key, *resumable_identifiers)
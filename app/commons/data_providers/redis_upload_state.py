@@ -0,0 +1,484 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import json
+import time
+import uuid
+
+from app.config import ConfigClass
+
+from .redis import SrvAioRedisSingleton
+
+# per upload state which is updated by concurrent chunk requests. It is kept
+# apart from the session job record because that one is read and written as
+# a whole json document.
+_UPLOAD_PARTS_PREFIX = 'uploadparts'
+_UPLOAD_CHUNKS_PREFIX = 'uploadchunks'
+_UPLOAD_FINALIZE_PREFIX = 'uploadfinalize'
+_UPLOAD_TUS_PREFIX = 'uploadtus'
+_UPLOAD_TUS_CLAIM_PREFIX = 'uploadtusclaim'
+_UPLOAD_DIGESTS_PREFIX = 'uploaddigests'
+_UPLOAD_PROGRESS_PREFIX = 'uploadprogress'
+_UPLOAD_MEMORY_PREFIX = 'uploadmemory'
+_UPLOAD_SESSION_STATS_PREFIX = 'uploadsessionstats'
+_UPLOAD_MANIFEST_PREFIX = 'uploadmanifest'
+_UPLOAD_PIPELINE_PREFIX = 'uploadpipeline'
+_UPLOAD_PIPELINE_CLAIM_PREFIX = 'uploadpipelineclaim'
+# a session which sent no chunk for longer is idle, the time does not count in its throughput
+_UPLOAD_SESSION_IDLE_GAP = 60 * 1000
+# keep the finalize claim around for a day, it is left to expire so a job
+# which is already finalized is not finalized again by a late request
+_UPLOAD_FINALIZE_EXPIRE = 24 * 60 * 60
+# a pipeline claim held longer belongs to a request which died
+_UPLOAD_PIPELINE_CLAIM_EXPIRE = 10 * 60
+# a tus append claim held longer belongs to a request which died
+_UPLOAD_TUS_CLAIM_EXPIRE = 60 * 60
+
+# set the chunk bit, record its digest and count the received chunks in one
+# atomic step so exactly one request sees the upload becoming complete. The
+# progress counters are moved in the same step and the progress percentage is
+# written behind into the job record every few chunks or milliseconds, only
+# the progress field of the json record is replaced so the status and payload
+# written by the request handlers are left alone. cjson writes an empty array
+# back as an empty object, the job payload keeps no empty list for that. The
+# chunk is counted in the stats of the session at KEYS[5] as well, when the
+# session is given.
+_SET_CHUNK_SCRIPT = """
+local previous = redis.call('SETBIT', KEYS[1], ARGV[1] - 1, 1)
+if ARGV[2] ~= '' then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+end
+local received = redis.call('BITCOUNT', KEYS[1])
+local now = tonumber(ARGV[5])
+if previous == 0 then
+    redis.call('HINCRBY', KEYS[3], 'bytes_received', ARGV[3])
+    redis.call('HSETNX', KEYS[3], 'started_at', now)
+    redis.call('HSET', KEYS[3], 'updated_at', now)
+end
+local total = tonumber(ARGV[4])
+local flushed_at = tonumber(redis.call('HGET', KEYS[3], 'flushed_at') or 0)
+local flush = received >= total or received % tonumber(ARGV[6]) == 0 or now - flushed_at >= tonumber(ARGV[7])
+if total > 0 and flush then
+    redis.call('HSET', KEYS[3], 'flushed_at', now)
+    local record = redis.call('GET', KEYS[4])
+    if record then
+        local job = cjson.decode(record)
+        job['progress'] = math.floor(math.min(received, total) * 100 / total)
+        redis.call('SET', KEYS[4], cjson.encode(job))
+    end
+end
+if KEYS[5] ~= '' then
+    local last = tonumber(redis.call('HGET', KEYS[5], 'last_at') or 0)
+    if last > 0 and now - last <= tonumber(ARGV[8]) then
+        redis.call('HINCRBY', KEYS[5], 'active_ms', now - last)
+    end
+    redis.call('HSET', KEYS[5], 'last_at', now)
+    redis.call('HINCRBY', KEYS[5], 'bytes', ARGV[3])
+    redis.call('HINCRBY', KEYS[5], 'chunks', 1)
+    redis.call('EXPIRE', KEYS[5], ARGV[9])
+end
+return {previous, received}
+"""
+
+# count the bytes, chunks or errors of a session along the time it was active
+# sending chunks, the gaps between chunks longer than the idle gap excluded
+_RECORD_SESSION_STATS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local last = tonumber(redis.call('HGET', KEYS[1], 'last_at') or 0)
+if last > 0 and now - last <= tonumber(ARGV[4]) then
+    redis.call('HINCRBY', KEYS[1], 'active_ms', now - last)
+end
+redis.call('HSET', KEYS[1], 'last_at', now)
+redis.call('HINCRBY', KEYS[1], 'bytes', ARGV[2])
+redis.call('HINCRBY', KEYS[1], ARGV[3], 1)
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+# move the expire of a pipeline claim or drop a pipeline or tus append claim only for the caller which holds
+# it, a claim which expired and was taken by another request is left alone
+_REFRESH_CLAIM_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_CLAIM_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# create the tus resource of an upload once, a repeated creation keeps the offset
+_CREATE_TUS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'session_id', ARGV[1], 'project_code', ARGV[2], 'operator', ARGV[3], 'offset', 0)
+end
+return tonumber(redis.call('HGET', KEYS[1], 'offset'))
+"""
+
+# move the tus offset forward only if nobody appended at the same offset meanwhile
+_ADVANCE_TUS_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'offset') ~= ARGV[1] then
+    return -1
+end
+return redis.call('HINCRBY', KEYS[1], 'offset', ARGV[2])
+"""
+
+
+def get_upload_parts_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_PARTS_PREFIX, resumable_identifier)
+
+
+def get_upload_chunks_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_CHUNKS_PREFIX, resumable_identifier)
+
+
+def get_upload_finalize_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_FINALIZE_PREFIX, resumable_identifier)
+
+
+def get_upload_tus_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_TUS_PREFIX, resumable_identifier)
+
+
+def get_upload_tus_claim_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_TUS_CLAIM_PREFIX, resumable_identifier)
+
+
+def get_upload_digests_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_DIGESTS_PREFIX, resumable_identifier)
+
+
+def get_upload_progress_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_PROGRESS_PREFIX, resumable_identifier)
+
+
+def get_upload_memory_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_MEMORY_PREFIX, resumable_identifier)
+
+
+def get_upload_manifest_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_MANIFEST_PREFIX, resumable_identifier)
+
+
+def get_upload_pipeline_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_PIPELINE_PREFIX, resumable_identifier)
+
+
+def get_upload_pipeline_claim_key(resumable_identifier: str) -> str:
+    return '{}:{}'.format(_UPLOAD_PIPELINE_CLAIM_PREFIX, resumable_identifier)
+
+
+def get_upload_session_stats_key(session_id: str) -> str:
+    return '{}:{}'.format(_UPLOAD_SESSION_STATS_PREFIX, session_id)
+
+
+async def upload_parts_set(resumable_identifier: str, part_number: int, etag: str):
+    """record the etag of a multipart part uploaded to the object storage."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.hset_by_key(get_upload_parts_key(resumable_identifier), str(part_number), etag)
+
+
+async def upload_parts_get(resumable_identifier: str) -> dict:
+    """return the recorded parts as {part_number: etag}."""
+    srv_redis = SrvAioRedisSingleton()
+    parts = await srv_redis.hgetall_by_key(get_upload_parts_key(resumable_identifier))
+    return {int(part_number): etag.decode('utf-8') for part_number, etag in parts.items()}
+
+
+async def upload_digests_get(resumable_identifier: str) -> dict:
+    """return the recorded digests as {chunk_number: digest}."""
+    srv_redis = SrvAioRedisSingleton()
+    digests = await srv_redis.hgetall_by_key(get_upload_digests_key(resumable_identifier))
+    return {int(chunk_number): digest.decode('utf-8') for chunk_number, digest in digests.items()}
+
+
+async def upload_manifest_set(resumable_identifier: str, manifest: dict):
+    """record the manifest of an upload, the state of the upload that does not change after pre upload."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.set_by_key(get_upload_manifest_key(resumable_identifier), json.dumps(manifest))
+
+
+async def upload_manifest_get(resumable_identifier: str) -> dict:
+    """return the manifest of an upload, empty if it was not recorded."""
+    srv_redis = SrvAioRedisSingleton()
+    manifest = await srv_redis.get_by_key(get_upload_manifest_key(resumable_identifier))
+    return json.loads(manifest) if manifest else {}
+
+
+async def upload_pipeline_get(resumable_identifier: str) -> dict:
+    """return the first chunk and part not forwarded yet by the pipeline of an upload, both 1 before it starts."""
+    srv_redis = SrvAioRedisSingleton()
+    pipeline = await srv_redis.hgetall_by_key(get_upload_pipeline_key(resumable_identifier))
+    return {'next_chunk': int(pipeline.get(b'next_chunk', 1)), 'next_part': int(pipeline.get(b'next_part', 1))}
+
+
+async def upload_pipeline_set(resumable_identifier: str, next_chunk: int, next_part: int):
+    """record the first chunk and part not forwarded yet by the pipeline of an upload."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.hset_by_key(
+        get_upload_pipeline_key(resumable_identifier), mapping={'next_chunk': next_chunk, 'next_part': next_part}
+    )
+
+
+async def upload_pipeline_claim(resumable_identifier: str):
+    """return the token of the claim if the caller is the only one to move the pipeline of the upload, until it
+    releases it, None otherwise."""
+    srv_redis = SrvAioRedisSingleton()
+    claim = uuid.uuid4().hex
+    claimed = await srv_redis.set_by_key_if_absent(
+        get_upload_pipeline_claim_key(resumable_identifier), claim, _UPLOAD_PIPELINE_CLAIM_EXPIRE
+    )
+    return claim if claimed else None
+
+
+async def upload_pipeline_refresh(resumable_identifier: str, claim: str) -> bool:
+    """extend the claim of the pipeline of an upload, return False if the caller does not hold it anymore."""
+    srv_redis = SrvAioRedisSingleton()
+    refreshed = await srv_redis.eval_script(
+        _REFRESH_CLAIM_SCRIPT,
+        [get_upload_pipeline_claim_key(resumable_identifier)],
+        [claim, _UPLOAD_PIPELINE_CLAIM_EXPIRE],
+    )
+    return bool(refreshed)
+
+
+async def upload_pipeline_release(resumable_identifier: str, claim: str):
+    """drop the claim of the pipeline of an upload if the caller still holds it."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.eval_script(_RELEASE_CLAIM_SCRIPT, [get_upload_pipeline_claim_key(resumable_identifier)], [claim])
+
+
+async def upload_memory_chunk_set(resumable_identifier: str, chunk_number: int, data: bytes):
+    """keep the data of a chunk of an upload staged in memory."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.hset_by_key(get_upload_memory_key(resumable_identifier), str(chunk_number), data)
+
+
+async def upload_memory_chunks_get(resumable_identifier: str, total_chunks: int) -> list:
+    """return the data of the chunks of an upload staged in memory in chunk order, None for the missing ones."""
+    srv_redis = SrvAioRedisSingleton()
+    return await srv_redis.hmget_by_key(
+        get_upload_memory_key(resumable_identifier), [str(chunk_number) for chunk_number in range(1, total_chunks + 1)]
+    )
+
+
+async def upload_memory_chunks_delete(resumable_identifier: str):
+    """drop the chunks of an upload staged in memory."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.delete_by_key(get_upload_memory_key(resumable_identifier))
+
+
+async def upload_chunks_set(
+    resumable_identifier: str,
+    chunk_number: int,
+    digest: str = '',
+    chunk_size: int = 0,
+    total_chunks: int = 0,
+    job_key: str = '',
+    session_id: str = '',
+):
+    """mark a chunk as received in the bitmap of the upload, bit N-1 stands for chunk N, with its sha256 digest.
+
+    the chunk_size bytes are added to the progress of the upload and the job record at job_key gets the progress
+    percentage every PROGRESS_FLUSH_CHUNKS chunks or PROGRESS_FLUSH_INTERVAL milliseconds, when total_chunks is
+    known. The chunk is counted in the stats of session_id too, when given, like upload_session_stats_record.
+    Return if the chunk was not received before and the number of chunks received so far.
+    """
+    srv_redis = SrvAioRedisSingleton()
+    previous, received_chunks = await srv_redis.eval_script(
+        _SET_CHUNK_SCRIPT,
+        [
+            get_upload_chunks_key(resumable_identifier),
+            get_upload_digests_key(resumable_identifier),
+            get_upload_progress_key(resumable_identifier),
+            job_key,
+            get_upload_session_stats_key(session_id) if session_id else '',
+        ],
+        [
+            chunk_number,
+            digest,
+            chunk_size,
+            total_chunks or 0,
+            int(time.time() * 1000),
+            ConfigClass.PROGRESS_FLUSH_CHUNKS,
+            ConfigClass.PROGRESS_FLUSH_INTERVAL,
+            _UPLOAD_SESSION_IDLE_GAP,
+            ConfigClass.ADVISOR_STATS_WINDOW,
+        ],
+    )
+    return previous == 0, received_chunks
+
+
+async def upload_chunks_check(resumable_identifier: str, chunk_number: int) -> bool:
+    """return True if the chunk was already received."""
+    srv_redis = SrvAioRedisSingleton()
+    return await srv_redis.getbit_by_key(get_upload_chunks_key(resumable_identifier), chunk_number - 1) == 1
+
+
+async def upload_chunks_get(resumable_identifier: str) -> bytes:
+    """return the raw bitmap of the received chunks."""
+    srv_redis = SrvAioRedisSingleton()
+    bitmap = await srv_redis.get_by_key(get_upload_chunks_key(resumable_identifier))
+    return bitmap if bitmap else b''
+
+
+async def upload_finalize_claim(resumable_identifier: str) -> bool:
+    """return True for the first caller only, so the upload is finalized once."""
+    srv_redis = SrvAioRedisSingleton()
+    claimed = await srv_redis.set_by_key_if_absent(
+        get_upload_finalize_key(resumable_identifier), '1', _UPLOAD_FINALIZE_EXPIRE
+    )
+    return bool(claimed)
+
+
+async def upload_tus_create(resumable_identifier: str, session_id: str, project_code: str, operator: str) -> int:
+    """create the tus resource of an upload if it does not exist yet, return its offset."""
+    srv_redis = SrvAioRedisSingleton()
+    return await srv_redis.eval_script(
+        _CREATE_TUS_SCRIPT, [get_upload_tus_key(resumable_identifier)], [session_id, project_code, operator]
+    )
+
+
+async def upload_tus_get(resumable_identifier: str) -> dict:
+    """return the tus resource of an upload as {field: value}, empty if it was not created."""
+    srv_redis = SrvAioRedisSingleton()
+    resource = await srv_redis.hgetall_by_key(get_upload_tus_key(resumable_identifier))
+    return {field.decode('utf-8'): value.decode('utf-8') for field, value in resource.items()}
+
+
+async def upload_tus_advance(resumable_identifier: str, offset: int, length: int) -> int:
+    """move the offset of the tus resource from offset by length bytes.
+
+    return the new offset, or -1 when the offset of the resource is not offset anymore.
+    """
+    srv_redis = SrvAioRedisSingleton()
+    return await srv_redis.eval_script(
+        _ADVANCE_TUS_SCRIPT, [get_upload_tus_key(resumable_identifier)], [offset, length]
+    )
+
+
+async def upload_tus_claim(resumable_identifier: str):
+    """return the token of the claim if the caller is the only one to append to the tus resource of the upload,
+    until it releases it, None otherwise."""
+    srv_redis = SrvAioRedisSingleton()
+    claim = uuid.uuid4().hex
+    claimed = await srv_redis.set_by_key_if_absent(
+        get_upload_tus_claim_key(resumable_identifier), claim, _UPLOAD_TUS_CLAIM_EXPIRE
+    )
+    return claim if claimed else None
+
+
+async def upload_tus_release(resumable_identifier: str, claim: str):
+    """drop the append claim of the tus resource of an upload if the caller still holds it."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.eval_script(_RELEASE_CLAIM_SCRIPT, [get_upload_tus_claim_key(resumable_identifier)], [claim])
+
+
+async def upload_session_stats_record(session_id: str, chunk_size: int, failed: bool = False):
+    """count a chunk saved, or failed, by a session for the chunk size advice."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.eval_script(
+        _RECORD_SESSION_STATS_SCRIPT,
+        [get_upload_session_stats_key(session_id)],
+        [
+            int(time.time() * 1000),
+            chunk_size,
+            'errors' if failed else 'chunks',
+            _UPLOAD_SESSION_IDLE_GAP,
+            ConfigClass.ADVISOR_STATS_WINDOW,
+        ],
+    )
+
+
+async def upload_session_stats_get(session_id: str) -> dict:
+    """return the stats of a session as {field: value}, empty when it sent no chunk lately."""
+    srv_redis = SrvAioRedisSingleton()
+    stats = await srv_redis.hgetall_by_key(get_upload_session_stats_key(session_id))
+    return {field.decode('utf-8'): value.decode('utf-8') for field, value in stats.items()}
+
+
+async def upload_progress_set_stage(resumable_identifier: str, stage: str, done: int, total: int):
+    """record how far the finalize stage of an upload went, in done out of total steps."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.hset_by_key(
+        get_upload_progress_key(resumable_identifier),
+        mapping={'stage': stage, 'stage_done': done, 'stage_total': total, 'updated_at': int(time.time() * 1000)},
+    )
+
+
+async def upload_progress_set_signed(resumable_identifier: str):
+    """record when the part urls of a PRESIGNED upload were last signed, its parts never go through the service."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.hset_by_key(
+        get_upload_progress_key(resumable_identifier), mapping={'signed_at': int(time.time() * 1000)}
+    )
+
+
+async def upload_progress_get_many(resumable_identifiers: list) -> list:
+    """return the raw progress of every upload as {field: value}, empty for the uploads without progress."""
+    srv_redis = SrvAioRedisSingleton()
+    progresses = await srv_redis.hgetall_many(
+        [get_upload_progress_key(resumable_identifier) for resumable_identifier in resumable_identifiers]
+    )
+    return [{field.decode('utf-8'): value.decode('utf-8') for field, value in p.items()} for p in progresses]
+
+
+def get_upload_progress(raw_progress: dict, total_size: int = None) -> dict:
+    """return the progress of an upload with its throughput in bytes per second and its eta in seconds."""
+    bytes_received = int(raw_progress.get('bytes_received', 0))
+    progress = {'bytes_received': bytes_received, 'throughput': None, 'eta': None}
+    elapsed = (int(raw_progress.get('updated_at', 0)) - int(raw_progress.get('started_at', 0))) / 1000
+    if bytes_received and elapsed > 0:
+        progress['throughput'] = round(bytes_received / elapsed)
+        if total_size:
+            progress['eta'] = max(round((total_size - bytes_received) / progress['throughput'], 1), 0)
+    if 'stage' in raw_progress:
+        stage_total = int(raw_progress['stage_total'])
+        progress['stage'] = raw_progress['stage']
+        progress['stage_progress'] = int(int(raw_progress['stage_done']) * 100 / stage_total) if stage_total else 0
+    return progress
+
+
+def get_missing_chunks(bitmap: bytes, total_chunks: int) -> list:
+    """return the numbers of the chunks which are not set in the bitmap."""
+    missing_chunks = []
+    for chunk_number in range(1, total_chunks + 1):
+        byte_index, bit_index = divmod(chunk_number - 1, 8)
+        if byte_index >= len(bitmap) or not bitmap[byte_index] & (0x80 >> bit_index):
+            missing_chunks.append(chunk_number)
+    return missing_chunks
+
+
+async def upload_state_delete(resumable_identifier: str):
+    """remove all the per upload state once the job is done, but the finalize claim which expires by itself."""
+    srv_redis = SrvAioRedisSingleton()
+    await srv_redis.delete_by_key(get_upload_parts_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_chunks_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_tus_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_tus_claim_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_digests_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_progress_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_memory_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_manifest_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_pipeline_key(resumable_identifier))
+    await srv_redis.delete_by_key(get_upload_pipeline_claim_key(resumable_identifier))
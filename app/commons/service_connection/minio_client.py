@@ -18,14 +18,65 @@
 # permissions and limitations under the Licence.
 # 
 
+from datetime import timedelta
+
 import httpx
 from minio import Minio
 from minio.credentials.providers import ClientGrantsProvider
+from minio.datatypes import Part
 
 from app.config import ConfigClass
 
 
-class Minio_Client_:
+class MultipartUploadMixin:
+    """S3 multipart upload calls of the minio client in self.client."""
+
+    # the chunks of a MULTIPART upload are forwarded to minio as the parts
+    # of a S3 multipart upload while they are received, large objects are
+    # uploaded the same way when the upload is finalized
+    def create_multipart_upload(self, bucket: str, obj_path: str) -> str:
+        """start a multipart upload and return its upload id."""
+        return self.client._create_multipart_upload(bucket, obj_path, {})
+
+    def upload_part(self, bucket: str, obj_path: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """upload one part and return its etag."""
+        return self.client._upload_part(bucket, obj_path, data, {}, upload_id, part_number)
+
+    def complete_multipart_upload(self, bucket: str, obj_path: str, upload_id: str, parts: dict):
+        """assemble the object from the {part_number: etag} parts."""
+        parts = [Part(part_number, etag) for part_number, etag in sorted(parts.items())]
+        return self.client._complete_multipart_upload(bucket, obj_path, upload_id, parts)
+
+    def list_parts(self, bucket: str, obj_path: str, upload_id: str) -> dict:
+        """return the parts already uploaded as {part_number: etag}."""
+        parts = {}
+        part_number_marker = None
+        while True:
+            result = self.client._list_parts(bucket, obj_path, upload_id, part_number_marker=part_number_marker)
+            for part in result.parts:
+                parts[int(part.part_number)] = part.etag
+            if not result.is_truncated:
+                return parts
+            part_number_marker = result.next_part_number_marker
+
+    def presigned_upload_part_url(
+        self, bucket: str, obj_path: str, upload_id: str, part_number: int, expires: timedelta
+    ) -> str:
+        """return an url the client can PUT the part to without going through the service."""
+        return self.client.get_presigned_url(
+            'PUT',
+            bucket,
+            obj_path,
+            expires=expires,
+            extra_query_params={'uploadId': upload_id, 'partNumber': str(part_number)},
+        )
+
+    def abort_multipart_upload(self, bucket: str, obj_path: str, upload_id: str):
+        """drop a multipart upload and the parts already uploaded."""
+        self.client._abort_multipart_upload(bucket, obj_path, upload_id)
+
+
+class Minio_Client_(MultipartUploadMixin):
     def __init__(self, access_token, refresh_token):
         # preset the tokens for refreshing
         self.access_token = access_token
@@ -81,7 +132,7 @@ class Minio_Client_:
         return provider
 
 
-class Minio_Client:
+class Minio_Client(MultipartUploadMixin):
     def __init__(self):
 
         # Temperary use the credential
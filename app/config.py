@@ -72,6 +72,71 @@ class Settings(BaseSettings):
     KEYCLOAK_URL: str
     MINIO_ACCESS_KEY: str
     MINIO_SECRET_KEY: str
+    # lifetime in seconds of the presigned part upload urls
+    MINIO_PRESIGNED_URL_EXPIRY: int = 3600
+    # files up to this size in bytes can skip the upload job with POST /v1/files/small
+    SMALL_FILE_MAX_SIZE: int = 1024 * 1024
+    # the upload progress is written into the job record every N chunks or N milliseconds
+    PROGRESS_FLUSH_CHUNKS: int = 10
+    PROGRESS_FLUSH_INTERVAL: int = 1000
+    # a compressed chunk decompresses to the total size of its upload at most, or twice its chunk size, or N bytes
+    # when the upload knows neither
+    CHUNK_MAX_DECODED_SIZE: int = 256 * 1024 * 1024
+    # share of the staging disk the uploads can reserve, a pre-upload over it is asked to retry after N seconds
+    STAGING_DISK_RATIO: float = 0.9
+    STAGING_RETRY_AFTER: int = 30
+    # the reservation of an upload which is neither finalized nor failed is dropped after N seconds
+    STAGING_RESERVATION_EXPIRE: int = 24 * 60 * 60
+    # an upload which does not tell its total size reserves N bytes, its reservation grows by as much whenever its
+    # chunks go past it
+    STAGING_DEFAULT_RESERVATION: int = 16 * 1024 * 1024
+    # comma separated directories to stage the uploads on (TEMP_BASE when empty), picked by hash or free_space,
+    # every upload directory is nested under STAGING_SHARD_LEVELS levels of hash prefixes
+    STAGING_VOLUMES: str = ''
+    STAGING_VOLUME_POLICY: str = 'hash'
+    STAGING_SHARD_LEVELS: int = 2
+    # the chunks of the files up to N bytes are kept in redis, shared by all the workers, instead of the staging disk
+    # as long as they fit in the global budget of bytes, 0 disables the memory tier
+    MEMORY_STAGING_MAX_SIZE: int = 4 * 1024 * 1024
+    MEMORY_STAGING_BUDGET: int = 256 * 1024 * 1024
+    # the chunk size advice aims at chunks of N seconds at the throughput of the session, within the size bounds.
+    # The throughput and error rate of a session are forgotten N seconds after its last chunk
+    ADVISOR_TARGET_CHUNK_SECONDS: int = 5
+    ADVISOR_MIN_CHUNK_SIZE: int = 1024 * 1024
+    ADVISOR_MAX_CHUNK_SIZE: int = 64 * 1024 * 1024
+    ADVISOR_MAX_PARALLELISM: int = 4
+    ADVISOR_STATS_WINDOW: int = 15 * 60
+    # every N seconds one instance terminates the uploads inactive for STAGING_GC_TTL seconds and drops their
+    # staging data, the job records of the finished uploads are dropped as old
+    STAGING_GC_INTERVAL: int = 10 * 60
+    STAGING_GC_TTL: int = 24 * 60 * 60
+    # every instance keeps the manifests of the last N uploads it served in memory, redis keeps all of them
+    MANIFEST_CACHE_SIZE: int = 10000
+    # threads of the executors for the staging disk, the sync http calls and the cpu bound work
+    EXECUTOR_DISK_WORKERS: int = 32
+    EXECUTOR_HTTP_WORKERS: int = 16
+    EXECUTOR_CPU_WORKERS: int = 4
+    # the finalize requests go to a redis stream processed by `python -m app.worker` instead of running in the api
+    # process. A worker runs N finalizes at once, the finalize of a worker silent for FINALIZE_QUEUE_CLAIM_IDLE
+    # seconds is taken over by another one, up to FINALIZE_QUEUE_MAX_DELIVERIES times
+    FINALIZE_QUEUE_ENABLED: bool = False
+    FINALIZE_WORKER_CONCURRENCY: int = 4
+    FINALIZE_QUEUE_CLAIM_IDLE: int = 5 * 60
+    FINALIZE_QUEUE_MAX_DELIVERIES: int = 3
+    # the chunks are streamed to minio in order instead of being merged into a file first, zip files are still merged
+    # for their archive preview
+    FINALIZE_STREAM_CHUNKS: bool = False
+    # objects over FINALIZE_MULTIPART_THRESHOLD bytes are uploaded to minio as multipart parts of FINALIZE_PART_SIZE
+    # bytes at least, or larger to stay under the S3 part count. A finalize uploads N parts at once and retries a
+    # failed part N times
+    FINALIZE_MULTIPART_THRESHOLD: int = 64 * 1024 * 1024
+    FINALIZE_PART_SIZE: int = 16 * 1024 * 1024
+    FINALIZE_UPLOAD_CONCURRENCY: int = 4
+    FINALIZE_PART_RETRIES: int = 3
+    # the received chunks of a CHUNKS upload which follow each other from the first one are forwarded to minio as
+    # multipart parts while the later chunks are still sent, the finalize only forwards the tail. The total size and
+    # chunks of the file are needed at pre upload, zip files are not pipelined for their archive preview
+    FINALIZE_PIPELINE_ENABLED: bool = False
 
     # Redis Service
     REDIS_HOST: str
@@ -20,6 +20,7 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi_utils.tasks import repeat_every
 from opentelemetry import trace
 from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 from opentelemetry.instrumentation.asyncpg import AsyncPGInstrumentor
@@ -31,7 +32,10 @@ from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
 from app.api_registry import api_registry
+from app.commons.logger_services.logger_factory_service import SrvLoggerFactory
 from app.config import ConfigClass
+from app.resources.executors import shutdown_executors
+from app.resources.staging_gc import sweep_staging
 
 
 def create_app():
@@ -58,9 +62,26 @@ def create_app():
 
     instrument_app(app)
 
+    start_staging_sweeper(app)
+
+    app.add_event_handler('shutdown', shutdown_executors)
+
     return app
 
 
+def start_staging_sweeper(app: FastAPI) -> None:
+    """Sweep the abandoned uploads periodically, one instance at a time."""
+
+    logger = SrvLoggerFactory('staging_gc').get_logger()
+
+    @app.on_event('startup')
+    @repeat_every(seconds=ConfigClass.STAGING_GC_INTERVAL, wait_first=True, logger=logger)
+    async def sweep_staging_periodically() -> None:
+        stats = await sweep_staging(logger)
+        if stats:
+            logger.info('Staging sweep done: {}'.format(stats))
+
+
 def instrument_app(app: FastAPI) -> None:
     """Instrument the application with OpenTelemetry tracing."""
 
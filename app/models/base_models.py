@@ -33,6 +33,10 @@ class EAPIResponseCode(Enum):
     forbidden = 403
     unauthorized = 401
     conflict = 409
+    precondition_failed = 412
+    payload_too_large = 413
+    unsupported_media_type = 415
+    service_unavailable = 503
 
 
 class APIResponse(BaseModel):
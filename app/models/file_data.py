@@ -49,6 +49,7 @@ class SrvFileDataMgr:
         from_parents=None,
         process_pipeline=None,
         parent_folder_geid=None,
+        merkle_root=None,
     ):
         """Create File Data Entity V2."""
         url = self.base_url + 'filedata/'
@@ -75,6 +76,8 @@ class SrvFileDataMgr:
             post_json_form['operator'] = operator
         if from_parents:
             post_json_form['parent_query'] = from_parents
+        if merkle_root:
+            post_json_form['merkle_root'] = merkle_root
         with httpx.Client() as client:
             res = client.post(url=url, json=post_json_form)
         self.logger.debug('SrvFileDataMgr create results: ' + res.text)
@@ -51,3 +51,9 @@ async def get_fsm_object(*args):
     if fms_object.job_id:
         await fms_object.read()
     return fms_object
+
+
+async def get_fsm_object_by_key(job_key: str):
+    fms_object = FsmMgrUpload(None, None, None, None)
+    await fms_object.read_by_key(job_key)
+    return fms_object
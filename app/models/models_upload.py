@@ -33,10 +33,30 @@ class EUploadJobType(Enum):
     AS_FILE = 'AS_FILE'
 
 
+class EUploadMode(Enum):
+    """How the chunks of an upload job are staged before finalize."""
+
+    # every chunk is saved as its own part file and merged at finalize
+    CHUNKS = 'CHUNKS'
+    # chunks are written in place into one sparse target file
+    PREALLOCATED = 'PREALLOCATED'
+    # chunks are forwarded to minio as the parts of a multipart upload
+    MULTIPART = 'MULTIPART'
+    # the client uploads the parts to minio itself with presigned urls
+    PRESIGNED = 'PRESIGNED'
+    # the client appends to one target file with the tus protocol
+    TUS = 'TUS'
+
+
 class SingleFileForm(BaseModel):
     resumable_filename: str
     resumable_relative_path: str = ''
     dcm_id: str = 'undefined'
+    # required by the PREALLOCATED, MULTIPART and PRESIGNED upload modes, TUS only needs the total size
+    resumable_total_size: int = None
+    resumable_chunk_size: int = None
+    # required by auto finalize
+    resumable_total_chunks: int = None
 
 
 class PreUploadPOST(BaseModel):
@@ -45,12 +65,19 @@ class PreUploadPOST(BaseModel):
     project_code: str
     operator: str
     job_type: str = 'AS_FOLDER | AS_FILE'
+    upload_mode: str = EUploadMode.CHUNKS.name
     folder_tags: List[str] = []
     data: List[SingleFileForm]
     upload_message = ''
     current_folder_node = ''
     incremental = False
     # do_conflict_check = True
+    # finalize the files as soon as their last chunk is received
+    # with the values POST /files would otherwise send
+    auto_finalize = False
+    tags: List[str] = []
+    process_pipeline: str = None
+    from_parents: list = None
 
 
 class PreUploadResponse(APIResponse):
@@ -174,6 +201,132 @@ class ChunkUploadResponse(APIResponse):
     result: dict = Field({}, example={'msg': 'Succeed'})
 
 
+class ChunkAdviceResponse(APIResponse):
+    """Chunk size advice response class."""
+
+    result: dict = Field(
+        {},
+        example={
+            'chunk_size': 8388608,
+            'total_chunks': 12,
+            'parallelism': 4,
+            'throughput': 6710886,
+            'error_rate': 0.0,
+        },
+    )
+
+
+class ChunkBatchUploadResponse(APIResponse):
+    """Batch chunk upload response class."""
+
+    result: list = Field(
+        [],
+        example=[
+            {
+                'resumable_identifier': '1bfe8fd8-8b41-11eb-a8bd-eaff9e667817-1616439732',
+                'resumable_chunk_number': 1,
+                'result': {'msg': 'Succeed'},
+                'code': 200,
+            },
+            {
+                'resumable_identifier': '1bfe8fd8-8b41-11eb-a8bd-eaff9e667817-1616439733',
+                'resumable_chunk_number': 1,
+                'code': 500,
+                'error_msg': '[SessionJob] Not found job: 1bfe8fd8-8b41-11eb-a8bd-eaff9e667817-1616439733',
+            },
+        ],
+    )
+
+
+class ChunkStatusResponse(APIResponse):
+    """Chunk existence probe response class."""
+
+    result: dict = Field(
+        {},
+        example={
+            'resumable_identifier': '1bfe8fd8-8b41-11eb-a8bd-eaff9e667817-1616439732',
+            'resumable_chunk_number': 3,
+            'received': True,
+        },
+    )
+
+
+class ChunkBitmapResponse(APIResponse):
+    """Received chunks bitmap response class."""
+
+    result: dict = Field(
+        {},
+        example={
+            'resumable_identifier': '1bfe8fd8-8b41-11eb-a8bd-eaff9e667817-1616439732',
+            'bitmap': '4A==',
+            'received_chunks': 3,
+            'missing_chunks': [4, 5],
+        },
+    )
+
+
+class PresignedPartsResponse(APIResponse):
+    """Presigned part urls response class."""
+
+    result: dict = Field(
+        {},
+        example={
+            'resumable_identifier': '1bfe8fd8-8b41-11eb-a8bd-eaff9e667817-1616439732',
+            'upload_id': 'ZDk1NjM0ZmEtMGVhMy00ZDc0LTk0NmMtZTBhYzZi',
+            'expires_in': 3600,
+            'parts': [
+                {
+                    'part_number': 1,
+                    'url': 'http://minio/core-gregtest/file1.png?uploadId=ZDk1NjM0ZmEtMGVhMy00ZDc0LTk0NmMtZTBhYzZi'
+                    '&partNumber=1&X-Amz-Algorithm=AWS4-HMAC-SHA256&X-Amz-Signature=...',
+                },
+            ],
+        },
+    )
+
+
+class SmallFileUploadResponse(APIResponse):
+    """Small file upload response class."""
+
+    result: dict = Field(
+        {},
+        example={
+            'global_entity_id': '1bfe8fd8-8b41-11eb-a8bd-eaff9e667817-1616439732',
+            'name': 'file_name.txt',
+            'file_size': 10240,
+            'project_code': 'gregtest',
+            'operator': 'admin',
+        },
+    )
+
+
+class StagingSweepResponse(APIResponse):
+    """Staging sweeper counters response class."""
+
+    result: dict = Field(
+        {},
+        example={'reclaimed_bytes': 10485760, 'reclaimed_jobs': 2, 'dropped_records': 15, 'sweeps': 144},
+    )
+
+
+class ExecutorStatsResponse(APIResponse):
+    """Executors stats response class."""
+
+    result: dict = Field(
+        {},
+        example={
+            'disk': {
+                'max_workers': 32,
+                'queued': 0,
+                'active': 3,
+                'completed': 1520,
+                'avg_wait_ms': 0.042,
+                'max_wait_ms': 12.5,
+            }
+        },
+    )
+
+
 class OnSuccessUploadPOST(BaseModel):
     """merge chunks payload model."""
 
@@ -190,6 +343,8 @@ class OnSuccessUploadPOST(BaseModel):
     process_pipeline: str = None
     from_parents: list = None
     upload_message = ''
+    # optional merkle root of the sha256 digests of the chunks, checked before finalize
+    merkle_root: str = None
 
 
 class GETJobStatusResponse(APIResponse):
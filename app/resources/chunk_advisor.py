@@ -0,0 +1,66 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+from app.config import ConfigClass
+from app.models.models_upload import EUploadMode
+
+_MIB = 1024 * 1024
+# chunk size recommended before the throughput of the session is measured
+_DEFAULT_CHUNK_SIZE = 8 * _MIB
+# minio refuses the multipart parts under 5 MiB, the last one apart
+_MULTIPART_MIN_PART_SIZE = 5 * _MIB
+# every step of this error rate halves the chunk size and the parallelism
+_ERROR_RATE_STEP = 0.05
+
+
+def get_session_rates(raw_stats: dict):
+    """return the throughput of a session in bytes per second, None until it is measured, and its error rate."""
+    chunks = int(raw_stats.get('chunks', 0))
+    errors = int(raw_stats.get('errors', 0))
+    active_ms = int(raw_stats.get('active_ms', 0))
+    throughput = round(int(raw_stats.get('bytes', 0)) * 1000 / active_ms) if active_ms else None
+    error_rate = errors / (chunks + errors) if chunks + errors else 0.0
+    return throughput, error_rate
+
+
+def recommend_chunking(total_size: int, upload_mode: str, throughput: int = None, error_rate: float = 0.0) -> dict:
+    """return the chunk size, the number of chunks and the parallel requests recommended to upload total_size bytes.
+
+    a chunk should take about ADVISOR_TARGET_CHUNK_SECONDS at the throughput measured for the session, shared by the
+    parallel requests: shorter chunks pay the request overhead more often, longer ones cost more to send again.
+    The failed chunks of the session make the chunks smaller and the requests fewer.
+    """
+    parallelism = ConfigClass.ADVISOR_MAX_PARALLELISM
+    chunk_size = _DEFAULT_CHUNK_SIZE
+    if throughput:
+        chunk_size = throughput * ConfigClass.ADVISOR_TARGET_CHUNK_SECONDS // parallelism
+    halvings = int(error_rate / _ERROR_RATE_STEP)
+    chunk_size >>= halvings
+    parallelism = max(parallelism >> halvings, 1)
+
+    min_chunk_size = ConfigClass.ADVISOR_MIN_CHUNK_SIZE
+    if upload_mode in (EUploadMode.MULTIPART.name, EUploadMode.PRESIGNED.name):
+        min_chunk_size = max(min_chunk_size, _MULTIPART_MIN_PART_SIZE)
+    chunk_size = min(max(chunk_size, min_chunk_size), ConfigClass.ADVISOR_MAX_CHUNK_SIZE)
+    # whole MiB, a single chunk for the files smaller than that
+    chunk_size = min(max(chunk_size // _MIB, 1) * _MIB, max(total_size, 1))
+    # resumable.js lets the last chunk absorb the remainder
+    total_chunks = max(total_size // chunk_size, 1)
+    return {'chunk_size': chunk_size, 'total_chunks': total_chunks, 'parallelism': min(parallelism, total_chunks)}
@@ -22,6 +22,8 @@ import enum
 from functools import wraps
 
 from fastapi import HTTPException
+from fastapi import WebSocket
+from fastapi import status
 from httpx import Response
 
 from app.commons.logger_services.logger_factory_service import SrvLoggerFactory
@@ -65,6 +67,34 @@ def catch_internal(api_namespace):
     return decorator
 
 
+def catch_internal_ws(api_namespace):
+    """decorator to catch internal server error of a websocket endpoint.
+
+    the client gets the error as a json message before the channel is closed with the internal error code.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as exce:
+                err = api_namespace + ' ' + str(exce)
+                err_msg = customized_error_template(ECustomizedError.INTERNAL) % err
+                _logger.error(err_msg)
+                websocket = next(arg for arg in list(args) + list(kwargs.values()) if isinstance(arg, WebSocket))
+                try:
+                    await websocket.send_json({'code': EAPIResponseCode.internal_error.value, 'error_msg': err_msg})
+                    await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+                except Exception as close_error:
+                    # the client may be gone already
+                    _logger.info('Websocket close error: ' + str(close_error))
+
+        return inner
+
+    return decorator
+
+
 class ECustomizedError(enum.Enum):
     """Enum of customized errors."""
 
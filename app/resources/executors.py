@@ -0,0 +1,123 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import ConfigClass
+
+# the blocking work is split by kind so a slow kind can not starve the others of threads.
+# Pure computations which take microseconds, like os.path.join, run on the event loop.
+EXECUTOR_DISK = 'disk'
+EXECUTOR_HTTP = 'http'
+EXECUTOR_CPU = 'cpu'
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class InstrumentedExecutor:
+    """bounded thread pool of one kind of blocking work, which keeps its queue depth and wait time."""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='{}-executor'.format(name))
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _call(self, submitted_at: float, func):
+        waited = time.monotonic() - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, func, *args, **kwargs):
+        """run func in the pool with the context of the caller, like starlette run_in_threadpool."""
+        call = functools.partial(contextvars.copy_context().run, functools.partial(func, *args, **kwargs))
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._pool, self._call, time.monotonic(), call)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            started = self.active + self.completed
+            return {
+                'max_workers': self.max_workers,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'avg_wait_ms': round(self.total_wait * 1000 / started, 3) if started else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+def get_executor(name: str) -> InstrumentedExecutor:
+    """return the executor of a kind of work, created on first use with its configured size."""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                max_workers = {
+                    EXECUTOR_DISK: ConfigClass.EXECUTOR_DISK_WORKERS,
+                    EXECUTOR_HTTP: ConfigClass.EXECUTOR_HTTP_WORKERS,
+                    EXECUTOR_CPU: ConfigClass.EXECUTOR_CPU_WORKERS,
+                }[name]
+                executor = _executors[name] = InstrumentedExecutor(name, max_workers)
+    return executor
+
+
+async def run_in_executor(name: str, func, *args, **kwargs):
+    """run a blocking function in the executor of its kind of work."""
+    return await get_executor(name).run(func, *args, **kwargs)
+
+
+def get_executor_stats() -> dict:
+    """return the stats of the executors created so far as {name: stats}."""
+    return {name: executor.get_stats() for name, executor in _executors.items()}
+
+
+def shutdown_executors():
+    """wait for the running work and stop all the executors."""
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown()
+        _executors.clear()
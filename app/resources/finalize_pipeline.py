@@ -0,0 +1,170 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import asyncio
+import os
+import time
+
+from app.commons.data_providers import get_missing_chunks
+from app.commons.data_providers import upload_chunks_get
+from app.commons.data_providers import upload_parts_set
+from app.commons.data_providers import upload_pipeline_claim
+from app.commons.data_providers import upload_pipeline_get
+from app.commons.data_providers import upload_pipeline_refresh
+from app.commons.data_providers import upload_pipeline_release
+from app.commons.data_providers import upload_pipeline_set
+from app.commons.data_providers import upload_progress_set_stage
+from app.commons.service_connection.minio_client import Minio_Client_
+from app.resources.executors import EXECUTOR_DISK
+from app.resources.executors import EXECUTOR_HTTP
+from app.resources.executors import run_in_executor
+from app.resources.object_upload import get_part_size
+from app.resources.object_upload import upload_part
+from app.resources.staging import generate_chunk_name
+from app.resources.staging import get_staging_dir
+
+# seconds the finalize waits between two tries to claim a pipeline busy with a chunk request
+_CLAIM_RETRY_DELAY = 0.1
+# seconds the finalize waits for the claim at most, a live pipeline refreshes its claim on each part and the claim
+# of a request which died expires before
+_CLAIM_TIMEOUT = 15 * 60
+
+
+def read_chunks(chunk_paths: list) -> bytes:
+    data = bytearray()
+    for chunk_path in chunk_paths:
+        with open(chunk_path, 'rb') as chunk_file:
+            data += chunk_file.read()
+    return bytes(data)
+
+
+def remove_chunks(chunk_paths: list):
+    for chunk_path in chunk_paths:
+        os.unlink(chunk_path)
+
+
+async def advance_pipeline(
+    logger,
+    job_payload: dict,
+    resumable_filename: str,
+    total_chunks: int,
+    access_token: str,
+    refresh_token: str,
+    claim: str,
+    final=False,
+) -> dict:
+    """forward the received chunks which follow the last forwarded one to the multipart upload of the job.
+
+    the chunks are gathered into parts of get_part_size bytes at least and removed once their part is recorded, the
+    shorter last part is only sent when final is set, the finalize stage progress then follows the chunks forwarded.
+    The parts are written with the minio credentials of the user. Return the pipeline position, see
+    upload_pipeline_get. The caller holds the claim of the pipeline, it is
+    extended before each part and the step stops if it was lost.
+    """
+    resumable_identifier = job_payload['resumable_identifier']
+    temp_dir = get_staging_dir(resumable_identifier, job_payload)
+    part_size = get_part_size(job_payload['total_size'])
+    position = await upload_pipeline_get(resumable_identifier)
+    missing_chunks = get_missing_chunks(await upload_chunks_get(resumable_identifier), total_chunks)
+    last_chunk = min([x for x in missing_chunks if x >= position['next_chunk']], default=total_chunks + 1) - 1
+    mc = None
+    chunk_paths = []
+    size = 0
+    for chunk_number in range(position['next_chunk'], last_chunk + 1):
+        chunk_paths.append(os.path.join(temp_dir, generate_chunk_name(resumable_filename, chunk_number)))
+        size += await run_in_executor(EXECUTOR_DISK, os.path.getsize, chunk_paths[-1])
+        if size < part_size and not (final and chunk_number == total_chunks):
+            continue
+        if not await upload_pipeline_refresh(resumable_identifier, claim):
+            raise Exception('pipeline of {} was claimed by another request'.format(resumable_identifier))
+        data = await run_in_executor(EXECUTOR_DISK, read_chunks, chunk_paths)
+        if mc is None:
+            mc = await run_in_executor(EXECUTOR_HTTP, Minio_Client_, access_token, refresh_token)
+        etag = await upload_part(
+            logger,
+            mc,
+            job_payload['bucket'],
+            job_payload['object_path'],
+            job_payload['upload_id'],
+            position['next_part'],
+            data,
+        )
+        # the chunks are only removed once the part is recorded so a failed step can be run again
+        await upload_parts_set(resumable_identifier, position['next_part'], etag)
+        position = {'next_chunk': chunk_number + 1, 'next_part': position['next_part'] + 1}
+        await upload_pipeline_set(resumable_identifier, **position)
+        await run_in_executor(EXECUTOR_DISK, remove_chunks, chunk_paths)
+        if final:
+            await upload_progress_set_stage(resumable_identifier, 'uploading', chunk_number, total_chunks)
+        chunk_paths = []
+        size = 0
+    return position
+
+
+async def run_pipeline(
+    logger, job_payload: dict, resumable_filename: str, total_chunks: int, access_token: str, refresh_token: str
+):
+    """move the pipeline of the job forward after a chunk was received, unless another request already does it.
+
+    the pipeline keeps going while chunks arrive during its uploads, those requests could not claim it. A failed
+    step leaves its chunks staged for the next chunk request or the finalize.
+    """
+    resumable_identifier = job_payload['resumable_identifier']
+    claim = await upload_pipeline_claim(resumable_identifier)
+    if not claim:
+        return
+    try:
+        position = None
+        while True:
+            next_position = await advance_pipeline(
+                logger, job_payload, resumable_filename, total_chunks, access_token, refresh_token, claim
+            )
+            if next_position == position:
+                break
+            position = next_position
+    except Exception as exce:
+        logger.error('Pipeline of {} failed: {}'.format(resumable_identifier, str(exce)))
+    finally:
+        await upload_pipeline_release(resumable_identifier, claim)
+
+
+async def finish_pipeline(
+    logger, job_payload: dict, resumable_filename: str, total_chunks: int, access_token: str, refresh_token: str
+) -> int:
+    """forward the chunks left once all of them are received, return the number of parts of the upload."""
+    resumable_identifier = job_payload['resumable_identifier']
+    deadline = time.monotonic() + _CLAIM_TIMEOUT
+    claim = await upload_pipeline_claim(resumable_identifier)
+    while not claim:
+        if time.monotonic() >= deadline:
+            raise Exception(
+                'pipeline of {} is still claimed after {} seconds'.format(resumable_identifier, _CLAIM_TIMEOUT)
+            )
+        await asyncio.sleep(_CLAIM_RETRY_DELAY)
+        claim = await upload_pipeline_claim(resumable_identifier)
+    try:
+        position = await advance_pipeline(
+            logger, job_payload, resumable_filename, total_chunks, access_token, refresh_token, claim, final=True
+        )
+    finally:
+        await upload_pipeline_release(resumable_identifier, claim)
+    if position['next_chunk'] <= total_chunks:
+        raise Exception('chunk {} was not forwarded to minio'.format(position['next_chunk']))
+    return position['next_part'] - 1
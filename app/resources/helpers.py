@@ -23,12 +23,13 @@ import os
 from zipfile import ZipFile
 
 import httpx
-from starlette.concurrency import run_in_threadpool
 
 from app.commons.data_providers.redis import SrvAioRedisSingleton
 from app.config import ConfigClass
 
 from .error_handler import internal_jsonrespon_handler
+from .executors import EXECUTOR_HTTP
+from .executors import run_in_executor
 
 
 def generate_archive_preview(file_path, file_type='zip'):
@@ -64,7 +65,7 @@ async def async_get_geid():
 
     as soon the service is full async this should be deleted.
     """
-    return await run_in_threadpool(get_geid)
+    return await run_in_executor(EXECUTOR_HTTP, get_geid)
 
 
 def get_geid():
@@ -19,17 +19,18 @@
 # 
 
 import httpx
-from starlette.concurrency import run_in_threadpool
 
 from app.config import ConfigClass
+from app.resources.executors import EXECUTOR_HTTP
+from app.resources.executors import run_in_executor
 
 
 async def async_lock_resource(resource_key: str, operation: str) -> dict:
-    return await run_in_threadpool(lock_resource, resource_key, operation)
+    return await run_in_executor(EXECUTOR_HTTP, lock_resource, resource_key, operation)
 
 
 async def async_unlock_resource(resource_key: str, operation: str) -> dict:
-    return await run_in_threadpool(unlock_resource, resource_key, operation)
+    return await run_in_executor(EXECUTOR_HTTP, unlock_resource, resource_key, operation)
 
 
 def lock_resource(resource_key: str, operation: str) -> dict:
@@ -0,0 +1,117 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import asyncio
+
+from app.config import ConfigClass
+from app.resources.executors import EXECUTOR_DISK
+from app.resources.executors import EXECUTOR_HTTP
+from app.resources.executors import run_in_executor
+
+# limits of a S3 multipart upload
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+# seconds waited before the first retry of a failed part, doubled for every next one
+PART_RETRY_DELAY = 1
+
+
+def get_part_size(length: int) -> int:
+    """return the size of the parts to upload length bytes, FINALIZE_PART_SIZE unless it needs too many parts.
+
+    the size is rounded up to a MiB.
+    """
+    part_size = max(ConfigClass.FINALIZE_PART_SIZE, MULTIPART_MIN_PART_SIZE, -(-length // MULTIPART_MAX_PARTS))
+    return -(-part_size // 2**20) * 2**20
+
+
+async def upload_part(logger, mc, bucket: str, obj_path: str, upload_id: str, part_number: int, data: bytes) -> str:
+    """upload one part, retried FINALIZE_PART_RETRIES times, and return its etag."""
+    for attempt in range(ConfigClass.FINALIZE_PART_RETRIES + 1):
+        try:
+            return await run_in_executor(EXECUTOR_HTTP, mc.upload_part, bucket, obj_path, upload_id, part_number, data)
+        except Exception as exce:
+            if attempt == ConfigClass.FINALIZE_PART_RETRIES:
+                raise
+            logger.warning('Part {} of {} failed, retrying: {}'.format(part_number, obj_path, str(exce)))
+            await asyncio.sleep(PART_RETRY_DELAY * 2**attempt)
+
+
+async def upload_object_parts(
+    logger, mc, bucket: str, obj_path: str, source, length: int, concurrency: int = None, progress=None
+):
+    """upload length bytes of the file-like source as the parts of a multipart upload, return the version id.
+
+    the parts are read in order and up to concurrency of them (FINALIZE_UPLOAD_CONCURRENCY by default) are uploaded
+    at once, so at most as many parts are held in memory. The multipart upload is aborted if a part fails for good.
+    The optional progress coroutine function is awaited with the number of parts uploaded and the total number of
+    parts after every part.
+    """
+    concurrency = concurrency or ConfigClass.FINALIZE_UPLOAD_CONCURRENCY
+    part_size = get_part_size(length)
+    total_parts = -(-length // part_size)
+    upload_id = await run_in_executor(EXECUTOR_HTTP, mc.create_multipart_upload, bucket, obj_path)
+    slots = asyncio.Semaphore(concurrency)
+    parts = {}
+    tasks = []
+
+    async def upload(part_number: int, data: bytes):
+        try:
+            parts[part_number] = await upload_part(logger, mc, bucket, obj_path, upload_id, part_number, data)
+        finally:
+            slots.release()
+        if progress:
+            await progress(len(parts), total_parts)
+
+    try:
+        for part_number in range(1, total_parts + 1):
+            await slots.acquire()
+            # a failed part stops the reading of the next ones
+            for task in tasks:
+                if task.done() and task.exception():
+                    raise task.exception()
+            data = await run_in_executor(EXECUTOR_DISK, source.read, part_size)
+            if not data:
+                raise Exception('source of {} ended before {} bytes'.format(obj_path, length))
+            tasks.append(asyncio.ensure_future(upload(part_number, data)))
+        await asyncio.gather(*tasks)
+        result = await run_in_executor(EXECUTOR_HTTP, mc.complete_multipart_upload, bucket, obj_path, upload_id, parts)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await run_in_executor(EXECUTOR_HTTP, mc.abort_multipart_upload, bucket, obj_path, upload_id)
+        except Exception as exce:
+            logger.error('error when aborting multipart upload: ' + str(exce))
+        raise
+    logger.info('Minio multipart upload of {} parts completed'.format(len(parts)))
+    return result.version_id
+
+
+async def upload_object(logger, mc, bucket: str, obj_path: str, source, length: int, progress=None) -> str:
+    """upload length bytes of the file-like source to minio, return the version id.
+
+    objects over FINALIZE_MULTIPART_THRESHOLD bytes are uploaded as parallel multipart parts, with their progress
+    reported like upload_object_parts does.
+    """
+    if length > ConfigClass.FINALIZE_MULTIPART_THRESHOLD:
+        return await upload_object_parts(logger, mc, bucket, obj_path, source, length, progress=progress)
+    result = await run_in_executor(EXECUTOR_HTTP, mc.client.put_object, bucket, obj_path, source, length)
+    return result.version_id
@@ -0,0 +1,503 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import base64
+import errno
+import hashlib
+import os
+import zlib
+
+from app.config import ConfigClass
+from app.models.models_upload import EUploadMode
+from app.resources.executors import EXECUTOR_CPU
+from app.resources.executors import EXECUTOR_DISK
+from app.resources.executors import EXECUTOR_HTTP
+from app.resources.executors import run_in_executor
+
+# size of the buffer used when copying chunk data to the staging disk
+COPY_BUFFER_SIZE = 1024 * 1024
+# bytes asked from the kernel by one copy_file_range or sendfile call when a chunk is appended to the merged file
+KERNEL_COPY_SIZE = 64 * 1024 * 1024
+# errors of copy_file_range and sendfile telling the file pair can not be copied in the kernel
+_KERNEL_COPY_UNSUPPORTED = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF)
+# staging_tier of the jobs which keep their chunks in redis instead of the staging disk
+STAGING_TIER_MEMORY = 'memory'
+# content encodings a chunk body can be sent with
+CHUNK_CONTENT_ENCODINGS = ('identity', 'gzip', 'zstd')
+# compressed bytes given to zstd at once, a zstd block of 128 KiB takes 4 bytes at least so this bounds the data
+# decompressed by one call to 32 MiB
+ZSTD_INPUT_SIZE = 1024
+
+
+def get_chunk_offset(chunk_number: int, chunk_size: int) -> int:
+    """return the byte offset of a chunk inside the target file.
+
+    resumable.js only lets the last chunk grow past the chunk size so the offset of any chunk only depends on its
+    number.
+    """
+    return (chunk_number - 1) * chunk_size
+
+
+def generate_chunk_name(uploaded_filename, chunk_number):
+    """generate chunk file name."""
+    return uploaded_filename + '_part_%03d' % chunk_number
+
+
+def get_staging_volumes() -> list:
+    """return the directories the uploads are staged on, the STAGING_VOLUMES list or else TEMP_BASE."""
+    volumes = [volume.strip() for volume in ConfigClass.STAGING_VOLUMES.split(',') if volume.strip()]
+    return volumes or [ConfigClass.TEMP_BASE]
+
+
+def get_free_space(path: str) -> int:
+    """return the bytes free on the disk of path."""
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+def get_staging_space():
+    """return the bytes the uploads can reserve on the staging volumes and the bytes free on them right now.
+
+    volumes sharing a disk are counted once.
+    """
+    budget = free_space = 0
+    devices = set()
+    for volume in get_staging_volumes():
+        device = os.stat(volume).st_dev
+        if device in devices:
+            continue
+        devices.add(device)
+        stat = os.statvfs(volume)
+        budget += int(stat.f_blocks * stat.f_frsize * ConfigClass.STAGING_DISK_RATIO)
+        free_space += stat.f_bavail * stat.f_frsize
+    return budget, free_space
+
+
+def choose_staging_dir(resumable_identifier: str) -> str:
+    """return the staging directory of a new upload.
+
+    the volume is picked by the hash of the identifier, or as the one with the most free space for the free_space
+    STAGING_VOLUME_POLICY. Under the volume the hash prefixes of the identifier spread the uploads over
+    STAGING_SHARD_LEVELS levels of 256 directories, so no directory holds all the uploads.
+    """
+    digest = hashlib.sha1(resumable_identifier.encode('utf-8')).hexdigest()
+    volumes = get_staging_volumes()
+    if ConfigClass.STAGING_VOLUME_POLICY == 'free_space' and len(volumes) > 1:
+        volume = max(volumes, key=get_free_space)
+    else:
+        volume = volumes[int(digest, 16) % len(volumes)]
+    shards = [digest[2 * level] + digest[2 * level + 1] for level in range(ConfigClass.STAGING_SHARD_LEVELS)]
+    return os.path.join(volume, *shards, resumable_identifier)
+
+
+def get_staging_dir(resumable_identifier: str, job_payload: dict = None) -> str:
+    """return the staging directory recorded in the job, the flat TEMP_BASE one for the jobs created before."""
+    if job_payload and job_payload.get('staging_dir'):
+        return job_payload['staging_dir']
+    return os.path.join(ConfigClass.TEMP_BASE, resumable_identifier)
+
+
+def preallocate_file(file_path: str, total_size: int):
+    """create a sparse file of total_size bytes so chunks can be written in place."""
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, total_size)
+    finally:
+        os.close(fd)
+
+
+class ChunkFileSink:
+    """Write a chunk into its own part file (CHUNKS upload mode)."""
+
+    executor = EXECUTOR_DISK
+
+    def __init__(self, file_path: str):
+        self.file = open(file_path, 'wb')
+
+    def write(self, buffer: bytes):
+        self.file.write(buffer)
+
+    def close(self):
+        self.file.close()
+
+
+class OffsetFileSink:
+    """Write a chunk at its offset of the preallocated target file (PREALLOCATED upload mode).
+
+    the writes are positional so chunks of the same file can be saved concurrently and in any order.
+    """
+
+    executor = EXECUTOR_DISK
+
+    def __init__(self, file_path: str, offset: int, total_size: int):
+        self.fd = os.open(file_path, os.O_WRONLY)
+        self.offset = offset
+        self.total_size = total_size
+        self.written = 0
+
+    def write(self, buffer: bytes):
+        if self.offset + self.written + len(buffer) > self.total_size:
+            raise ChunkRequestError('chunk at offset {} exceeds the total size {}'.format(self.offset, self.total_size))
+        view = memoryview(buffer)
+        while view:
+            size = os.pwrite(self.fd, view, self.offset + self.written)
+            self.written += size
+            view = view[size:]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class MultipartPartSink:
+    """Forward a chunk to minio as a part of the multipart upload (MULTIPART and PRESIGNED upload modes).
+
+    the part is written with mc, the minio client of the user. The etag of the part is available once the sink is
+    closed.
+    """
+
+    executor = EXECUTOR_HTTP
+
+    def __init__(self, job_payload: dict, part_number: int, mc):
+        self.job_payload = job_payload
+        self.part_number = part_number
+        self.mc = mc
+        self.buffer = bytearray()
+        self.etag = None
+
+    def write(self, buffer: bytes):
+        self.buffer += buffer
+
+    def close(self):
+        self.etag = self.mc.upload_part(
+            self.job_payload['bucket'],
+            self.job_payload['object_path'],
+            self.job_payload['upload_id'],
+            self.part_number,
+            memoryview(self.buffer),
+        )
+
+
+class MemoryChunkSink:
+    """Keep a chunk in memory, to stage it in redis where every worker finds it (memory staging tier).
+
+    max_size bounds the chunk to the memory reserved for the upload.
+    """
+
+    executor = EXECUTOR_CPU
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.buffer = bytearray()
+
+    def write(self, buffer: bytes):
+        if len(self.buffer) + len(buffer) > self.max_size:
+            raise ChunkRequestError('chunk exceeds the {} bytes reserved in memory'.format(self.max_size))
+        self.buffer += buffer
+
+    def close(self):
+        pass
+
+
+class ChunkRequestError(Exception):
+    """The chunk can not be accepted for its job, like a chunk number out of range or a chunk too large."""
+
+
+class ChunkDigestError(Exception):
+    """The data of a chunk does not match the digest sent by the client."""
+
+
+class ChunkEncodingError(Exception):
+    """The body of a chunk can not be decompressed with its content encoding."""
+
+
+class DigestSink:
+    """Hash the data of a chunk while it is written to the wrapped sink.
+
+    sha256 is kept as the chunk digest, md5 is only computed to check the Content-MD5 of the client.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.executor = sink.executor
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, buffer: bytes):
+        self.size += len(buffer)
+        self.sha256.update(buffer)
+        self.md5.update(buffer)
+        self.sink.write(buffer)
+
+    def close(self):
+        self.sink.close()
+
+    def check_md5(self, content_md5: str):
+        """raise ChunkDigestError if the base64 encoded md5 of the client does not match the data."""
+        if content_md5 and base64.b64encode(self.md5.digest()).decode('ascii') != content_md5:
+            raise ChunkDigestError('Content-MD5 mismatch: {}'.format(content_md5))
+
+
+class DecodingSink:
+    """Decompress the gzip or zstd data written to it into the wrapped sink.
+
+    the decompressed data never goes over max_size bytes, so a small compressed body can neither fill the memory nor
+    the disk. The body may hold several gzip members or zstd frames one after the other, like concatenated files.
+    """
+
+    def __init__(self, sink, content_encoding: str, max_size: int):
+        self.sink = sink
+        self.executor = sink.executor
+        self.content_encoding = content_encoding
+        self.max_size = max_size
+        self.size = 0
+        if content_encoding == 'gzip':
+            self.decoder_error = zlib.error
+        else:
+            import zstandard
+
+            self.decoder_error = zstandard.ZstdError
+        self.decoder = self.open_decoder()
+
+    def open_decoder(self):
+        if self.content_encoding == 'gzip':
+            # the 16 offset makes zlib expect the gzip header and trailer
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompressobj(write_size=COPY_BUFFER_SIZE)
+
+    def write_decoded(self, buffer: bytes):
+        self.size += len(buffer)
+        if self.size > self.max_size:
+            raise ChunkEncodingError('Decompressed chunk exceeds {} bytes'.format(self.max_size))
+        self.sink.write(buffer)
+
+    def decode(self, view: memoryview):
+        """decompress the beginning of view into the sink, return the compressed data left."""
+        if self.content_encoding == 'gzip':
+            self.write_decoded(self.decoder.decompress(view, COPY_BUFFER_SIZE))
+            return self.decoder.unused_data if self.decoder.eof else self.decoder.unconsumed_tail
+        # zstd decompresses all the data it is given at once, a few bytes can stand for a whole block
+        self.write_decoded(self.decoder.decompress(view[:ZSTD_INPUT_SIZE]))
+        if self.decoder.eof:
+            return self.decoder.unused_data + bytes(view[ZSTD_INPUT_SIZE:])
+        return view[ZSTD_INPUT_SIZE:]
+
+    def write(self, buffer: bytes):
+        view = memoryview(buffer)
+        try:
+            while view:
+                if self.decoder.eof:
+                    self.decoder = self.open_decoder()
+                view = memoryview(self.decode(view))
+        except self.decoder_error as exce:
+            raise ChunkEncodingError('Invalid {} chunk: {}'.format(self.content_encoding, exce))
+
+    def close(self):
+        try:
+            self.write_decoded(self.decoder.flush())
+        finally:
+            self.sink.close()
+
+    def check_complete(self):
+        """raise ChunkEncodingError if the compressed data ended before the end of its last member or frame."""
+        if not self.decoder.eof:
+            raise ChunkEncodingError('Truncated {} chunk'.format(self.content_encoding))
+
+
+def get_merkle_root(digests: list) -> str:
+    """return the merkle root of the hex sha256 digests of the chunks, in chunk order.
+
+    every level hashes the concatenation of pairs of nodes, an odd last node is promoted as is to the next level.
+    """
+    level = [bytes.fromhex(digest) for digest in digests]
+    if not level:
+        return hashlib.sha256(b'').hexdigest()
+    while len(level) > 1:
+        next_level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0].hex()
+
+
+def open_chunk_sink(job_payload: dict, temp_dir: str, resumable_filename: str, chunk_number: int, mc=None):
+    """return the sink the chunk has to be written to for the upload mode of the job.
+
+    mc, the minio client of the user, is only needed by the upload modes which write to minio.
+    """
+    upload_mode = job_payload.get('upload_mode', EUploadMode.CHUNKS.name)
+    if job_payload.get('staging_tier') == STAGING_TIER_MEMORY:
+        return MemoryChunkSink(job_payload['total_size'])
+    if upload_mode == EUploadMode.PREALLOCATED.name:
+        offset = get_chunk_offset(chunk_number, job_payload['chunk_size'])
+        return OffsetFileSink(os.path.join(temp_dir, resumable_filename), offset, job_payload['total_size'])
+    if upload_mode in (EUploadMode.MULTIPART.name, EUploadMode.PRESIGNED.name):
+        return MultipartPartSink(job_payload, chunk_number, mc)
+    return ChunkFileSink(os.path.join(temp_dir, generate_chunk_name(resumable_filename, chunk_number)))
+
+
+def copy_to_sink(source, sink):
+    """copy a file-like source into the sink and close it."""
+    try:
+        while True:
+            buffer = source.read(COPY_BUFFER_SIZE)
+            if not buffer:
+                break
+            sink.write(buffer)
+    finally:
+        sink.close()
+
+
+def _copy_file_range(source_fd: int, target_fd: int, count: int) -> int:
+    return os.copy_file_range(source_fd, target_fd, count)
+
+
+def _sendfile(source_fd: int, target_fd: int, count: int) -> int:
+    return os.sendfile(target_fd, source_fd, None, count)
+
+
+def _copy_buffered(source_fd: int, target_fd: int, count: int) -> int:
+    buffer = os.read(source_fd, min(count, COPY_BUFFER_SIZE))
+    view = memoryview(buffer)
+    while view:
+        written = os.write(target_fd, view)
+        view = view[written:]
+    return len(buffer)
+
+
+def get_copy_methods() -> list:
+    """return the ways to copy between two file descriptors, the ones done in the kernel first."""
+    methods = []
+    if hasattr(os, 'copy_file_range'):
+        methods.append(_copy_file_range)
+    if hasattr(os, 'sendfile'):
+        methods.append(_sendfile)
+    methods.append(_copy_buffered)
+    return methods
+
+
+def copy_file_data(source_fd: int, target_fd: int, size: int) -> int:
+    """copy size bytes from the current offset of source_fd to the current offset of target_fd.
+
+    the data is copied with copy_file_range, or sendfile where the kernel or the file systems do not support it, so it
+    never goes through the memory of the process. The buffered copy of COPY_BUFFER_SIZE pieces is only the last
+    resort. Return the bytes copied, less than size if the source is shorter.
+    """
+    methods = get_copy_methods()
+    copied = 0
+    while copied < size:
+        count = min(size - copied, KERNEL_COPY_SIZE)
+        try:
+            written = methods[0](source_fd, target_fd, count)
+        except OSError as exce:
+            if exce.errno not in _KERNEL_COPY_UNSUPPORTED or len(methods) == 1:
+                raise
+            # the offsets are only moved by the bytes copied so the next method goes on from there
+            methods.pop(0)
+            continue
+        if not written:
+            break
+        copied += written
+    return copied
+
+
+def append_chunk(target_file, chunk_path: str):
+    """append a staged chunk to the target file, opened without O_APPEND, and remove it.
+
+    the chunk is copied in the kernel, see copy_file_data, and the page cache is told the chunk is read once in order
+    so it reads ahead and drops the pages afterwards.
+    """
+    target_file.flush()
+    chunk_fd = os.open(chunk_path, os.O_RDONLY)
+    try:
+        size = os.fstat(chunk_fd).st_size
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(chunk_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        copied = copy_file_data(chunk_fd, target_file.fileno(), size)
+        if copied != size:
+            raise OSError('chunk {} was truncated while it was merged'.format(chunk_path))
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(chunk_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(chunk_fd)
+    os.unlink(chunk_path)
+
+
+class ChainedChunkReader:
+    """Read the ordered chunk files of an upload as one stream, every chunk file is removed once it is read.
+
+    the length of the stream is known upfront so it can be given to minio put_object instead of a merged file.
+    """
+
+    def __init__(self, chunk_paths: list):
+        self.chunk_paths = list(chunk_paths)
+        self.length = sum(os.path.getsize(chunk_path) for chunk_path in self.chunk_paths)
+        self.chunk_file = None
+
+    def read(self, size: int = -1) -> bytes:
+        pieces = []
+        while size and (self.chunk_file or self.chunk_paths):
+            if self.chunk_file is None:
+                self.chunk_file = open(self.chunk_paths.pop(0), 'rb')
+            piece = self.chunk_file.read(size)
+            if not piece:
+                self.chunk_file.close()
+                os.unlink(self.chunk_file.name)
+                self.chunk_file = None
+                continue
+            pieces.append(piece)
+            if size > 0:
+                size -= len(piece)
+        return b''.join(pieces)
+
+    def close(self):
+        if self.chunk_file:
+            self.chunk_file.close()
+            self.chunk_file = None
+
+
+async def stream_to_sink(stream, sink):
+    """copy an async iterator of bytes (like starlette request.stream()) into the sink and close it.
+
+    the pieces are gathered up to COPY_BUFFER_SIZE so the executor of the sink is not used for every network read.
+    """
+    try:
+        buffer = bytearray()
+        async for piece in stream:
+            buffer += piece
+            if len(buffer) >= COPY_BUFFER_SIZE:
+                await run_in_executor(sink.executor, sink.write, bytes(buffer))
+                buffer = bytearray()
+        if buffer:
+            await run_in_executor(sink.executor, sink.write, bytes(buffer))
+    finally:
+        await run_in_executor(sink.executor, sink.close)
+
+
+def write_at_offset(file_path: str, offset: int, source, total_size: int) -> int:
+    """write the content of the file-like source into an existing file starting at offset.
+
+    return the number of bytes written.
+    """
+    sink = OffsetFileSink(file_path, offset, total_size)
+    copy_to_sink(source, sink)
+    return sink.written
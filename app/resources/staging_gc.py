@@ -0,0 +1,171 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import json
+import os
+import shutil
+import time
+import uuid
+
+from app.commons.data_providers import SrvAioRedisSingleton
+from app.commons.data_providers import session_job_set_status
+from app.commons.data_providers import staging_release
+from app.commons.data_providers import upload_progress_get_many
+from app.commons.data_providers import upload_state_delete
+from app.commons.service_connection.minio_client import Minio_Client
+from app.config import ConfigClass
+from app.models.fsm_file_upload import EState
+from app.resources.executors import EXECUTOR_DISK
+from app.resources.executors import EXECUTOR_HTTP
+from app.resources.executors import run_in_executor
+from app.resources.lock import async_unlock_resource
+from app.resources.staging import get_staging_dir
+from app.resources.upload_manifest import drop_upload_manifest
+
+_UPLOAD_ACTION = 'data_upload'
+# the instance which holds the leader key runs the sweep of the interval
+_GC_LEADER_KEY = 'stagingsweeper:leader'
+_GC_STATS_KEY = 'stagingsweeper:stats'
+_GC_INSTANCE_ID = uuid.uuid4().hex
+_FINISHED_STATES = (EState.SUCCEED.name, EState.TERMINATED.name)
+# the finalize worker owns these jobs, it terminates them itself when it fails
+_FINALIZING_STATES = (EState.CHUNK_UPLOADED.name, EState.FINALIZED.name)
+
+
+def remove_staging_dir(staging_dir: str) -> int:
+    """remove the staging directory of an upload, return the bytes it took on the disk."""
+    if not os.path.isdir(staging_dir):
+        return 0
+    usage = 0
+    for root, _, files in os.walk(staging_dir):
+        for name in files:
+            # the preallocated files are sparse, only count what is written
+            usage += os.lstat(os.path.join(root, name)).st_blocks * 512
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return usage
+
+
+def get_last_activity(job: dict, raw_progress: dict) -> float:
+    """return when the upload was last active, in seconds since the epoch."""
+    last_activity = float(job.get('update_timestamp') or 0)
+    if raw_progress.get('updated_at'):
+        last_activity = max(last_activity, int(raw_progress['updated_at']) / 1000)
+    if raw_progress.get('signed_at'):
+        # a PRESIGNED upload goes on as long as the part urls it was given are valid
+        last_activity = max(
+            last_activity, int(raw_progress['signed_at']) / 1000 + ConfigClass.MINIO_PRESIGNED_URL_EXPIRY
+        )
+    return last_activity
+
+
+async def terminate_upload(logger, job: dict, reason: str) -> int:
+    """drop what an abandoned upload holds and mark its job TERMINATED, return the staging bytes reclaimed."""
+    resumable_identifier = job['job_id']
+    payload = job.get('payload') or {}
+    staging_dir = get_staging_dir(resumable_identifier, payload)
+    reclaimed = await run_in_executor(EXECUTOR_DISK, remove_staging_dir, staging_dir)
+    if payload.get('upload_id'):
+        # the sweeper runs without the tokens of the user, the service account can abort any upload
+        try:
+            await run_in_executor(
+                EXECUTOR_HTTP,
+                Minio_Client().abort_multipart_upload,
+                payload['bucket'],
+                payload['object_path'],
+                payload['upload_id'],
+            )
+        except Exception as e:
+            logger.error('error when aborting multipart upload: ' + str(e))
+    await upload_state_delete(resumable_identifier)
+    drop_upload_manifest(resumable_identifier)
+    await staging_release([resumable_identifier])
+    bucket = ('gr-' if ConfigClass.disk_namespace == 'greenroom' else 'core-') + job['project_code']
+    try:
+        await async_unlock_resource(os.path.join(bucket, job['source']), 'write')
+    except Exception as e:
+        # the lock is already gone when the finalize ran
+        logger.info('Staging sweeper unlock error: ' + str(e))
+    payload['error_msg'] = reason
+    await session_job_set_status(
+        job['session_id'],
+        job['job_id'],
+        job['source'],
+        job['action'],
+        EState.TERMINATED.name,
+        job['project_code'],
+        job['operator'],
+        payload,
+        job['progress'],
+    )
+    return reclaimed
+
+
+async def sweep_staging(logger) -> dict:
+    """terminate the uploads inactive for STAGING_GC_TTL seconds, drop the records of the uploads finished as long.
+
+    only the instance elected for the interval sweeps, the others return an empty dict. The counters of the sweep
+    are added to the ones returned by get_sweep_stats.
+    """
+    srv_redis = SrvAioRedisSingleton()
+    if not await srv_redis.set_by_key_if_absent(_GC_LEADER_KEY, _GC_INSTANCE_ID, ConfigClass.STAGING_GC_INTERVAL):
+        return {}
+
+    job_keys = await srv_redis.scan_by_prefix('dataaction')
+    jobs = []
+    for job_key, record in zip(job_keys, await srv_redis.mget_by_keys(job_keys)):
+        # a record can go away between the scan and the read
+        if record:
+            job = json.loads(record.decode('utf-8'))
+            if job.get('action') == _UPLOAD_ACTION:
+                jobs.append((job_key, job))
+    progresses = await upload_progress_get_many([job['job_id'] for _, job in jobs])
+
+    stats = {'reclaimed_bytes': 0, 'reclaimed_jobs': 0, 'dropped_records': 0}
+    inactive_since = time.time() - ConfigClass.STAGING_GC_TTL
+    for (job_key, job), raw_progress in zip(jobs, progresses):
+        if job['status'] in _FINALIZING_STATES or get_last_activity(job, raw_progress) > inactive_since:
+            continue
+        try:
+            if job['status'] in _FINISHED_STATES:
+                stats['reclaimed_bytes'] += await run_in_executor(
+                    EXECUTOR_DISK, remove_staging_dir, get_staging_dir(job['job_id'], job.get('payload'))
+                )
+                await srv_redis.delete_by_key(job_key)
+                stats['dropped_records'] += 1
+            else:
+                logger.info('Staging sweeper terminates upload {}'.format(job['job_id']))
+                stats['reclaimed_bytes'] += await terminate_upload(
+                    logger, job, 'Upload inactive for more than {} seconds'.format(ConfigClass.STAGING_GC_TTL)
+                )
+                stats['reclaimed_jobs'] += 1
+        except Exception as exce:
+            logger.error('Staging sweeper failed on upload {}: {}'.format(job['job_id'], str(exce)))
+
+    for field, amount in stats.items():
+        await srv_redis.hincrby_by_key(_GC_STATS_KEY, field, amount)
+    await srv_redis.hincrby_by_key(_GC_STATS_KEY, 'sweeps', 1)
+    return stats
+
+
+async def get_sweep_stats() -> dict:
+    """return the counters of all the sweeps so far."""
+    srv_redis = SrvAioRedisSingleton()
+    stats = await srv_redis.hgetall_by_key(_GC_STATS_KEY)
+    return {field.decode('utf-8'): int(value) for field, value in stats.items()}
@@ -0,0 +1,55 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+from collections import OrderedDict
+
+from app.commons.data_providers import upload_manifest_get
+from app.config import ConfigClass
+
+# the manifests do not change once recorded, a local copy is dropped with the
+# state of its upload. The copies held by the other workers are left to the
+# eviction, the identifier of an upload is never reused and its job record
+# tells the late requests that the upload is over.
+_manifest_cache = OrderedDict()
+
+
+def cache_upload_manifest(resumable_identifier: str, manifest: dict):
+    """keep the manifest of an upload in memory, forget the least recently used ones over MANIFEST_CACHE_SIZE."""
+    _manifest_cache[resumable_identifier] = manifest
+    _manifest_cache.move_to_end(resumable_identifier)
+    while len(_manifest_cache) > ConfigClass.MANIFEST_CACHE_SIZE:
+        _manifest_cache.popitem(last=False)
+
+
+def drop_upload_manifest(resumable_identifier: str):
+    """forget the manifest of an upload kept in memory, once its upload state is deleted."""
+    _manifest_cache.pop(resumable_identifier, None)
+
+
+async def get_upload_manifest(resumable_identifier: str) -> dict:
+    """return the manifest of an upload from memory, or from redis on a miss, empty if it was not recorded."""
+    manifest = _manifest_cache.get(resumable_identifier)
+    if manifest is not None:
+        _manifest_cache.move_to_end(resumable_identifier)
+        return manifest
+    manifest = await upload_manifest_get(resumable_identifier)
+    if manifest:
+        cache_upload_manifest(resumable_identifier, manifest)
+    return manifest
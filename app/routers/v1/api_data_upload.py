@@ -18,12 +18,20 @@
 # permissions and limitations under the Licence.
 # 
 
+import asyncio
+import base64
+import functools
+import hashlib
+import json
 import os
 import shutil
 import time
 import unicodedata as ud
+from datetime import timedelta
+from io import BytesIO
 from typing import List
 from typing import Optional
+from urllib.parse import unquote
 
 import httpx
 from fastapi import APIRouter
@@ -31,12 +39,41 @@ from fastapi import BackgroundTasks
 from fastapi import File
 from fastapi import Form
 from fastapi import Header
+from fastapi import Request
 from fastapi import UploadFile
+from fastapi import WebSocket
+from fastapi import WebSocketDisconnect
+from fastapi import status
 from fastapi_utils import cbv
-from starlette.concurrency import run_in_threadpool
+from minio.helpers import MIN_PART_SIZE
 
 from app.commons.data_providers import SrvAioRedisSingleton
+from app.commons.data_providers import finalize_queue_add
+from app.commons.data_providers import get_missing_chunks
+from app.commons.data_providers import get_upload_manifest_key
+from app.commons.data_providers import get_upload_progress
+from app.commons.data_providers import memory_reserve
 from app.commons.data_providers import session_job_get_status
+from app.commons.data_providers import staging_grow
+from app.commons.data_providers import staging_release
+from app.commons.data_providers import staging_reserve
+from app.commons.data_providers import upload_chunks_check
+from app.commons.data_providers import upload_chunks_get
+from app.commons.data_providers import upload_chunks_set
+from app.commons.data_providers import upload_digests_get
+from app.commons.data_providers import upload_finalize_claim
+from app.commons.data_providers import upload_memory_chunk_set
+from app.commons.data_providers import upload_memory_chunks_delete
+from app.commons.data_providers import upload_memory_chunks_get
+from app.commons.data_providers import upload_parts_get
+from app.commons.data_providers import upload_parts_set
+from app.commons.data_providers import upload_progress_get_many
+from app.commons.data_providers import upload_progress_set_signed
+from app.commons.data_providers import upload_progress_set_stage
+from app.commons.data_providers import upload_session_stats_get
+from app.commons.data_providers import upload_session_stats_record
+from app.commons.data_providers import upload_state_delete
+from app.commons.data_providers import upload_tus_get
 from app.commons.logger_services.logger_factory_service import SrvLoggerFactory
 from app.commons.service_connection.minio_client import Minio_Client_
 from app.config import ConfigClass
@@ -50,16 +87,36 @@ from app.models.folder import batch_link_folders
 from app.models.fsm_file_upload import EState
 from app.models.fsm_file_upload import FsmMgrUpload
 from app.models.fsm_file_upload import get_fsm_object
+from app.models.fsm_file_upload import get_fsm_object_by_key
+from app.models.models_upload import ChunkAdviceResponse
+from app.models.models_upload import ChunkBatchUploadResponse
+from app.models.models_upload import ChunkBitmapResponse
+from app.models.models_upload import ChunkStatusResponse
 from app.models.models_upload import ChunkUploadResponse
 from app.models.models_upload import EUploadJobType
+from app.models.models_upload import EUploadMode
+from app.models.models_upload import ExecutorStatsResponse
 from app.models.models_upload import GETJobStatusResponse
 from app.models.models_upload import OnSuccessUploadPOST
 from app.models.models_upload import POSTCombineChunksResponse
+from app.models.models_upload import PresignedPartsResponse
 from app.models.models_upload import PreUploadPOST
 from app.models.models_upload import PreUploadResponse
+from app.models.models_upload import SingleFileForm
+from app.models.models_upload import SmallFileUploadResponse
+from app.models.models_upload import StagingSweepResponse
+from app.resources.chunk_advisor import get_session_rates
+from app.resources.chunk_advisor import recommend_chunking
 from app.resources.error_handler import ECustomizedError
 from app.resources.error_handler import catch_internal
+from app.resources.error_handler import catch_internal_ws
 from app.resources.error_handler import customized_error_template
+from app.resources.executors import EXECUTOR_DISK
+from app.resources.executors import EXECUTOR_HTTP
+from app.resources.executors import get_executor_stats
+from app.resources.executors import run_in_executor
+from app.resources.finalize_pipeline import finish_pipeline
+from app.resources.finalize_pipeline import run_pipeline
 from app.resources.helpers import async_get_geid
 from app.resources.helpers import delete_by_session_id
 from app.resources.helpers import generate_archive_preview
@@ -68,13 +125,44 @@ from app.resources.helpers import send_to_queue
 from app.resources.helpers import update_file_operation_logs
 from app.resources.lock import async_lock_resource
 from app.resources.lock import async_unlock_resource
-from app.resources.lock import unlock_resource
+from app.resources.object_upload import MULTIPART_MAX_PARTS
+from app.resources.object_upload import upload_object
+from app.resources.staging import CHUNK_CONTENT_ENCODINGS
+from app.resources.staging import STAGING_TIER_MEMORY
+from app.resources.staging import ChainedChunkReader
+from app.resources.staging import ChunkDigestError
+from app.resources.staging import ChunkEncodingError
+from app.resources.staging import ChunkRequestError
+from app.resources.staging import DecodingSink
+from app.resources.staging import DigestSink
+from app.resources.staging import MemoryChunkSink
+from app.resources.staging import MultipartPartSink
+from app.resources.staging import append_chunk
+from app.resources.staging import choose_staging_dir
+from app.resources.staging import copy_to_sink
+from app.resources.staging import generate_chunk_name
+from app.resources.staging import get_merkle_root
+from app.resources.staging import get_staging_dir
+from app.resources.staging import get_staging_space
+from app.resources.staging import open_chunk_sink
+from app.resources.staging import preallocate_file
+from app.resources.staging import stream_to_sink
+from app.resources.staging_gc import get_sweep_stats
+from app.resources.upload_manifest import cache_upload_manifest
+from app.resources.upload_manifest import drop_upload_manifest
+from app.resources.upload_manifest import get_upload_manifest
 
 router = APIRouter()
 
 _API_TAG = 'V1 Upload'
 _API_NAMESPACE = 'api_data_upload'
 _JOB_TYPE = 'data_upload'
+# upload modes which keep the data in a minio multipart upload instead of the staging disk
+_OBJECT_STORAGE_MODES = (EUploadMode.MULTIPART.name, EUploadMode.PRESIGNED.name)
+# states of the jobs whose finalize_worker was already started
+_FINALIZE_STARTED_STATES = (EState.CHUNK_UPLOADED.name, EState.FINALIZED.name, EState.SUCCEED.name)
+# the background tasks run without a response, referenced until they are done
+_detached_tasks = set()
 
 
 @cbv.cbv(router)
@@ -92,11 +180,18 @@ class APIUpload:
                  Init an async upload job, returns job identifier.',
     )
     @catch_internal(_API_NAMESPACE)
-    async def upload_pre(self, request_payload: PreUploadPOST, session_id=Header(None)):
+    async def upload_pre(
+        self,
+        request_payload: PreUploadPOST,
+        session_id=Header(None),
+        Authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Header(None),
+    ):
         """This method allow to create an async upload job."""
         # init resp
         _res = APIResponse()
         job_list = []
+        manifests = {}
         redis_srv = SrvAioRedisSingleton()
         redis_pipeline = await redis_srv.get_pipeline()
         to_create_folders = []
@@ -114,6 +209,16 @@ class APIUpload:
             request_payload.job_type == EUploadJobType.AS_FILE.name
             or request_payload.job_type == EUploadJobType.AS_FOLDER.name
         ):
+            invalid_msg = validate_pre_upload(request_payload)
+            if invalid_msg:
+                _res.code = EAPIResponseCode.bad_request
+                _res.error_msg = invalid_msg
+                return _res.json_response()
+            if request_payload.upload_mode in _OBJECT_STORAGE_MODES and not Authorization:
+                # the parts are written to minio with the credentials of the user
+                _res.code = EAPIResponseCode.unauthorized
+                _res.error_msg = 'Authorization is required for {} upload'.format(request_payload.upload_mode)
+                return _res.json_response()
             project_info = await get_project(request_payload.project_code)
             if not project_info:
                 """this will never happens because project_code is a mandory field."""
@@ -126,16 +231,7 @@ class APIUpload:
             task_id = await async_get_geid()
 
             # filename converting
-            for upload_data in request_payload.data:
-                # here I have to update the special character into NFC form
-                # since some of the browser will encode them into NFD form
-                # for the bug detail. Please check the 2244
-                upload_data.resumable_filename = ud.normalize('NFC', upload_data.resumable_filename)
-                upload_data.resumable_filename = (
-                    upload_data.dcm_id + '_' + upload_data.resumable_filename
-                    if upload_data.dcm_id and upload_data.dcm_id != 'undefined'
-                    else upload_data.resumable_filename
-                )
+            normalize_pre_upload_filenames(request_payload)
 
             # handle filename conflicts
             # if request_payload.do_conflict_check:
@@ -161,6 +257,17 @@ class APIUpload:
             if len(conflict_file_paths) > 0 or len(conflict_folder_paths) > 0:
                 return response_conflic_folder_file_names(_res, conflict_file_paths, conflict_folder_paths)
 
+            # get job geids and reserve the staging disk for all the files before anything is created
+            resumable_identifiers = [await async_get_geid() for _ in request_payload.data]
+            # the multipart uploads opened in minio, aborted if the jobs can not be created
+            minio_client = await get_pre_upload_minio_client(request_payload, Authorization, refresh_token)
+            multipart_uploads = []
+            memory_identifiers, error_response = await reserve_staging(
+                self.__logger, request_payload, resumable_identifiers
+            )
+            if error_response:
+                return error_response
+
             #######################################################
 
             namespace = ConfigClass.disk_namespace
@@ -170,7 +277,7 @@ class APIUpload:
             # to record which node is locked. in case there is a error, we can
             # recover those file
             locked_file_node = []
-            for upload_data in request_payload.data:
+            for upload_data, resumable_identifier in zip(request_payload.data, resumable_identifiers):
                 # add lock
                 bucket = ('gr-' if namespace == 'greenroom' else 'core-') + request_payload.project_code
                 lock_key = os.path.join(bucket, upload_data.resumable_relative_path, upload_data.resumable_filename)
@@ -182,6 +289,7 @@ class APIUpload:
                 except Exception as e:
                     _res.code = EAPIResponseCode.conflict
                     _res.error_msg = str(e)
+                    await release_pre_upload(self.__logger, [], resumable_identifiers, minio_client, multipart_uploads)
                     return _res
 
                 # create folder and folder nodes
@@ -204,59 +312,61 @@ class APIUpload:
                     _res.code = EAPIResponseCode.conflict
                     _res.error_msg = str(file_exist_error)
                     # recover the lock if there is error
-                    for resource_key, operation in locked_file_node:
-                        await async_unlock_resource(resource_key, operation)
+                    await release_pre_upload(
+                        self.__logger, locked_file_node, resumable_identifiers, minio_client, multipart_uploads
+                    )
                     return _res.json_response()
                 except Exception as other_error:
                     self.__logger.error(str(other_error))
                     # recover the lock if there is error
-                    for resource_key, operation in locked_file_node:
-                        await async_unlock_resource(resource_key, operation)
+                    await release_pre_upload(
+                        self.__logger, locked_file_node, resumable_identifiers, minio_client, multipart_uploads
+                    )
                     return _res.json_response()
 
                 last_folder_node_geid = folder_mgr.last_node.global_entity_id if folder_mgr.last_node else None
                 self.__logger.info('[INFO] Folders created: {}'.format(lock_key))
 
-                # get job geid
-                resumable_identifier = await async_get_geid()
-                self.__logger.info('[INFO] Fetched geid for: {}'.format(lock_key))
-                temp_dir = await get_temp_dir(resumable_identifier)
-                relative_full_path = await run_in_threadpool(
-                    os.path.join, upload_data.resumable_relative_path, upload_data.resumable_filename
-                )
+                temp_dir = await run_in_executor(EXECUTOR_DISK, choose_staging_dir, resumable_identifier)
+                relative_full_path = os.path.join(upload_data.resumable_relative_path, upload_data.resumable_filename)
                 self.__logger.info('[INFO] path calculated for: {}'.format(lock_key))
 
-                # init empty status manager
-                status_mgr = await get_fsm_object(
+                finalize_request = get_pre_upload_finalize_request(request_payload, upload_data, resumable_identifier)
+                status_mgr = await create_pre_upload_job(
                     session_id,
-                    request_payload.project_code,
-                    _JOB_TYPE,
-                    request_payload.operator,
+                    request_payload,
+                    upload_data,
+                    resumable_identifier,
+                    relative_full_path,
+                    task_id,
+                    last_folder_node_geid,
+                    finalize_request,
                 )
-                # first time need to call set_job_id
-                await status_mgr.set_job_id(resumable_identifier)
-                status_mgr.set_source(relative_full_path)
-                status_mgr.add_payload('task_id', task_id)
-                status_mgr.add_payload('resumable_identifier', resumable_identifier)
-                status_mgr.add_payload('parent_folder_geid', last_folder_node_geid)
                 self.__logger.info('[INFO] Job created: {}'.format(lock_key))
 
                 try:
-                    # create temp dir
-                    is_dir_exist = await run_in_threadpool(os.path.isdir, temp_dir)
-                    if not is_dir_exist:
-                        await run_in_threadpool(os.makedirs, temp_dir)
+                    await prepare_upload_job(
+                        status_mgr,
+                        upload_data,
+                        temp_dir,
+                        bucket,
+                        relative_full_path,
+                        resumable_identifier in memory_identifiers,
+                        minio_client,
+                        multipart_uploads,
+                    )
                     # set preuploaded status
                     status_mgr.set_status(EState.PRE_UPLOADED.name)
-                    job_key, job_value, job_recorded = status_mgr.get_kv_entity()
-                    await run_in_threadpool(redis_pipeline.set, job_key, job_value)
-                    job_list.append(job_recorded)
+                    job_list.append(
+                        record_pre_upload_job(redis_pipeline, status_mgr, session_id, finalize_request, manifests)
+                    )
                     self.__logger.info('[INFO] Job status changed: {}'.format(lock_key))
                 except Exception as exce:
                     # catch internal error
                     status_mgr.add_payload('error_msg', str(exce))
                     status_mgr.set_status(EState.TERMINATED.name)
                     self.__logger.error('[INFO] Job failed: {}'.format(lock_key))
+                    await release_pre_upload(self.__logger, [], resumable_identifiers, minio_client, multipart_uploads)
                     raise exce
 
                 self.__logger.info('[SUCCEED] All tasks done for: {}'.format(lock_key))
@@ -287,15 +397,22 @@ class APIUpload:
                     _res.result = str(e)
                     # here ONLY the folder has some issue then we unlock the
                     # file node in previous
-                    for resource_key, operation in locked_file_node:
-                        await async_unlock_resource(resource_key, operation)
+                    await release_pre_upload(
+                        self.__logger, locked_file_node, resumable_identifiers, minio_client, multipart_uploads
+                    )
 
                     return _res.json_response()
                 finally:
                     # here we unlock the locked nodes ONLY
                     for resource_key, operation in locked_folder_node:
                         await async_unlock_resource(resource_key, operation)
-            await redis_pipeline.execute()
+            try:
+                await redis_pipeline.execute()
+            except Exception:
+                await release_pre_upload(self.__logger, [], resumable_identifiers, minio_client, multipart_uploads)
+                raise
+            for resumable_identifier, manifest in manifests.items():
+                cache_upload_manifest(resumable_identifier, manifest)
             _res.code = EAPIResponseCode.success
             _res.result = job_list
             self.__logger.info('[SUCCEED] Done')
@@ -317,10 +434,43 @@ class APIUpload:
             _res.error_msg = 'Invalid Session ID: ' + str(session_id)
             return _res.json_response()
         job_fatched = await session_job_get_status(session_id, '*', project_code, _JOB_TYPE, operator)
+        # the live counters are only written behind into the job records
+        progresses = await upload_progress_get_many([job['job_id'] for job in job_fatched])
+        for job, raw_progress in zip(job_fatched, progresses):
+            if raw_progress:
+                job['payload']['progress'] = get_upload_progress(raw_progress, get_job_totals(job['payload'])[0])
         _res.code = EAPIResponseCode.success
         _res.result = job_fatched
         return _res.json_response()
 
+    @router.get(
+        '/files/staging/sweeps',
+        tags=[_API_TAG],
+        response_model=StagingSweepResponse,
+        summary='get the counters of the staging sweeper.',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def get_staging_sweeps(self):
+        """This method allow to check how much the sweeps of the abandoned uploads reclaimed."""
+        _res = APIResponse()
+        _res.code = EAPIResponseCode.success
+        _res.result = await get_sweep_stats()
+        return _res.json_response()
+
+    @router.get(
+        '/files/executors',
+        tags=[_API_TAG],
+        response_model=ExecutorStatsResponse,
+        summary='get the queue depth and wait time of the executors of this instance.',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def get_executors(self):
+        """This method allow to check if a kind of blocking work is waiting for threads on this instance."""
+        _res = APIResponse()
+        _res.code = EAPIResponseCode.success
+        _res.result = get_executor_stats()
+        return _res.json_response()
+
     @router.delete('/files/jobs', tags=[_API_TAG], summary='Delete the upload job status.')
     @catch_internal(_API_NAMESPACE)
     async def clear_status(self, session_id: str = Header(None)):
@@ -340,20 +490,30 @@ class APIUpload:
     @catch_internal(_API_NAMESPACE)
     async def upload_chunks(
         self,
-        project_code: str = Form(...),
-        operator: str = Form(...),
         resumable_identifier: str = Form(...),
-        resumable_filename: str = Form(...),
-        resumable_relative_path: str = Form(''),
         resumable_chunk_number: int = Form(...),
-        resumable_total_chunks: int = Form(...),
-        resumable_total_size: int = Form(...),
+        project_code: str = Form(None),
+        operator: str = Form(None),
+        resumable_filename: str = Form(None),
+        resumable_relative_path: str = Form(''),
+        resumable_total_chunks: int = Form(None),
+        resumable_total_size: int = Form(None),
         tags: list = Form([]),
         dcm_id: str = Form('undefined'),
+        resumable_chunk_md5: str = Form(None),
+        resumable_chunk_encoding: str = Form(None),
         session_id: str = Header(None),
         chunk_data: UploadFile = File(...),
+        background_tasks: BackgroundTasks = None,
+        Authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Header(None),
     ):
-        """This method allow to upload file chunks."""
+        """This method allow to upload file chunks.
+
+        resumable_chunk_md5 is the optional base64 md5 of the chunk, resumable_chunk_encoding the optional gzip or
+        zstd compression of chunk_data. project_code, operator and resumable_filename are only required for the jobs
+        without a manifest.
+        """
         # init resp
         _res = APIResponse()
         if not session_id:
@@ -361,26 +521,391 @@ class APIUpload:
             _res.result = {}
             _res.error_msg = 'Invalid Session ID: ' + str(session_id)
             return _res.json_response()
+        if resumable_chunk_encoding and resumable_chunk_encoding not in CHUNK_CONTENT_ENCODINGS:
+            _res.code = EAPIResponseCode.unsupported_media_type
+            _res.result = {}
+            _res.error_msg = 'Unsupported chunk encoding: ' + resumable_chunk_encoding
+            return _res.json_response()
 
+        manifest = await get_upload_manifest(resumable_identifier)
+        if not manifest and (not project_code or not operator or not resumable_filename):
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'project_code, operator and resumable_filename are required'
+            return _res.json_response()
+
+        resumable_filename = get_manifest_filename(manifest, resumable_filename, dcm_id)
         self.__logger.info('resumable_filename: %s' % resumable_filename)
-        # here I have to update the special character into NFC form
-        # since some of the browser will encode them into NFD form
-        # for the bug detail. Please check the ticket 2244
-        resumable_filename = ud.normalize('NFC', resumable_filename)
+        _res.code = EAPIResponseCode.success
+        # init status manager
+        status_mgr = await get_upload_job(session_id, project_code, operator, resumable_identifier, manifest)
+        try:
+            _res.result = await save_chunk(
+                self.__logger,
+                status_mgr,
+                resumable_identifier,
+                resumable_filename,
+                resumable_chunk_number,
+                chunk_data.file,
+                background_tasks,
+                Authorization,
+                refresh_token,
+                resumable_chunk_md5,
+                resumable_total_chunks,
+                resumable_total_size,
+                resumable_chunk_encoding,
+            )
+        except (ChunkDigestError, ChunkEncodingError, ChunkRequestError) as exce:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = str(exce)
+        return _res.json_response()
 
-        # check pipeline id
-        resumable_filename = (
-            dcm_id + '_' + resumable_filename if dcm_id and dcm_id != 'undefined' else resumable_filename
+    @router.put(
+        '/files/{resumable_identifier}/chunks/{resumable_chunk_number}',
+        tags=[_API_TAG],
+        response_model=ChunkUploadResponse,
+        summary='upload a chunk as raw binary body.',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def upload_raw_chunk(
+        self,
+        request: Request,
+        resumable_identifier: str,
+        resumable_chunk_number: int,
+        project_code: str = Header(None),
+        operator: str = Header(None),
+        resumable_filename: str = Header(None),
+        dcm_id: str = Header('undefined'),
+        content_md5: str = Header(None),
+        content_encoding: str = Header(None),
+        session_id: str = Header(None),
+        background_tasks: BackgroundTasks = None,
+        Authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Header(None),
+    ):
+        """This method allow to upload a chunk as application/octet-stream body.
+
+        the chunk metadata comes in the headers (the filename percent-encoded) so the body is streamed to its
+        destination without the multipart/form-data parsing and spooling of the POST endpoint. Project-Code, Operator
+        and Resumable-Filename are only required for the jobs without a manifest. A gzip or zstd
+        Content-Encoding body is decompressed while it is saved, the optional Content-MD5 header is checked against
+        the decompressed data.
+        """
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        if content_encoding and content_encoding not in CHUNK_CONTENT_ENCODINGS:
+            _res.code = EAPIResponseCode.unsupported_media_type
+            _res.result = {}
+            _res.error_msg = 'Unsupported Content-Encoding: ' + content_encoding
+            return _res.json_response()
+        manifest = await get_upload_manifest(resumable_identifier)
+        if not manifest and (not project_code or not operator or not resumable_filename):
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Project-Code, Operator and Resumable-Filename headers are required'
+            return _res.json_response()
+
+        resumable_filename = get_manifest_filename(
+            manifest, unquote(resumable_filename) if resumable_filename else None, dcm_id
         )
-        temp_dir = await get_temp_dir(resumable_identifier)
+        self.__logger.info('resumable_filename: %s' % resumable_filename)
+        _res.code = EAPIResponseCode.success
+        # init status manager
+        status_mgr = await get_upload_job(session_id, project_code, operator, resumable_identifier, manifest)
+        try:
+            _res.result = await save_chunk(
+                self.__logger,
+                status_mgr,
+                resumable_identifier,
+                resumable_filename,
+                resumable_chunk_number,
+                request.stream(),
+                background_tasks,
+                Authorization,
+                refresh_token,
+                content_md5,
+                content_encoding=content_encoding,
+            )
+        except (ChunkDigestError, ChunkEncodingError, ChunkRequestError) as exce:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = str(exce)
+        return _res.json_response()
 
-        # raw_folder_path = get_raw_folder_path(project_code)
-        # file_full_path = os.path.join(
-        #     raw_folder_path, resumable_relative_path, resumable_filename)
-        # relative_full_path = os.path.join(
-        #     resumable_relative_path, resumable_filename)
+    @router.websocket('/files/chunks/ws')
+    @catch_internal_ws(_API_NAMESPACE)
+    async def upload_chunks_ws(self, websocket: WebSocket):
+        """This method allow to upload the chunks of a session over one websocket channel.
+
+        the first message is a json text message with session_id, project_code, operator and the optional
+        Authorization and refresh_token to finalize the uploads. Every following binary message is one chunk framed
+        by parse_chunk_frame and acknowledged with a json text message. A malformed message closes the channel with
+        1003, an internal error with 1011.
+        """
+        await websocket.accept()
+        session_id = None
+        try:
+            try:
+                channel = json.loads(await receive_ws_message(websocket, 'text'))
+                if not isinstance(channel, dict):
+                    raise ValueError('channel message must be an object')
+            except ValueError as exce:
+                await websocket.send_json(
+                    {'code': EAPIResponseCode.bad_request.value, 'error_msg': 'Invalid channel message: ' + str(exce)}
+                )
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                return
+            session_id = channel.get('session_id')
+            if not session_id or not channel.get('project_code') or not channel.get('operator'):
+                await websocket.send_json(
+                    {'code': EAPIResponseCode.bad_request.value, 'error_msg': 'Invalid Session ID: ' + str(session_id)}
+                )
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+            await websocket.send_json({'code': EAPIResponseCode.success.value, 'result': {'msg': 'Ready'}})
+
+            # the jobs of the session are read and the minio client is built once per channel instead of once per
+            # chunk
+            status_mgrs = {}
+            minio_clients = {}
+            while True:
+                try:
+                    header, chunk = parse_chunk_frame(await receive_ws_message(websocket, 'bytes'))
+                    check_chunk_header(header)
+                except ValueError as exce:
+                    await websocket.send_json(
+                        {'code': EAPIResponseCode.bad_request.value, 'error_msg': 'Invalid chunk frame: ' + str(exce)}
+                    )
+                    await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                    return
+                background_tasks = BackgroundTasks()
+                ack = await save_session_chunk(
+                    self.__logger,
+                    status_mgrs,
+                    minio_clients,
+                    session_id,
+                    channel['project_code'],
+                    channel['operator'],
+                    header,
+                    BytesIO(chunk),
+                    background_tasks,
+                    channel.get('Authorization'),
+                    channel.get('refresh_token'),
+                )
+                await websocket.send_json(ack)
+                if background_tasks.tasks:
+                    # there is no response to run the finalize worker after
+                    run_detached(self.__logger, background_tasks)
+        except WebSocketDisconnect:
+            self.__logger.info('Chunk channel of session {} closed'.format(session_id))
+
+    @router.post(
+        '/files/chunks/batch',
+        tags=[_API_TAG],
+        response_model=ChunkBatchUploadResponse,
+        summary='upload several chunks, of one or more files, in one request.',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def upload_chunks_batch(
+        self,
+        background_tasks: BackgroundTasks,
+        project_code: str = Form(...),
+        operator: str = Form(...),
+        chunks: str = Form(...),
+        chunk_data: List[UploadFile] = File(...),
+        session_id: str = Header(None),
+        Authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Header(None),
+    ):
+        """This method allow to upload several chunks in one multipart request.
+
+        chunks is the json list of the resumable_identifier, resumable_chunk_number and, for the jobs without a
+        manifest, the resumable_filename and optional dcm_id of every chunk_data file, in the same order. Every chunk
+        gets its own result entry.
+        """
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        try:
+            headers = json.loads(chunks)
+            if not isinstance(headers, list) or len(headers) != len(chunk_data):
+                raise ValueError('{} chunk_data files for {} chunks'.format(len(chunk_data), len(headers)))
+            for header in headers:
+                check_chunk_header(header)
+        except ValueError as exce:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid chunks: ' + str(exce)
+            return _res.json_response()
+
+        # the jobs are read and the minio client is built once per request instead of once per chunk
+        status_mgrs = {}
+        minio_clients = {}
+        results = []
+        for header, chunk_file in zip(headers, chunk_data):
+            results.append(
+                await save_session_chunk(
+                    self.__logger,
+                    status_mgrs,
+                    minio_clients,
+                    session_id,
+                    project_code,
+                    operator,
+                    header,
+                    chunk_file.file,
+                    background_tasks,
+                    Authorization,
+                    refresh_token,
+                )
+            )
+        _res.code = EAPIResponseCode.success
+        _res.result = results
+        _res.total = len(results)
+        return _res.json_response()
+
+    @router.get(
+        '/files/chunks', tags=[_API_TAG], response_model=ChunkStatusResponse, summary='check if a chunk was received.'
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def check_chunk(
+        self,
+        resumable_identifier: str,
+        resumable_chunk_number: int,
+        session_id: str = Header(None),
+    ):
+        """This method allow resumable.js testChunks to skip the chunks already uploaded."""
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        if resumable_chunk_number < 1 or resumable_chunk_number > MULTIPART_MAX_PARTS:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid chunk number: {}'.format(resumable_chunk_number)
+            return _res.json_response()
+        received = await upload_chunks_check(resumable_identifier, resumable_chunk_number)
+        # resumable.js only skips the chunk on a 2xx answer
+        _res.code = EAPIResponseCode.success if received else EAPIResponseCode.not_found
+        _res.result = {
+            'resumable_identifier': resumable_identifier,
+            'resumable_chunk_number': resumable_chunk_number,
+            'received': received,
+        }
+        return _res.json_response()
+
+    @router.get(
+        '/files/chunks/advice',
+        tags=[_API_TAG],
+        response_model=ChunkAdviceResponse,
+        summary='get the chunk size and parallelism recommended for an upload.',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def get_chunk_advice(
+        self,
+        resumable_total_size: int,
+        upload_mode: str = EUploadMode.CHUNKS.name,
+        session_id: str = Header(None),
+    ):
+        """This method allow to get the chunk size, number of chunks and parallel requests to upload a file with.
+
+        the advice follows the throughput and error rate measured lately on the chunks of the session.
+        """
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        throughput, error_rate = get_session_rates(await upload_session_stats_get(session_id))
+        _res.code = EAPIResponseCode.success
+        _res.result = {
+            **recommend_chunking(resumable_total_size, upload_mode, throughput, error_rate),
+            'throughput': throughput,
+            'error_rate': round(error_rate, 3),
+        }
+        return _res.json_response()
+
+    @router.get(
+        '/files/chunks/bitmap',
+        tags=[_API_TAG],
+        response_model=ChunkBitmapResponse,
+        summary='get the bitmap of the received chunks to resume an upload.',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def get_chunks_bitmap(
+        self,
+        resumable_identifier: str,
+        resumable_total_chunks: int,
+        session_id: str = Header(None),
+    ):
+        """This method return the received chunks of an upload, bit N-1 (most significant first) is chunk N."""
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        if resumable_total_chunks < 1 or resumable_total_chunks > MULTIPART_MAX_PARTS:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'resumable_total_chunks must be between 1 and {}'.format(MULTIPART_MAX_PARTS)
+            return _res.json_response()
+        bitmap = await upload_chunks_get(resumable_identifier)
+        missing_chunks = get_missing_chunks(bitmap, resumable_total_chunks)
+        _res.code = EAPIResponseCode.success
+        _res.result = {
+            'resumable_identifier': resumable_identifier,
+            'bitmap': base64.b64encode(bitmap).decode('utf-8'),
+            'received_chunks': resumable_total_chunks - len(missing_chunks),
+            'missing_chunks': missing_chunks,
+        }
+        return _res.json_response()
+
+    @router.get(
+        '/files/parts',
+        tags=[_API_TAG],
+        response_model=PresignedPartsResponse,
+        summary='get presigned urls to upload the parts of a PRESIGNED upload straight to the object storage',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def get_presigned_parts(
+        self,
+        project_code: str,
+        operator: str,
+        resumable_identifier: str,
+        resumable_total_chunks: int,
+        session_id: str = Header(None),
+        Authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Header(None),
+    ):
+        """This method allow to get the part upload urls of a PRESIGNED upload job."""
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        if not Authorization:
+            _res.code = EAPIResponseCode.unauthorized
+            _res.result = {}
+            _res.error_msg = 'Authorization is required to sign the part urls'
+            return _res.json_response()
+        if resumable_total_chunks < 1 or resumable_total_chunks > MULTIPART_MAX_PARTS:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'resumable_total_chunks must be between 1 and {}'.format(MULTIPART_MAX_PARTS)
+            return _res.json_response()
 
-        # init status manager
         status_mgr = await get_fsm_object(
             session_id,
             project_code,
@@ -388,18 +913,31 @@ class APIUpload:
             operator,
             resumable_identifier,
         )
-        try:
-            chunk_name = generate_chunk_name(resumable_filename, resumable_chunk_number)
-            destination = await run_in_threadpool(os.path.join, temp_dir, chunk_name)
-            self.__logger.info('Start to save chunk {} to destination {}'.format(chunk_name, destination))
-            await run_in_threadpool(save_file, destination, chunk_data)
-        except Exception as exce:
-            # catch internal error
-            status_mgr.add_payload('error_msg', str(exce))
-            await status_mgr.go(EState.TERMINATED)
-            raise exce
+        if status_mgr.payload.get('upload_mode') != EUploadMode.PRESIGNED.name:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Job {} is not a {} upload'.format(resumable_identifier, EUploadMode.PRESIGNED.name)
+            return _res.json_response()
+
+        expires = timedelta(seconds=ConfigClass.MINIO_PRESIGNED_URL_EXPIRY)
+        parts = await run_in_executor(
+            EXECUTOR_HTTP,
+            get_presigned_part_urls,
+            status_mgr.payload,
+            resumable_total_chunks,
+            expires,
+            Authorization,
+            refresh_token,
+        )
+        # the parts go straight to minio, the signing is all the staging sweeper sees of the upload
+        await upload_progress_set_signed(resumable_identifier)
         _res.code = EAPIResponseCode.success
-        _res.result = {'msg': 'Succeed'}
+        _res.result = {
+            'resumable_identifier': resumable_identifier,
+            'upload_id': status_mgr.payload['upload_id'],
+            'expires_in': ConfigClass.MINIO_PRESIGNED_URL_EXPIRY,
+            'parts': parts,
+        }
         return _res.json_response()
 
     @router.post(
@@ -440,75 +978,1123 @@ class APIUpload:
             else request_payload.resumable_filename
         )
 
-        temp_dir = await get_temp_dir(request_payload.resumable_identifier)
-        project_folder_path = await run_in_threadpool(os.path.join, ConfigClass.ROOT_PATH, request_payload.project_code)
-        file_full_path = await run_in_threadpool(
-            os.path.join,
-            project_folder_path,
-            request_payload.resumable_relative_path,
-            request_payload.resumable_filename,
-        )
-        # relative_full_path = os.path.join(
-        #     request_payload.resumable_relative_path,
-        #     request_payload.resumable_filename)
-
         # init status manager
-        status_mgr = await get_fsm_object(
+        manifest = await get_upload_manifest(request_payload.resumable_identifier)
+        status_mgr = await get_upload_job(
             session_id,
             request_payload.project_code,
-            _JOB_TYPE,
             request_payload.operator,
             request_payload.resumable_identifier,
+            manifest,
+        )
+        _res = await finalize_upload(
+            self.__logger, request_payload, status_mgr, background_tasks, access_token, refresh_token
+        )
+        return _res.json_response()
+
+    @router.post(
+        '/files/{resumable_identifier}/finalize',
+        tags=[_API_TAG],
+        response_model=POSTCombineChunksResponse,
+        summary='create a background worker to combine the chunks of an upload known by its identifier only',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def on_success_by_identifier(
+        self,
+        resumable_identifier: str,
+        background_tasks: BackgroundTasks,
+        resumable_total_chunks: int = None,
+        resumable_total_size: int = None,
+        merkle_root: str = None,
+        session_id: str = Header(None),
+        Authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Header(None),
+    ):
+        """This method allow to create a background worker to combine the chunks of an upload with a manifest.
+
+        the other fields of POST /files come from the manifest recorded at pre upload, the totals are only required
+        when they were not known then.
+        """
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        manifest = await get_upload_manifest(resumable_identifier)
+        if not manifest or manifest['session_id'] != session_id:
+            _res.code = EAPIResponseCode.not_found
+            _res.result = {}
+            _res.error_msg = 'Upload manifest not found: {}'.format(resumable_identifier)
+            return _res.json_response()
+
+        finalize_request = dict(manifest['finalize_request'], merkle_root=merkle_root)
+        if resumable_total_chunks:
+            finalize_request['resumable_total_chunks'] = resumable_total_chunks
+        if resumable_total_size is not None:
+            finalize_request['resumable_total_size'] = resumable_total_size
+        status_mgr = await get_fsm_object_by_key(manifest['job_key'])
+        _res = await finalize_upload(
+            self.__logger,
+            OnSuccessUploadPOST(**finalize_request),
+            status_mgr,
+            background_tasks,
+            Authorization,
+            refresh_token,
         )
-        self.__logger.info('File will be uploaded to %s' % project_folder_path)
+        return _res.json_response()
+
+    @router.post(
+        '/files/small',
+        tags=[_API_TAG],
+        response_model=SmallFileUploadResponse,
+        summary='upload a small file in one request.',
+    )
+    @catch_internal(_API_NAMESPACE)
+    async def upload_small_file(
+        self,
+        project_code: str = Form(...),
+        operator: str = Form(...),
+        resumable_filename: str = Form(...),
+        resumable_relative_path: str = Form(''),
+        tags: List[str] = Form([]),
+        folder_tags: List[str] = Form([]),
+        dcm_id: str = Form('undefined'),
+        process_pipeline: str = Form(None),
+        upload_message: str = Form(''),
+        file_data: UploadFile = File(...),
+        session_id: str = Header(None),
+        Authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Header(None),
+    ):
+        """This method allow to upload a file up to SMALL_FILE_MAX_SIZE bytes without an upload job.
+
+        the conflict check, lock, minio upload and metadata creation happen in this request, the file is never
+        staged on the disk.
+        """
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        content = await file_data.read(ConfigClass.SMALL_FILE_MAX_SIZE + 1)
+        if len(content) > ConfigClass.SMALL_FILE_MAX_SIZE:
+            _res.code = EAPIResponseCode.payload_too_large
+            _res.result = {}
+            _res.error_msg = 'File is larger than {} bytes, use the chunk upload'.format(
+                ConfigClass.SMALL_FILE_MAX_SIZE
+            )
+            return _res.json_response()
+        # the same checks as a pre upload of a single file in one chunk
+        pre_upload = PreUploadPOST(
+            project_code=project_code,
+            operator=operator,
+            job_type=EUploadJobType.AS_FILE.name,
+            folder_tags=folder_tags,
+            data=[
+                SingleFileForm(
+                    resumable_filename=resumable_filename,
+                    resumable_relative_path=resumable_relative_path,
+                    dcm_id=dcm_id,
+                    resumable_total_size=len(content),
+                    resumable_total_chunks=1,
+                )
+            ],
+            upload_message=upload_message,
+            tags=tags,
+            process_pipeline=process_pipeline,
+        )
+        invalid_msg = validate_pre_upload(pre_upload)
+        if invalid_msg:
+            _res.code = EAPIResponseCode.bad_request
+            _res.error_msg = invalid_msg
+            return _res.json_response()
+        project_info = await get_project(project_code)
+        if not project_info:
+            _res.code = EAPIResponseCode.not_found
+            _res.result = {}
+            _res.error_msg = 'Container or Dataset not found'
+            return _res.json_response()
+
+        normalize_pre_upload_filenames(pre_upload)
+        upload_data = pre_upload.data[0]
+        conflict_file_paths = await get_conflict_file_paths(pre_upload.data, project_code)
+        if conflict_file_paths:
+            return response_conflic_folder_file_names(_res, conflict_file_paths, [])
+        if not Authorization:
+            # the file is written to minio with the credentials of the user
+            _res.code = EAPIResponseCode.unauthorized
+            _res.result = {}
+            _res.error_msg = 'Authorization is required for small file upload'
+            return _res.json_response()
+
+        namespace = ConfigClass.disk_namespace
+        bucket = ('gr-' if namespace == 'greenroom' else 'core-') + project_code
+        obj_path = os.path.join(upload_data.resumable_relative_path, upload_data.resumable_filename)
+        lock_key = os.path.join(bucket, obj_path)
+        try:
+            await async_lock_resource(lock_key, 'write')
+        except Exception as e:
+            _res.code = EAPIResponseCode.conflict
+            _res.error_msg = str(e)
+            return _res.json_response()
+        try:
+            folder_mgr = FolderMgr(
+                [], project_info['global_entity_id'], project_code, resumable_relative_path, folder_tags, namespace
+            )
+            await folder_mgr.create(operator)
+            if folder_mgr.to_create:
+                await batch_create_4j_foldernodes(folder_mgr.to_create, folder_mgr.to_create[0]['zone'])
+                await batch_link_folders(folder_mgr.relations_data)
+            parent_folder_geid = folder_mgr.last_node.global_entity_id if folder_mgr.last_node else None
+
+            mc = await run_in_executor(EXECUTOR_HTTP, Minio_Client_, Authorization, refresh_token)
+            result = await run_in_executor(
+                EXECUTOR_HTTP, mc.client.put_object, bucket, obj_path, BytesIO(content), len(content)
+            )
+            self.__logger.info('Minio Upload Success: {}'.format(lock_key))
+
+            request_payload = OnSuccessUploadPOST(
+                project_code=project_code,
+                operator=operator,
+                resumable_identifier='',
+                resumable_filename=upload_data.resumable_filename,
+                resumable_relative_path=resumable_relative_path,
+                resumable_total_chunks=1,
+                resumable_total_size=len(content),
+                tags=tags,
+                dcm_id=dcm_id,
+                process_pipeline=process_pipeline,
+                upload_message=upload_message,
+            )
+            target_file_full_path = os.path.join(ConfigClass.ROOT_PATH, project_code, obj_path)
+            try:
+                created_entity = await register_uploaded_file(
+                    self.__logger,
+                    request_payload,
+                    target_file_full_path,
+                    bucket,
+                    obj_path,
+                    result.version_id,
+                    parent_folder_geid,
+                    BytesIO(content),
+                    Authorization,
+                    refresh_token,
+                    # the root of a single chunk is its digest
+                    get_merkle_root([hashlib.sha256(content).hexdigest()]),
+                )
+            except Exception:
+                # without metadata nothing points to the object, so it would never be cleaned up
+                try:
+                    await run_in_executor(EXECUTOR_HTTP, mc.client.remove_object, bucket, obj_path, result.version_id)
+                except Exception as e:
+                    self.__logger.error('error when removing the unregistered object: ' + str(e))
+                raise
+        finally:
+            await async_unlock_resource(lock_key, 'write')
+
+        _res.code = EAPIResponseCode.success
+        _res.result = created_entity
+        return _res.json_response()
+
+
+def normalize_pre_upload_filenames(request_payload: PreUploadPOST):
+    """convert the filenames of a pre upload into the names of the uploaded files."""
+    for upload_data in request_payload.data:
+        # here I have to update the special character into NFC form
+        # since some of the browser will encode them into NFD form
+        # for the bug detail. Please check the 2244
+        upload_data.resumable_filename = ud.normalize('NFC', upload_data.resumable_filename)
+        upload_data.resumable_filename = (
+            upload_data.dcm_id + '_' + upload_data.resumable_filename
+            if upload_data.dcm_id and upload_data.dcm_id != 'undefined'
+            else upload_data.resumable_filename
+        )
+
+
+async def get_pre_upload_minio_client(request_payload: PreUploadPOST, access_token, refresh_token):
+    """return the minio client of the user if some files of the pre upload go to minio as parts, None otherwise."""
+    if not access_token:
+        return None
+    if request_payload.upload_mode in _OBJECT_STORAGE_MODES or any(
+        is_pipelined_upload(request_payload.upload_mode, upload_data) for upload_data in request_payload.data
+    ):
+        return await run_in_executor(EXECUTOR_HTTP, Minio_Client_, access_token, refresh_token)
+    return None
+
+
+async def reserve_staging(logger, request_payload: PreUploadPOST, resumable_identifiers: list):
+    """reserve the staging space of the files of a pre upload, return the identifiers staged in memory and the error
+    response if the staging is full, None otherwise.
+
+    the small files are staged in memory as long as the memory budget lasts, the others spill to the disk.
+    """
+    memory_identifiers = []
+    if request_payload.upload_mode == EUploadMode.CHUNKS.name:
+        for resumable_identifier, upload_data in zip(resumable_identifiers, request_payload.data):
+            total_size = upload_data.resumable_total_size
+            if (
+                total_size
+                and total_size <= ConfigClass.MEMORY_STAGING_MAX_SIZE
+                and await memory_reserve({resumable_identifier: total_size}, ConfigClass.MEMORY_STAGING_BUDGET)
+            ):
+                memory_identifiers.append(resumable_identifier)
+    if request_payload.upload_mode in _OBJECT_STORAGE_MODES:
+        return memory_identifiers, None
+    # the reservation of a file without total size grows as its chunks are saved
+    reservations = {
+        resumable_identifier: (
+            ConfigClass.STAGING_DEFAULT_RESERVATION
+            if upload_data.resumable_total_size is None
+            else upload_data.resumable_total_size
+        )
+        for resumable_identifier, upload_data in zip(resumable_identifiers, request_payload.data)
+        if resumable_identifier not in memory_identifiers
+    }
+    budget, free_space = await run_in_executor(EXECUTOR_DISK, get_staging_space)
+    requested = sum(reservations.values())
+    _res = APIResponse()
+    if requested > budget:
+        _res.code = EAPIResponseCode.payload_too_large
+        _res.result = {}
+        _res.error_msg = 'Upload of {} bytes exceeds the staging capacity of {} bytes'.format(requested, budget)
+        await staging_release(memory_identifiers)
+        return memory_identifiers, _res.json_response()
+    if requested > free_space or not await staging_reserve(reservations, budget):
+        logger.warning('Staging disk is full, {} bytes are not reserved'.format(requested))
+        _res.code = EAPIResponseCode.service_unavailable
+        _res.result = {}
+        _res.error_msg = 'Staging disk is full, retry later'
+        await staging_release(memory_identifiers)
+        response = _res.json_response()
+        response.headers['Retry-After'] = str(ConfigClass.STAGING_RETRY_AFTER)
+        return memory_identifiers, response
+    return memory_identifiers, None
+
+
+async def open_job_multipart_upload(
+    status_mgr: FsmMgrUpload, mc, bucket: str, object_path: str, multipart_uploads: list
+):
+    """open the multipart upload of a job in minio and record it in the job and in multipart_uploads."""
+    upload_id = await run_in_executor(EXECUTOR_HTTP, mc.create_multipart_upload, bucket, object_path)
+    multipart_uploads.append((bucket, object_path, upload_id))
+    status_mgr.add_payload('bucket', bucket)
+    status_mgr.add_payload('object_path', object_path)
+    status_mgr.add_payload('upload_id', upload_id)
+
+
+async def prepare_upload_job(
+    status_mgr: FsmMgrUpload,
+    upload_data,
+    temp_dir: str,
+    bucket: str,
+    object_path: str,
+    in_memory: bool,
+    mc,
+    multipart_uploads: list,
+):
+    """record in a job where its chunks go for its upload mode: minio, memory or the staging disk."""
+    upload_mode = status_mgr.payload['upload_mode']
+    if upload_mode in _OBJECT_STORAGE_MODES:
+        # no staging on disk, the chunks go to minio as parts
+        await open_job_multipart_upload(status_mgr, mc, bucket, object_path, multipart_uploads)
+    elif in_memory:
+        # no staging on disk, the chunks are kept in redis
+        status_mgr.add_payload('staging_tier', STAGING_TIER_MEMORY)
+        status_mgr.add_payload('total_size', upload_data.resumable_total_size)
+    else:
+        await prepare_staged_job(status_mgr, upload_data, temp_dir, bucket, object_path, mc, multipart_uploads)
+    # chunks of a preallocated or tus upload go straight into the target file
+    if upload_mode in (EUploadMode.PREALLOCATED.name, EUploadMode.TUS.name):
+        target_file = os.path.join(temp_dir, upload_data.resumable_filename)
+        await run_in_executor(EXECUTOR_DISK, preallocate_file, target_file, upload_data.resumable_total_size)
+
+
+async def prepare_staged_job(
+    status_mgr: FsmMgrUpload,
+    upload_data,
+    temp_dir: str,
+    bucket: str,
+    object_path: str,
+    mc,
+    multipart_uploads: list,
+):
+    """create the staging dir of a job with its chunks staged on disk, and its pipeline to minio if any."""
+    # the later requests find the staging dir in the job instead of computing it
+    status_mgr.add_payload('staging_dir', temp_dir)
+    is_dir_exist = await run_in_executor(EXECUTOR_DISK, os.path.isdir, temp_dir)
+    if not is_dir_exist:
+        await run_in_executor(EXECUTOR_DISK, os.makedirs, temp_dir)
+    if mc is not None and is_pipelined_upload(status_mgr.payload['upload_mode'], upload_data):
+        # the chunks also go to minio as parts while the later ones are uploaded
+        await open_job_multipart_upload(status_mgr, mc, bucket, object_path, multipart_uploads)
+        status_mgr.add_payload('pipelined', True)
+        status_mgr.add_payload('total_size', upload_data.resumable_total_size)
+        status_mgr.add_payload('total_chunks', upload_data.resumable_total_chunks)
+
+
+def get_pre_upload_finalize_request(
+    request_payload: PreUploadPOST, upload_data, resumable_identifier: str
+) -> OnSuccessUploadPOST:
+    """return what POST /files would send, to finalize without the client sending it again."""
+    return OnSuccessUploadPOST(
+        project_code=request_payload.project_code,
+        operator=request_payload.operator,
+        resumable_identifier=resumable_identifier,
+        resumable_filename=upload_data.resumable_filename,
+        resumable_relative_path=upload_data.resumable_relative_path,
+        resumable_total_chunks=upload_data.resumable_total_chunks or 1,
+        resumable_total_size=upload_data.resumable_total_size or 0,
+        tags=request_payload.tags,
+        dcm_id=upload_data.dcm_id,
+        process_pipeline=request_payload.process_pipeline,
+        from_parents=request_payload.from_parents,
+        upload_message=request_payload.upload_message,
+    )
+
+
+async def create_pre_upload_job(
+    session_id: str,
+    request_payload: PreUploadPOST,
+    upload_data,
+    resumable_identifier: str,
+    relative_full_path: str,
+    task_id: str,
+    parent_folder_geid: str,
+    finalize_request: OnSuccessUploadPOST,
+) -> FsmMgrUpload:
+    """return the job of a file of a pre upload, its payload set for its upload mode."""
+    # init empty status manager
+    status_mgr = await get_fsm_object(
+        session_id,
+        request_payload.project_code,
+        _JOB_TYPE,
+        request_payload.operator,
+    )
+    # first time need to call set_job_id
+    await status_mgr.set_job_id(resumable_identifier)
+    status_mgr.set_source(relative_full_path)
+    status_mgr.add_payload('task_id', task_id)
+    status_mgr.add_payload('resumable_identifier', resumable_identifier)
+    status_mgr.add_payload('parent_folder_geid', parent_folder_geid)
+    status_mgr.add_payload('upload_mode', request_payload.upload_mode)
+    if request_payload.upload_mode != EUploadMode.CHUNKS.name:
+        status_mgr.add_payload('total_size', upload_data.resumable_total_size)
+        status_mgr.add_payload('chunk_size', upload_data.resumable_chunk_size)
+    elif upload_data.resumable_total_size is None:
+        status_mgr.add_payload('staging_estimated', True)
+    # a tus upload is finalized by the request which appends its last byte
+    if request_payload.auto_finalize or request_payload.upload_mode == EUploadMode.TUS.name:
+        # without the defaults, the empty tags list would come back as an object from the progress script
+        status_mgr.add_payload('finalize_request', finalize_request.dict(exclude_defaults=True))
+    return status_mgr
+
+
+def record_pre_upload_job(
+    redis_pipeline, status_mgr: FsmMgrUpload, session_id: str, finalize_request: OnSuccessUploadPOST, manifests: dict
+) -> dict:
+    """add the job and its manifest to the redis pipeline of the pre upload and to manifests, return the job record."""
+    job_key, job_value, job_recorded = status_mgr.get_kv_entity()
+    redis_pipeline.set(job_key, job_value)
+    # the chunk and finalize requests of the upload only send its identifier
+    resumable_identifier = status_mgr.payload['resumable_identifier']
+    manifests[resumable_identifier] = {
+        'session_id': session_id,
+        'job_key': job_key,
+        'finalize_request': finalize_request.dict(),
+    }
+    redis_pipeline.set(get_upload_manifest_key(resumable_identifier), json.dumps(manifests[resumable_identifier]))
+    return job_recorded
+
+
+async def release_pre_upload(logger, locked_nodes: list, resumable_identifiers: list, mc, multipart_uploads: list):
+    """drop what a failed pre upload holds: the locks, the staging reservations and the opened multipart uploads."""
+    for resource_key, operation in locked_nodes:
+        await async_unlock_resource(resource_key, operation)
+    await staging_release(resumable_identifiers)
+    await abort_multipart_uploads(logger, mc, multipart_uploads)
+
+
+async def finalize_upload(
+    logger,
+    request_payload: OnSuccessUploadPOST,
+    status_mgr: FsmMgrUpload,
+    background_tasks: BackgroundTasks,
+    access_token,
+    refresh_token,
+) -> APIResponse:
+    """check that all the data of a job was received and start its finalize_worker, return the response.
+
+    the resumable_filename of the request payload must already be normalized.
+    """
+    _res = APIResponse()
+    if status_mgr.status in _FINALIZE_STARTED_STATES:
+        logger.info('finalize_worker already started for %s' % request_payload.resumable_identifier)
+        _, _, job_recorded = status_mgr.get_kv_entity()
+        _res.code = EAPIResponseCode.success
+        _res.result = job_recorded
+        return _res
+    upload_mode = status_mgr.payload.get('upload_mode', EUploadMode.CHUNKS.name)
+    if upload_mode == EUploadMode.TUS.name:
+        tus_resource = await upload_tus_get(request_payload.resumable_identifier)
+        upload_offset = int(tus_resource.get('offset', 0))
+        if upload_offset != status_mgr.payload['total_size']:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {'upload_offset': upload_offset}
+            _res.error_msg = 'Upload is incomplete for job {}'.format(request_payload.resumable_identifier)
+            return _res
+    # the parts of a presigned upload never go through the service
+    elif upload_mode != EUploadMode.PRESIGNED.name:
+        bitmap = await upload_chunks_get(request_payload.resumable_identifier)
+        # jobs created before the bitmap was recorded have no bitmap at all
+        missing_chunks = (
+            get_missing_chunks(bitmap, request_payload.resumable_total_chunks)
+            if bitmap or upload_mode != EUploadMode.CHUNKS.name
+            else []
+        )
+        if missing_chunks:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {'missing_chunks': missing_chunks}
+            _res.error_msg = 'Chunks are missing for job {}'.format(request_payload.resumable_identifier)
+            return _res
+
+    if request_payload.merkle_root:
+        merkle_root = await get_upload_merkle_root(
+            request_payload.resumable_identifier, request_payload.resumable_total_chunks
+        )
+        if merkle_root != request_payload.merkle_root:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {'merkle_root': merkle_root}
+            _res.error_msg = 'Merkle root mismatch for job {}'.format(request_payload.resumable_identifier)
+            return _res
+
+    # the upload may already be finalized by the request of its last chunk
+    if not await upload_finalize_claim(request_payload.resumable_identifier):
+        logger.info('finalize_worker already started for %s' % request_payload.resumable_identifier)
+        _, _, job_recorded = status_mgr.get_kv_entity()
+        _res.code = EAPIResponseCode.success
+        _res.result = job_recorded
+        return _res
+
+    job_recorded = await start_finalize_worker(
+        logger, request_payload, status_mgr, background_tasks, access_token, refresh_token
+    )
+    _res.code = EAPIResponseCode.success
+    _res.result = job_recorded
+    return _res
+
+
+async def start_finalize_worker(
+    logger,
+    request_payload: OnSuccessUploadPOST,
+    status_mgr: FsmMgrUpload,
+    background_tasks: BackgroundTasks,
+    access_token,
+    refresh_token,
+):
+    """schedule the finalize_worker of a job with all its chunks received, return the job record.
+
+    the finalize goes to the finalize queue when it is enabled, in a background task of the request otherwise. The
+    resumable_filename of the request payload must already be normalized.
+    """
+    logger.info('resumable_filename: %s' % request_payload.resumable_filename)
+    # set merging status before a finalize worker can take the job
+    status_mgr.set_progress(100)
+    job_recorded = await status_mgr.go(EState.CHUNK_UPLOADED)
+
+    if ConfigClass.FINALIZE_QUEUE_ENABLED:
+        job_key, _, _ = status_mgr.get_kv_entity()
+        entry_id = await finalize_queue_add(job_key, request_payload.dict(), access_token, refresh_token)
+        logger.info('finalize of {} queued as {}'.format(request_payload.resumable_identifier, entry_id))
+        return job_recorded
+
+    chunk_paths, file_full_path, temp_dir = await get_finalize_paths(request_payload, status_mgr)
+    logger.info('File will be uploaded to %s' % file_full_path)
+    # add background task to combine all received chunks
+    background_tasks.add_task(
+        finalize_worker,
+        logger,
+        request_payload,
+        status_mgr,
+        chunk_paths,
+        file_full_path,
+        temp_dir,
+        access_token,
+        refresh_token,
+    )
+    logger.info('finalize_worker started')
+    return job_recorded
+
+
+async def get_finalize_paths(request_payload: OnSuccessUploadPOST, status_mgr: FsmMgrUpload):
+    """return the staged chunk files to merge, the target path and the staging directory of a job to finalize."""
+    temp_dir = await get_temp_dir(request_payload.resumable_identifier, status_mgr.payload)
+    project_folder_path = os.path.join(ConfigClass.ROOT_PATH, request_payload.project_code)
+    file_full_path = os.path.join(
+        project_folder_path, request_payload.resumable_relative_path, request_payload.resumable_filename
+    )
+    # the chunks of the other upload modes are already in the target file, in minio or in redis, the ones of a
+    # pipelined upload are forwarded to minio by the pipeline
+    chunk_paths = []
+    if (
+        status_mgr.payload.get('upload_mode', EUploadMode.CHUNKS.name) == EUploadMode.CHUNKS.name
+        and status_mgr.payload.get('staging_tier') != STAGING_TIER_MEMORY
+        and not status_mgr.payload.get('pipelined')
+    ):
         chunk_paths = [
-            await run_in_threadpool(os.path.join, temp_dir, generate_chunk_name(request_payload.resumable_filename, x))
+            os.path.join(temp_dir, generate_chunk_name(request_payload.resumable_filename, x))
             for x in range(1, request_payload.resumable_total_chunks + 1)
         ]
+    return chunk_paths, file_full_path, temp_dir
 
-        self.__logger.info('resumable_filename: %s' % request_payload.resumable_filename)
-        # self.__logger.info(chunk_paths)
 
-        # add background task to combine all received chunks
+def is_pipelined_upload(upload_mode: str, upload_data) -> bool:
+    """return True if the chunks of the file are forwarded to minio while the upload goes on."""
+    return (
+        ConfigClass.FINALIZE_PIPELINE_ENABLED
+        and upload_mode == EUploadMode.CHUNKS.name
+        and bool(upload_data.resumable_total_size)
+        and bool(upload_data.resumable_total_chunks)
+        and os.path.splitext(upload_data.resumable_filename)[1] != '.zip'
+    )
+
+
+def validate_pre_upload(request_payload: PreUploadPOST):
+    """return an error message if the upload mode or auto finalize can not be used for the files, None otherwise."""
+    if request_payload.upload_mode not in EUploadMode.__members__:
+        return 'Invalid upload mode: {}'.format(request_payload.upload_mode)
+    for upload_data in request_payload.data:
+        if request_payload.auto_finalize and (
+            upload_data.resumable_total_size is None or not upload_data.resumable_total_chunks
+        ):
+            return 'resumable_total_size and resumable_total_chunks are required for auto finalize: {}'.format(
+                upload_data.resumable_filename
+            )
+        if request_payload.upload_mode == EUploadMode.CHUNKS.name:
+            continue
+        if request_payload.upload_mode == EUploadMode.TUS.name:
+            if upload_data.resumable_total_size is None:
+                return 'resumable_total_size is required for TUS upload: {}'.format(upload_data.resumable_filename)
+            continue
+        if upload_data.resumable_total_size is None or not upload_data.resumable_chunk_size:
+            return 'resumable_total_size and resumable_chunk_size are required for {} upload: {}'.format(
+                request_payload.upload_mode, upload_data.resumable_filename
+            )
+        # only the last part of a multipart upload can be smaller than 5MiB
+        if (
+            request_payload.upload_mode in _OBJECT_STORAGE_MODES
+            and upload_data.resumable_chunk_size < MIN_PART_SIZE
+            and upload_data.resumable_total_size > upload_data.resumable_chunk_size
+        ):
+            return 'resumable_chunk_size must be at least {} bytes for {} upload: {}'.format(
+                MIN_PART_SIZE, request_payload.upload_mode, upload_data.resumable_filename
+            )
+    return None
+
+
+def get_chunk_filename(resumable_filename: str, dcm_id: str) -> str:
+    """return the filename the chunks of an upload are saved under."""
+    # here I have to update the special character into NFC form
+    # since some of the browser will encode them into NFD form
+    # for the bug detail. Please check the ticket 2244
+    resumable_filename = ud.normalize('NFC', resumable_filename)
+    # check pipeline id
+    return dcm_id + '_' + resumable_filename if dcm_id and dcm_id != 'undefined' else resumable_filename
+
+
+async def receive_ws_message(websocket: WebSocket, kind: str):
+    """return the text or bytes of the next websocket message, raise ValueError if it is of the other kind."""
+    message = await websocket.receive()
+    if message['type'] == 'websocket.disconnect':
+        raise WebSocketDisconnect(message.get('code', status.WS_1000_NORMAL_CLOSURE))
+    if message.get(kind) is None:
+        raise ValueError('expected a {} message'.format(kind))
+    return message[kind]
+
+
+def run_detached(logger, background_tasks: BackgroundTasks):
+    """run the background tasks of a request which has no response to run them after, their errors are logged."""
+    task = asyncio.ensure_future(background_tasks())
+    _detached_tasks.add(task)
+
+    def on_done(done_task):
+        _detached_tasks.discard(done_task)
+        if not done_task.cancelled() and done_task.exception():
+            logger.error('Background task failed: ' + str(done_task.exception()))
+
+    task.add_done_callback(on_done)
+
+
+def get_manifest_filename(manifest: dict, resumable_filename: str, dcm_id: str) -> str:
+    """return the filename the chunks of an upload are saved under, the normalized one of its manifest if any."""
+    if manifest:
+        return manifest['finalize_request']['resumable_filename']
+    return get_chunk_filename(resumable_filename, dcm_id)
+
+
+async def get_upload_job(
+    session_id: str, project_code: str, operator: str, resumable_identifier: str, manifest: dict
+) -> FsmMgrUpload:
+    """return the job of an upload, read by the key in its manifest instead of looked up by prefix if any."""
+    if manifest and manifest['session_id'] == session_id:
+        return await get_fsm_object_by_key(manifest['job_key'])
+    return await get_fsm_object(session_id, project_code, _JOB_TYPE, operator, resumable_identifier)
+
+
+def parse_chunk_frame(frame: bytes):
+    """split a websocket chunk message, return its json header and the chunk data.
+
+    the message is the size of the header as 4 bytes big-endian integer, the utf-8 json header with
+    resumable_identifier, resumable_chunk_number and, for the jobs without a manifest, resumable_filename and the
+    optional dcm_id, then the chunk data.
+    """
+    header_end = 4 + int.from_bytes(frame[:4], 'big')
+    header = json.loads(frame[4:header_end].decode('utf-8'))
+    return header, memoryview(frame)[header_end:]
+
+
+def check_chunk_request(job_payload: dict, chunk_number: int, access_token: str):
+    """raise ChunkRequestError if the chunk can not be saved for the job.
+
+    the chunks of every mode are numbered like the parts of a multipart upload, from 1 to MULTIPART_MAX_PARTS, and
+    up to the number of chunks of the job when it knows it.
+    """
+    if chunk_number < 1 or chunk_number > MULTIPART_MAX_PARTS:
+        raise ChunkRequestError('Invalid chunk number: {}'.format(chunk_number))
+    total_chunks = (job_payload.get('finalize_request') or {}).get('resumable_total_chunks')
+    total_size, chunk_size = job_payload.get('total_size'), job_payload.get('chunk_size')
+    if not total_chunks and total_size and chunk_size:
+        # the client may as well send the remainder in a chunk of its own
+        total_chunks = -(-total_size // chunk_size)
+    if total_chunks and chunk_number > total_chunks:
+        raise ChunkRequestError('Chunk number {} exceeds the {} chunks of the job'.format(chunk_number, total_chunks))
+    if job_payload.get('upload_mode') in _OBJECT_STORAGE_MODES:
+        # the parts are written to minio with the credentials of the user
+        if not access_token:
+            raise ChunkRequestError('Authorization is required to upload the chunks to minio')
+
+
+def check_chunk_header(header: dict):
+    """raise ValueError if the metadata of a chunk sent along other chunks is incomplete."""
+    if not isinstance(header, dict):
+        raise ValueError('chunk header must be an object')
+    for field in ('resumable_identifier', 'resumable_chunk_number'):
+        if field not in header:
+            raise ValueError('{} is missing'.format(field))
+    if not isinstance(header['resumable_chunk_number'], int):
+        raise ValueError('resumable_chunk_number must be an integer')
+
+
+async def save_session_chunk(
+    logger,
+    status_mgrs: dict,
+    minio_clients: dict,
+    session_id: str,
+    project_code: str,
+    operator: str,
+    header: dict,
+    source,
+    background_tasks: BackgroundTasks,
+    access_token,
+    refresh_token,
+) -> dict:
+    """save one of the chunks sent together over a session, return its result entry.
+
+    header may carry the base64 md5 of the chunk as content_md5 and its gzip or zstd compression as
+    content_encoding. status_mgrs caches the jobs already read by {resumable_identifier: status_mgr} and
+    minio_clients the minio client of the user, see save_chunk. A failing chunk only fails its own entry.
+    """
+    resumable_identifier = header['resumable_identifier']
+    resumable_chunk_number = header['resumable_chunk_number']
+    entry = {'resumable_identifier': resumable_identifier, 'resumable_chunk_number': resumable_chunk_number}
+    content_encoding = header.get('content_encoding')
+    if content_encoding and content_encoding not in CHUNK_CONTENT_ENCODINGS:
+        entry['code'] = EAPIResponseCode.unsupported_media_type.value
+        entry['error_msg'] = 'Unsupported content_encoding: {}'.format(content_encoding)
+        return entry
+    manifest = await get_upload_manifest(resumable_identifier)
+    if not manifest and 'resumable_filename' not in header:
+        entry['code'] = EAPIResponseCode.bad_request.value
+        entry['error_msg'] = 'resumable_filename is missing'
+        return entry
+    try:
+        if resumable_identifier not in status_mgrs:
+            status_mgrs[resumable_identifier] = await get_upload_job(
+                session_id, project_code, operator, resumable_identifier, manifest
+            )
+        entry['result'] = await save_chunk(
+            logger,
+            status_mgrs[resumable_identifier],
+            resumable_identifier,
+            get_manifest_filename(manifest, header.get('resumable_filename'), header.get('dcm_id', 'undefined')),
+            resumable_chunk_number,
+            source,
+            background_tasks,
+            access_token,
+            refresh_token,
+            header.get('content_md5'),
+            content_encoding=content_encoding,
+            minio_clients=minio_clients,
+        )
+        entry['code'] = EAPIResponseCode.success.value
+    except (ChunkDigestError, ChunkEncodingError, ChunkRequestError) as exce:
+        entry['code'] = EAPIResponseCode.bad_request.value
+        entry['error_msg'] = str(exce)
+    except Exception as exce:
+        logger.error('Failed to save chunk {} of {}: {}'.format(resumable_chunk_number, resumable_identifier, exce))
+        entry['code'] = EAPIResponseCode.internal_error.value
+        entry['error_msg'] = str(exce)
+    return entry
+
+
+def get_job_totals(job_payload: dict):
+    """return the total size and number of chunks of a job, None when the job does not know them."""
+    finalize_request = job_payload.get('finalize_request') or {}
+    total_size = job_payload.get('total_size') or finalize_request.get('resumable_total_size')
+    total_chunks = finalize_request.get('resumable_total_chunks')
+    if not total_chunks and total_size and job_payload.get('chunk_size'):
+        # resumable.js lets the last chunk absorb the remainder
+        total_chunks = max(total_size // job_payload['chunk_size'], 1)
+    return total_size, total_chunks
+
+
+async def get_chunk_minio_client(job_payload: dict, access_token, refresh_token, minio_clients: dict = None):
+    """return the minio client of the user for the upload modes which write the chunks to minio, None otherwise."""
+    if job_payload.get('upload_mode') not in _OBJECT_STORAGE_MODES:
+        return None
+    if minio_clients is None:
+        minio_clients = {}
+    if access_token not in minio_clients:
+        minio_clients[access_token] = await run_in_executor(EXECUTOR_HTTP, Minio_Client_, access_token, refresh_token)
+    return minio_clients[access_token]
+
+
+def get_decoded_chunk_limit(job_payload: dict, total_size: int = None) -> int:
+    """return the most bytes a compressed chunk of the job can decompress to."""
+    total_size = total_size or get_job_totals(job_payload)[0]
+    if total_size:
+        return total_size
+    if job_payload.get('chunk_size'):
+        # resumable.js lets the last chunk absorb the remainder
+        return 2 * job_payload['chunk_size']
+    return ConfigClass.CHUNK_MAX_DECODED_SIZE
+
+
+async def save_chunk(
+    logger,
+    status_mgr: FsmMgrUpload,
+    resumable_identifier: str,
+    resumable_filename: str,
+    chunk_number: int,
+    source,
+    background_tasks: BackgroundTasks,
+    access_token,
+    refresh_token,
+    content_md5: str = None,
+    total_chunks: int = None,
+    total_size: int = None,
+    content_encoding: str = None,
+    minio_clients: dict = None,
+) -> dict:
+    """save a chunk for the upload mode of the job, return the result of the response.
+
+    source is either a file-like object or an async iterator of bytes. content_md5 is the optional base64 md5 of
+    the chunk sent by the client, ChunkDigestError is raised when the data does not match it. total_chunks and
+    total_size are only needed for the jobs which do not know them.
+
+    a gzip or zstd content_encoding source is decompressed on the way to the sink, the digests, the progress and
+    the total size check are the ones of the decompressed data. ChunkEncodingError is raised when it is invalid.
+    ChunkRequestError is raised when the chunk number is out of range, the chunk is larger than its job or the
+    staging disk allows or the tokens needed by the upload mode are missing. These errors leave the job as it is.
+
+    minio_clients caches the minio client of the user by access token for the requests which bring several chunks.
+    """
+    check_chunk_request(status_mgr.payload, chunk_number, access_token)
+    temp_dir = await get_temp_dir(resumable_identifier, status_mgr.payload)
+    try:
+        mc = await get_chunk_minio_client(status_mgr.payload, access_token, refresh_token, minio_clients)
+        chunk_sink = await run_in_executor(
+            EXECUTOR_DISK, open_chunk_sink, status_mgr.payload, temp_dir, resumable_filename, chunk_number, mc
+        )
+        logger.info(
+            'Start to save chunk {} of {} with {}'.format(chunk_number, resumable_filename, type(chunk_sink).__name__)
+        )
+        sink = DigestSink(chunk_sink)
+        writer = sink
+        if content_encoding and content_encoding != 'identity':
+            writer = DecodingSink(sink, content_encoding, get_decoded_chunk_limit(status_mgr.payload, total_size))
+        if hasattr(source, 'read'):
+            await run_in_executor(writer.executor, copy_to_sink, source, writer)
+        else:
+            await stream_to_sink(source, writer)
+        if isinstance(writer, DecodingSink):
+            writer.check_complete()
+        sink.check_md5(content_md5)
+        if status_mgr.payload.get('staging_estimated'):
+            await check_staging_reservation(resumable_identifier, sink.size)
+        if isinstance(chunk_sink, MemoryChunkSink):
+            await upload_memory_chunk_set(resumable_identifier, chunk_number, bytes(chunk_sink.buffer))
+        if isinstance(chunk_sink, MultipartPartSink):
+            # a PRESIGNED upload can still fall back to send its chunks through the service
+            await upload_parts_set(resumable_identifier, chunk_number, chunk_sink.etag)
+    except (ChunkDigestError, ChunkEncodingError, ChunkRequestError):
+        # a corrupt or oversized chunk only fails itself, the client can send it again
+        await upload_session_stats_record(status_mgr.session_id, 0, failed=True)
+        raise
+    except Exception as exce:
+        # catch internal error
+        await upload_session_stats_record(status_mgr.session_id, 0, failed=True)
+        status_mgr.add_payload('error_msg', str(exce))
+        await status_mgr.go(EState.TERMINATED)
+        await staging_release([resumable_identifier])
+        raise exce
+    job_key, _, _ = status_mgr.get_kv_entity()
+    is_new_chunk, received_chunks = await upload_chunks_set(
+        resumable_identifier,
+        chunk_number,
+        sink.sha256.hexdigest(),
+        sink.size,
+        total_chunks or get_job_totals(status_mgr.payload)[1],
+        job_key,
+        status_mgr.session_id,
+    )
+    result = {'msg': 'Succeed'}
+    if status_mgr.payload.get('pipelined') and is_new_chunk and access_token:
         background_tasks.add_task(
-            finalize_worker,
-            self.__logger,
-            request_payload,
-            status_mgr,
-            chunk_paths,
-            file_full_path,
-            temp_dir,
+            run_pipeline,
+            logger,
+            status_mgr.payload,
+            resumable_filename,
+            status_mgr.payload['total_chunks'],
             access_token,
             refresh_token,
         )
 
-        self.__logger.info('finalize_worker started')
-        # set merging status
-        job_recorded = await status_mgr.go(EState.CHUNK_UPLOADED)
-        _res.code = EAPIResponseCode.success
-        _res.result = job_recorded
-        self.__logger.info('wait for response')
-        return _res.json_response()
+    # the request which brings the last missing chunk finalizes the upload
+    # on behalf of the client. The token is needed by the finalize_worker.
+    # The bitmap count is only a hint, the chunks 1..N are checked one by one
+    finalize_request = status_mgr.payload.get('finalize_request')
+    if (
+        finalize_request
+        and access_token
+        and is_new_chunk
+        and received_chunks >= finalize_request['resumable_total_chunks']
+        and not get_missing_chunks(
+            await upload_chunks_get(resumable_identifier), finalize_request['resumable_total_chunks']
+        )
+        and await upload_finalize_claim(resumable_identifier)
+    ):
+        logger.info('Last chunk received, start to finalize {}'.format(resumable_identifier))
+        await start_finalize_worker(
+            logger,
+            OnSuccessUploadPOST(**finalize_request),
+            status_mgr,
+            background_tasks,
+            access_token,
+            refresh_token,
+        )
+        result['auto_finalize'] = True
+    return result
 
 
-def generate_chunk_name(uploaded_filename, chunk_number):
-    """generate chunk file name."""
-    return uploaded_filename + '_part_%03d' % chunk_number
+async def check_staging_reservation(resumable_identifier: str, chunk_size: int):
+    """grow the staging disk reserved by an upload which did not tell its total size to take a chunk of chunk_size
+    bytes more, raise ChunkRequestError when the staging disk can not take it."""
+    raw_progress = (await upload_progress_get_many([resumable_identifier]))[0]
+    staged_size = int(raw_progress.get('bytes_received', 0)) + chunk_size
+    budget, _ = await run_in_executor(EXECUTOR_DISK, get_staging_space)
+    if not await staging_grow(resumable_identifier, staged_size, ConfigClass.STAGING_DEFAULT_RESERVATION, budget):
+        raise ChunkRequestError('Upload of {} bytes exceeds the staging capacity, retry later'.format(staged_size))
 
 
-async def async_get_temp_dir(resumable_identifier):
-    return await run_in_threadpool(get_temp_dir, resumable_identifier)
+async def async_get_temp_dir(resumable_identifier, job_payload: dict = None):
+    return await get_temp_dir(resumable_identifier, job_payload)
 
 
-async def get_temp_dir(resumable_identifier):
+async def get_temp_dir(resumable_identifier, job_payload: dict = None):
     """get temp directory."""
-    return await run_in_threadpool(os.path.join, ConfigClass.TEMP_BASE, resumable_identifier)
+    return get_staging_dir(resumable_identifier, job_payload)
+
+
+def get_presigned_part_urls(
+    job_payload: dict, total_chunks: int, expires: timedelta, access_token: str, refresh_token: str
+) -> list:
+    """return the presigned urls, signed with the minio credentials of the user, of every part of a PRESIGNED
+    upload."""
+    mc = Minio_Client_(access_token, refresh_token)
+    return [
+        {
+            'part_number': part_number,
+            'url': mc.presigned_upload_part_url(
+                job_payload['bucket'], job_payload['object_path'], job_payload['upload_id'], part_number, expires
+            ),
+        }
+        for part_number in range(1, total_chunks + 1)
+    ]
+
+
+async def complete_multipart_upload(
+    logger, status_mgr: FsmMgrUpload, total_chunks: int, access_token: str, refresh_token: str
+):
+    """assemble the object of a multipart upload from its parts, return its version id."""
+    job_payload = status_mgr.payload
+    mc = await run_in_executor(EXECUTOR_HTTP, Minio_Client_, access_token, refresh_token)
+    if job_payload.get('upload_mode') == EUploadMode.PRESIGNED.name:
+        # the client sent the parts to minio directly so only minio knows their etags
+        parts = await run_in_executor(
+            EXECUTOR_HTTP, mc.list_parts, job_payload['bucket'], job_payload['object_path'], job_payload['upload_id']
+        )
+    else:
+        parts = await upload_parts_get(job_payload['resumable_identifier'])
+    missing_parts = [x for x in range(1, total_chunks + 1) if x not in parts]
+    if missing_parts:
+        raise Exception('multipart upload is missing parts: {}'.format(missing_parts))
+    status_mgr.add_payload('parts', {str(part_number): etag for part_number, etag in parts.items()})
+    result = await run_in_executor(
+        EXECUTOR_HTTP,
+        mc.complete_multipart_upload,
+        job_payload['bucket'],
+        job_payload['object_path'],
+        job_payload['upload_id'],
+        parts,
+    )
+    logger.info('Minio multipart upload completed')
+    return result.version_id
+
+
+async def abort_multipart_upload(logger, status_mgr: FsmMgrUpload, access_token: str, refresh_token: str):
+    """drop the parts of a failed multipart upload from minio."""
+    job_payload = status_mgr.payload
+    try:
+        mc = await run_in_executor(EXECUTOR_HTTP, Minio_Client_, access_token, refresh_token)
+        await run_in_executor(
+            EXECUTOR_HTTP,
+            mc.abort_multipart_upload,
+            job_payload['bucket'],
+            job_payload['object_path'],
+            job_payload['upload_id'],
+        )
+    except Exception as e:
+        logger.error('error when aborting multipart upload: ' + str(e))
+
+
+async def abort_multipart_uploads(logger, mc, multipart_uploads: list):
+    """drop the multipart uploads opened for the jobs of a pre upload which failed."""
+    for bucket, object_path, upload_id in multipart_uploads:
+        try:
+            await run_in_executor(EXECUTOR_HTTP, mc.abort_multipart_upload, bucket, object_path, upload_id)
+        except Exception as e:
+            logger.error('error when aborting multipart upload of {}: {}'.format(object_path, str(e)))
+
+
+async def get_upload_merkle_root(resumable_identifier: str, total_chunks: int):
+    """return the merkle root of the chunk digests of an upload, None if some chunks have no digest."""
+    digests = await upload_digests_get(resumable_identifier)
+    if any(chunk_number not in digests for chunk_number in range(1, total_chunks + 1)):
+        return None
+    return get_merkle_root([digests[chunk_number] for chunk_number in range(1, total_chunks + 1)])
+
+
+async def register_uploaded_file(
+    logger,
+    request_payload: OnSuccessUploadPOST,
+    target_file_full_path,
+    bucket,
+    obj_path,
+    version_id,
+    parent_folder_geid,
+    archive,
+    access_token,
+    refresh_token,
+    merkle_root=None,
+):
+    """create the metadata of a file uploaded to minio and send it to the pipeline, return the created entity.
+
+    archive is the local path or file object of the data to preview zip files, None if there is no local copy.
+    """
+    namespace = os.environ.get('namespace')
+    target_head, target_tail = os.path.split(target_file_full_path)
+    # after use the minio the pipeline will also use the minio location
+    minio_http = ('https://' if ConfigClass.MINIO_HTTPS else 'http://') + ConfigClass.MINIO_ENDPOINT
+    minio_location = 'minio://%s/%s/%s' % (minio_http, bucket, obj_path)
+
+    # create entity file data
+    file_meta_mgr = SrvFileDataMgr(logger)
+    res_create_meta = await run_in_executor(
+        EXECUTOR_HTTP,
+        file_meta_mgr.create,
+        request_payload.operator,
+        target_tail,
+        target_head,
+        request_payload.resumable_total_size,
+        'Raw file in {}'.format(namespace),
+        namespace,
+        request_payload.project_code,
+        request_payload.tags,
+        request_payload.dcm_id,
+        bucket,  # minio attribute
+        obj_path,  # minio attribute
+        version_id,  # minio attribute
+        operator=request_payload.operator,
+        process_pipeline=request_payload.process_pipeline,
+        from_parents=request_payload.from_parents,
+        parent_folder_geid=parent_folder_geid,
+        merkle_root=merkle_root,
+    )
+    if res_create_meta.get('error'):
+        logger.error('res_create_meta error: ' + str(res_create_meta))
+        raise Exception('res_create_meta error: ' + str(res_create_meta))
+    else:
+        logger.info('done with creating atlas record v2')
+    # get created entity
+    created_entity = res_create_meta['result']
 
+    # Store zip file preview in postgres
+    try:
+        file_type = os.path.splitext(target_tail)[1]
+        if file_type == '.zip' and archive is not None:
+            archive_preview = await run_in_executor(EXECUTOR_DISK, generate_archive_preview, archive)
+            payload = {
+                'archive_preview': archive_preview,
+                'file_geid': created_entity['global_entity_id'],
+            }
+            await run_in_executor(EXECUTOR_HTTP, httpx.post, ConfigClass.DATA_OPS_UTIL + 'archive', json=payload)
+    except Exception as e:
+        geid = created_entity['global_entity_id']
+        logger.error(f'Error adding file preview for {geid}: {str(e)}')
+
+    # update full path to Greenroom/<display_path>
+    obj_path = (
+        (ConfigClass.GREEN_ZONE_LABEL if namespace == 'greenroom' else ConfigClass.CORE_ZONE_LABEL) + '/' + obj_path
+    )
+    # add upload logs
+    await run_in_executor(
+        EXECUTOR_HTTP,
+        update_file_operation_logs,
+        request_payload.operator,
+        obj_path,
+        request_payload.project_code,
+        extra={'upload_message': request_payload.upload_message},
+    )
 
-def save_file(dest: str, my_file: UploadFile):
-    """save file on the disk."""
-    with open(dest, 'wb') as buffer:
-        shutil.copyfileobj(my_file.file, buffer)
+    # send to queue
+    payload = {
+        'event_type': 'data_uploaded',
+        'payload': {
+            'input_path': minio_location,  # update to minio
+            'project': request_payload.project_code,
+            'dcm_id': request_payload.dcm_id,
+            'uploader': request_payload.operator,
+            'source_geid': created_entity['global_entity_id'],
+            # new here the token for following pipeline
+            'auth_token': {'at': access_token, 'rt': refresh_token},
+        },
+        'create_timestamp': time.time(),
+    }
+    await run_in_executor(EXECUTOR_HTTP, send_to_queue, payload, logger)
+    logger.info('sent to queue.')
+    return created_entity
 
 
 async def finalize_worker(
@@ -523,27 +2109,60 @@ async def finalize_worker(
 ):
     """async zip worker."""
     lock_key = 'default'
+    upload_mode = status_mgr.payload.get('upload_mode', EUploadMode.CHUNKS.name)
+    in_memory = status_mgr.payload.get('staging_tier') == STAGING_TIER_MEMORY
+    pipelined = bool(status_mgr.payload.get('pipelined'))
+    memory_content = None
     try:
         # Upload task to combine file chunks and upload to nfs
         namespace = os.environ.get('namespace')
-        target_head, target_tail = os.path.split(target_file_full_path)
         temp_merged_file_full_path = os.path.join(temp_dir, request_payload.resumable_filename)
-        with open(temp_merged_file_full_path, 'ab') as temp_file:
-            for p in chunk_paths:
-                # since some browser has different encoding so
-                # we normalize the name with linux standard NFC
-                stored_chunk_file_name = p
-                logger.info('processing chunck %s' % stored_chunk_file_name)
-                # TODO since we using python 3.7 unicode data does not
-                # HAVE is_normalized form.
-                # if ud.normalize('NFC', p) != p:
-                #     stored_chunk_file_name = ud.normalize('NFC', p)
-
-                stored_chunk_file = open(stored_chunk_file_name, 'rb')
-                temp_file.write(stored_chunk_file.read())
-                stored_chunk_file.close()
-                os.unlink(stored_chunk_file_name)
-        logger.info('done with combinging chunks')
+        stream_chunks = (
+            bool(chunk_paths)
+            and ConfigClass.FINALIZE_STREAM_CHUNKS
+            and os.path.splitext(request_payload.resumable_filename)[1] != '.zip'
+        )
+        if stream_chunks:
+            logger.info('chunks are streamed to minio, no need to combine them')
+        elif chunk_paths:
+            flushed_at = time.time()
+            # copy_file_range refuses targets opened with O_APPEND
+            with open(temp_merged_file_full_path, 'wb') as temp_file:
+                for merged_chunks, p in enumerate(chunk_paths):
+                    # the merge progress is written every few chunks or milliseconds
+                    if (
+                        merged_chunks % ConfigClass.PROGRESS_FLUSH_CHUNKS == 0
+                        or (time.time() - flushed_at) * 1000 >= ConfigClass.PROGRESS_FLUSH_INTERVAL
+                    ):
+                        await upload_progress_set_stage(
+                            request_payload.resumable_identifier, 'merging', merged_chunks, len(chunk_paths)
+                        )
+                        flushed_at = time.time()
+                    # since some browser has different encoding so
+                    # we normalize the name with linux standard NFC
+                    stored_chunk_file_name = p
+                    logger.info('processing chunck %s' % stored_chunk_file_name)
+                    # TODO since we using python 3.7 unicode data does not
+                    # HAVE is_normalized form.
+                    # if ud.normalize('NFC', p) != p:
+                    #     stored_chunk_file_name = ud.normalize('NFC', p)
+
+                    await run_in_executor(EXECUTOR_DISK, append_chunk, temp_file, stored_chunk_file_name)
+            logger.info('done with combinging chunks')
+        elif upload_mode in _OBJECT_STORAGE_MODES:
+            logger.info('chunks were uploaded as multipart parts, no need to combine them')
+        elif pipelined:
+            logger.info('chunks were forwarded as multipart parts while they were received, the tail is left')
+        elif in_memory:
+            chunks = await upload_memory_chunks_get(
+                request_payload.resumable_identifier, request_payload.resumable_total_chunks
+            )
+            if None in chunks:
+                raise Exception('chunk {} is missing from memory'.format(chunks.index(None) + 1))
+            memory_content = b''.join(chunks)
+            logger.info('done with combining chunks in memory')
+        else:
+            logger.info('chunks were written in place, no need to combine them')
 
         # # here now we dont deprecate the nfs completely
         # # so we need to do some overwrite if the file exist
@@ -565,103 +2184,89 @@ async def finalize_worker(
         # obj_path = os.path.join(request_payload.operator, obj_path)
 
         version_id = ''
-        # after use the minio the pipeline will also use the minio location
-        minio_http = ('https://' if ConfigClass.MINIO_HTTPS else 'http://') + ConfigClass.MINIO_ENDPOINT
-        minio_location = 'minio://%s/%s/%s' % (minio_http, bucket, obj_path)
         # get lock key
         lock_key = os.path.join(bucket, obj_path)
         # minio_location = minio_location.encode('utf-8')
-        try:
-            mc = Minio_Client_(access_token, refresh_token)
-            logger.info('Minio Connection Success')
-
-            result = mc.client.fput_object(
-                bucket,
-                obj_path,
-                temp_merged_file_full_path,
+        await upload_progress_set_stage(request_payload.resumable_identifier, 'uploading', 0, 1)
+        # the multipart uploads report the parts uploaded so far
+        upload_progress = functools.partial(
+            upload_progress_set_stage, request_payload.resumable_identifier, 'uploading'
+        )
+        if upload_mode in _OBJECT_STORAGE_MODES:
+            # the parts are already in minio, only the object assembling is left
+            version_id = await complete_multipart_upload(
+                logger, status_mgr, request_payload.resumable_total_chunks, access_token, refresh_token
+            )
+        elif pipelined:
+            total_parts = await finish_pipeline(
+                logger,
+                status_mgr.payload,
+                request_payload.resumable_filename,
+                request_payload.resumable_total_chunks,
+                access_token,
+                refresh_token,
+            )
+            version_id = await complete_multipart_upload(logger, status_mgr, total_parts, access_token, refresh_token)
+        elif in_memory:
+            # the file goes to minio straight from memory, it never touches the staging disk
+            mc = await run_in_executor(EXECUTOR_HTTP, Minio_Client_, access_token, refresh_token)
+            result = await run_in_executor(
+                EXECUTOR_HTTP, mc.client.put_object, bucket, obj_path, BytesIO(memory_content), len(memory_content)
             )
             version_id = result.version_id
             logger.info('Minio Upload Success')
-        except Exception as e:
-            logger.error('error when uploading: ' + str(e))
-            # async_unlock_resource(lock_key)
-
-        # create entity file data
-        file_meta_mgr = SrvFileDataMgr(logger)
-        res_create_meta = file_meta_mgr.create(
-            request_payload.operator,
-            target_tail,
-            target_head,
-            request_payload.resumable_total_size,
-            'Raw file in {}'.format(namespace),
-            namespace,
-            request_payload.project_code,
-            request_payload.tags,
-            request_payload.dcm_id,
-            bucket,  # minio attribute
-            obj_path,  # minio attribute
-            version_id,  # minio attribute
-            operator=request_payload.operator,
-            process_pipeline=request_payload.process_pipeline,
-            from_parents=request_payload.from_parents,
-            parent_folder_geid=status_mgr.payload['parent_folder_geid'],
-        )
-        if res_create_meta.get('error'):
-            logger.error('res_create_meta error: ' + str(res_create_meta))
-            raise Exception('res_create_meta error: ' + str(res_create_meta))
+        elif stream_chunks:
+            # the chunks are read one after the other straight into minio, the merged file is never written
+            mc = await run_in_executor(EXECUTOR_HTTP, Minio_Client_, access_token, refresh_token)
+            reader = await run_in_executor(EXECUTOR_DISK, ChainedChunkReader, chunk_paths)
+            try:
+                version_id = await upload_object(logger, mc, bucket, obj_path, reader, reader.length, upload_progress)
+            finally:
+                reader.close()
+            logger.info('Minio Upload Success')
         else:
-            logger.info('done with creating atlas record v2')
-        # get created entity
-        created_entity = res_create_meta['result']
-
-        # Store zip file preview in postgres
-        try:
-            file_type = os.path.splitext(temp_merged_file_full_path)[1]
-            if file_type == '.zip':
-                archive_preview = generate_archive_preview(temp_merged_file_full_path)
-                payload = {
-                    'archive_preview': archive_preview,
-                    'file_geid': created_entity['global_entity_id'],
-                }
-                httpx.post(ConfigClass.DATA_OPS_UTIL + 'archive', json=payload)
-        except Exception as e:
-            geid = created_entity['global_entity_id']
-            logger.error(f'Error adding file preview for {geid}: {str(e)}')
-            # async_unlock_resource(lock_key)
-
-        # update full path to Greenroom/<display_path>
-        obj_path = (
-            (ConfigClass.GREEN_ZONE_LABEL if namespace == 'greenroom' else ConfigClass.CORE_ZONE_LABEL) + '/' + obj_path
+            try:
+                mc = await run_in_executor(EXECUTOR_HTTP, Minio_Client_, access_token, refresh_token)
+                logger.info('Minio Connection Success')
+
+                with open(temp_merged_file_full_path, 'rb') as merged_file:
+                    version_id = await upload_object(
+                        logger,
+                        mc,
+                        bucket,
+                        obj_path,
+                        merged_file,
+                        os.fstat(merged_file.fileno()).st_size,
+                        upload_progress,
+                    )
+                logger.info('Minio Upload Success')
+            except Exception as e:
+                logger.error('error when uploading: ' + str(e))
+                # async_unlock_resource(lock_key)
+
+        await upload_progress_set_stage(request_payload.resumable_identifier, 'registering', 0, 1)
+        # the chunks digests were recorded when they were received, the data is not read again
+        merkle_root = await get_upload_merkle_root(
+            request_payload.resumable_identifier, request_payload.resumable_total_chunks
         )
-        # add upload logs
-        update_file_operation_logs(
-            request_payload.operator,
+        if merkle_root:
+            status_mgr.add_payload('merkle_root', merkle_root)
+        created_entity = await register_uploaded_file(
+            logger,
+            request_payload,
+            target_file_full_path,
+            bucket,
             obj_path,
-            request_payload.project_code,
-            extra={'upload_message': request_payload.upload_message},
+            version_id,
+            status_mgr.payload['parent_folder_geid'],
+            # a multipart upload has no local copy to preview
+            BytesIO(memory_content)
+            if in_memory
+            else (temp_merged_file_full_path if os.path.isfile(temp_merged_file_full_path) else None),
+            access_token,
+            refresh_token,
+            merkle_root,
         )
-
-        # # update tag frequence in redis
-        # project_id = (await get_project(request_payload.project_code))['id']
-        # for tag in request_payload.tags:
-        #     SrvTagsMgr().add_freq(project_id, tag)
-
-        # send to queue
-        payload = {
-            'event_type': 'data_uploaded',
-            'payload': {
-                'input_path': minio_location,  # update to minio
-                'project': request_payload.project_code,
-                'dcm_id': request_payload.dcm_id,
-                'uploader': request_payload.operator,
-                'source_geid': created_entity['global_entity_id'],
-                # new here the token for following pipeline
-                'auth_token': {'at': access_token, 'rt': refresh_token},
-            },
-            'create_timestamp': time.time(),
-        }
-        send_to_queue(payload, logger)
-        logger.info('sent to queue.')
         # clean up tmp folder
         await status_mgr.go(EState.FINALIZED)
         try:
@@ -669,6 +2274,8 @@ async def finalize_worker(
         except Exception as exce:
             logger.info('Upload on succeed rmtree error: ' + str(exce))
             # async_unlock_resource(lock_key)
+        await upload_state_delete(request_payload.resumable_identifier)
+        drop_upload_manifest(request_payload.resumable_identifier)
         try:
             status_mgr.add_payload('source_geid', created_entity['global_entity_id'])
             await status_mgr.go(EState.SUCCEED)
@@ -689,11 +2296,16 @@ async def finalize_worker(
         logger.error(str(exce))
         status_mgr.add_payload('error_msg', str(exce))
         await status_mgr.go(EState.TERMINATED)
+        if upload_mode in _OBJECT_STORAGE_MODES or pipelined:
+            await abort_multipart_upload(logger, status_mgr, access_token, refresh_token)
         # async_unlock_resource(lock_key)
         raise exce
 
     finally:
-        unlock_resource(lock_key, 'write')
+        await async_unlock_resource(lock_key, 'write')
+        await staging_release([request_payload.resumable_identifier])
+        if in_memory:
+            await upload_memory_chunks_delete(request_payload.resumable_identifier)
 
 
 def get_root_folder(folder_path):
@@ -0,0 +1,317 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+"""tus resumable upload API.
+
+the tus resources sit on top of the upload jobs created by POST /v1/files/jobs with the TUS upload mode. The
+client appends the file to the job target file and the request which appends the last byte finalizes the upload.
+"""
+import base64
+import os
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi import BackgroundTasks
+from fastapi import Header
+from fastapi import Request
+from fastapi import Response
+from fastapi_utils import cbv
+from starlette.requests import ClientDisconnect
+
+from app.commons.data_providers import upload_finalize_claim
+from app.commons.data_providers import upload_tus_advance
+from app.commons.data_providers import upload_tus_claim
+from app.commons.data_providers import upload_tus_create
+from app.commons.data_providers import upload_tus_get
+from app.commons.data_providers import upload_tus_release
+from app.commons.logger_services.logger_factory_service import SrvLoggerFactory
+from app.models.base_models import APIResponse
+from app.models.base_models import EAPIResponseCode
+from app.models.fsm_file_upload import get_fsm_object
+from app.models.models_upload import EUploadMode
+from app.models.models_upload import OnSuccessUploadPOST
+from app.resources.error_handler import catch_internal
+from app.resources.executors import EXECUTOR_DISK
+from app.resources.executors import run_in_executor
+from app.resources.staging import ChunkRequestError
+from app.resources.staging import OffsetFileSink
+from app.resources.staging import stream_to_sink
+from app.routers.v1.api_data_upload import _JOB_TYPE
+from app.routers.v1.api_data_upload import get_temp_dir
+from app.routers.v1.api_data_upload import start_finalize_worker
+
+router = APIRouter()
+
+_API_TAG = 'V1 Tus Upload'
+_API_NAMESPACE = 'api_tus_upload'
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation'
+TUS_CONTENT_TYPE = 'application/offset+octet-stream'
+
+
+def parse_upload_metadata(upload_metadata: str) -> dict:
+    """parse the Upload-Metadata header, comma separated pairs of key and base64 encoded value."""
+    metadata = {}
+    for pair in upload_metadata.split(','):
+        pair = pair.strip()
+        if not pair:
+            continue
+        key, _, value = pair.partition(' ')
+        metadata[key] = base64.b64decode(value).decode('utf-8') if value else ''
+    return metadata
+
+
+def tus_response(status_code: int, headers: dict = None) -> Response:
+    """return an empty response with the tus headers."""
+    tus_headers = {'Tus-Resumable': TUS_VERSION}
+    tus_headers.update(headers or {})
+    return Response(status_code=status_code, headers=tus_headers)
+
+
+def check_tus_resumable(tus_resumable: str):
+    """return an error response if the client does not speak the supported tus version, None otherwise."""
+    if tus_resumable == TUS_VERSION:
+        return None
+    _res = APIResponse()
+    _res.code = EAPIResponseCode.precondition_failed
+    _res.result = {}
+    _res.error_msg = 'Unsupported Tus-Resumable: {}'.format(tus_resumable)
+    response = _res.json_response()
+    response.headers['Tus-Version'] = TUS_VERSION
+    return response
+
+
+def check_tus_owner(tus_resource: dict, session_id: str, operator: str):
+    """return an error message if the request does not come from the session and operator of the upload job, None
+    otherwise."""
+    if not session_id:
+        return 'Invalid Session ID: ' + str(session_id)
+    if session_id != tus_resource['session_id'] or operator != tus_resource['operator']:
+        return 'Session or operator does not own the tus upload'
+    return None
+
+
+@cbv.cbv(router)
+class APITusUpload:
+    """API tus Upload Class."""
+
+    def __init__(self):
+        self.__logger = SrvLoggerFactory('api_tus_upload').get_logger()
+
+    @router.options('/files/tus', tags=[_API_TAG], summary='tus server capabilities.')
+    async def tus_options(self):
+        """This method allow tus clients to discover the supported version and extensions."""
+        return tus_response(204, {'Tus-Version': TUS_VERSION, 'Tus-Extension': TUS_EXTENSIONS})
+
+    @router.post('/files/tus', tags=[_API_TAG], summary='create the tus resource of an upload job.')
+    @catch_internal(_API_NAMESPACE)
+    async def tus_create(
+        self,
+        session_id: str = Header(None),
+        tus_resumable: str = Header(None),
+        upload_length: int = Header(None),
+        upload_metadata: str = Header(''),
+    ):
+        """This method allow to create the tus resource of a TUS upload job.
+
+        Upload-Metadata must contain the resumable_identifier, project_code and operator of the job.
+        """
+        invalid_response = check_tus_resumable(tus_resumable)
+        if invalid_response:
+            return invalid_response
+        _res = APIResponse()
+        if not session_id:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Invalid Session ID: ' + str(session_id)
+            return _res.json_response()
+        metadata = parse_upload_metadata(upload_metadata)
+        if not all(metadata.get(key) for key in ('resumable_identifier', 'project_code', 'operator')):
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Upload-Metadata must contain resumable_identifier, project_code and operator'
+            return _res.json_response()
+        resumable_identifier = metadata['resumable_identifier']
+        try:
+            status_mgr = await get_fsm_object(
+                session_id, metadata['project_code'], _JOB_TYPE, metadata['operator'], resumable_identifier
+            )
+        except Exception as exce:
+            _res.code = EAPIResponseCode.not_found
+            _res.result = {}
+            _res.error_msg = str(exce)
+            return _res.json_response()
+        if status_mgr.payload.get('upload_mode') != EUploadMode.TUS.name:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Job {} is not a TUS upload'.format(resumable_identifier)
+            return _res.json_response()
+        if upload_length != status_mgr.payload['total_size']:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = 'Upload-Length does not match the size of job {}'.format(resumable_identifier)
+            return _res.json_response()
+
+        upload_offset = await upload_tus_create(
+            resumable_identifier, session_id, metadata['project_code'], metadata['operator']
+        )
+        self.__logger.info('tus resource created for {} at offset {}'.format(resumable_identifier, upload_offset))
+        return tus_response(
+            201, {'Location': '/v1/files/tus/{}'.format(resumable_identifier), 'Upload-Offset': str(upload_offset)}
+        )
+
+    @router.head('/files/tus/{resumable_identifier}', tags=[_API_TAG], summary='get the offset of a tus upload.')
+    @catch_internal(_API_NAMESPACE)
+    async def tus_offset(
+        self,
+        resumable_identifier: str,
+        tus_resumable: str = Header(None),
+        session_id: str = Header(None),
+        operator: str = Header(None),
+    ):
+        """This method allow a client to learn where to resume a tus upload.
+
+        Session-Id and Operator must be the ones of the upload job.
+        """
+        invalid_response = check_tus_resumable(tus_resumable)
+        if invalid_response:
+            return invalid_response
+        tus_resource = await upload_tus_get(resumable_identifier)
+        if not tus_resource:
+            return tus_response(404)
+        # a HEAD response has no body to carry the error message
+        if not session_id:
+            return tus_response(400)
+        if check_tus_owner(tus_resource, session_id, operator):
+            return tus_response(403)
+        return tus_response(200, {'Upload-Offset': tus_resource['offset'], 'Cache-Control': 'no-store'})
+
+    @router.patch('/files/tus/{resumable_identifier}', tags=[_API_TAG], summary='append data to a tus upload.')
+    @catch_internal(_API_NAMESPACE)
+    async def tus_append(
+        self,
+        request: Request,
+        resumable_identifier: str,
+        background_tasks: BackgroundTasks,
+        tus_resumable: str = Header(None),
+        upload_offset: int = Header(None),
+        content_type: str = Header(None),
+        session_id: str = Header(None),
+        operator: str = Header(None),
+        Authorization: Optional[str] = Header(None),
+        refresh_token: Optional[str] = Header(None),
+    ):
+        """This method allow to append the request body to the target file of a tus upload at Upload-Offset.
+
+        Session-Id and Operator must be the ones of the upload job, one request at a time appends to an upload.
+        """
+        invalid_response = check_tus_resumable(tus_resumable)
+        if invalid_response:
+            return invalid_response
+        _res = APIResponse()
+        if content_type != TUS_CONTENT_TYPE:
+            _res.code = EAPIResponseCode.unsupported_media_type
+            _res.result = {}
+            _res.error_msg = 'Content-Type must be {}'.format(TUS_CONTENT_TYPE)
+            return _res.json_response()
+        tus_resource = await upload_tus_get(resumable_identifier)
+        if not tus_resource:
+            return tus_response(404)
+        error_msg = check_tus_owner(tus_resource, session_id, operator)
+        if error_msg:
+            _res.code = EAPIResponseCode.bad_request if not session_id else EAPIResponseCode.forbidden
+            _res.result = {}
+            _res.error_msg = error_msg
+            return _res.json_response()
+        claim = await upload_tus_claim(resumable_identifier)
+        if not claim:
+            _res.code = EAPIResponseCode.conflict
+            _res.result = {}
+            _res.error_msg = 'Concurrent append to {}'.format(resumable_identifier)
+            return _res.json_response()
+        try:
+            return await self.append_claimed(
+                request, resumable_identifier, background_tasks, upload_offset, Authorization, refresh_token
+            )
+        finally:
+            await upload_tus_release(resumable_identifier, claim)
+
+    async def append_claimed(
+        self,
+        request: Request,
+        resumable_identifier: str,
+        background_tasks: BackgroundTasks,
+        upload_offset: int,
+        Authorization: Optional[str],
+        refresh_token: Optional[str],
+    ):
+        """append the request body to a tus upload while the request holds its append claim."""
+        _res = APIResponse()
+        # read the offset again, another request may have appended before the claim was taken
+        tus_resource = await upload_tus_get(resumable_identifier)
+        if not tus_resource:
+            return tus_response(404)
+        if upload_offset != int(tus_resource['offset']):
+            _res.code = EAPIResponseCode.conflict
+            _res.result = {'upload_offset': int(tus_resource['offset'])}
+            _res.error_msg = 'Upload-Offset does not match the offset of {}'.format(resumable_identifier)
+            return _res.json_response()
+
+        status_mgr = await get_fsm_object(
+            tus_resource['session_id'],
+            tus_resource['project_code'],
+            _JOB_TYPE,
+            tus_resource['operator'],
+            resumable_identifier,
+        )
+        finalize_request = OnSuccessUploadPOST(**status_mgr.payload['finalize_request'])
+        temp_dir = await get_temp_dir(resumable_identifier, status_mgr.payload)
+        target_file = os.path.join(temp_dir, finalize_request.resumable_filename)
+        sink = await run_in_executor(
+            EXECUTOR_DISK, OffsetFileSink, target_file, upload_offset, status_mgr.payload['total_size']
+        )
+        try:
+            await stream_to_sink(request.stream(), sink)
+        except ChunkRequestError as exce:
+            _res.code = EAPIResponseCode.bad_request
+            _res.result = {}
+            _res.error_msg = str(exce)
+            return _res.json_response()
+        except ClientDisconnect:
+            # keep what arrived before the network drop, the client resumes after it
+            self.__logger.info('Client disconnected from {} after {} bytes'.format(resumable_identifier, sink.written))
+        new_offset = await upload_tus_advance(resumable_identifier, upload_offset, sink.written)
+        if new_offset < 0:
+            _res.code = EAPIResponseCode.conflict
+            _res.result = {}
+            _res.error_msg = 'Concurrent append to {}'.format(resumable_identifier)
+            return _res.json_response()
+
+        if (
+            new_offset == status_mgr.payload['total_size']
+            and Authorization
+            and await upload_finalize_claim(resumable_identifier)
+        ):
+            self.__logger.info('Last byte received, start to finalize {}'.format(resumable_identifier))
+            await start_finalize_worker(
+                self.__logger, finalize_request, status_mgr, background_tasks, Authorization, refresh_token
+            )
+        return tus_response(204, {'Upload-Offset': str(new_offset)})
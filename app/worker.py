@@ -0,0 +1,170 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import asyncio
+import os
+import signal
+import socket
+
+from app.commons.data_providers import finalize_queue_ack
+from app.commons.data_providers import finalize_queue_claim
+from app.commons.data_providers import finalize_queue_create_group
+from app.commons.data_providers import finalize_queue_read
+from app.commons.data_providers import finalize_queue_touch
+from app.commons.logger_services.logger_factory_service import SrvLoggerFactory
+from app.config import ConfigClass
+from app.models.fsm_file_upload import EState
+from app.models.fsm_file_upload import get_fsm_object_by_key
+from app.models.models_upload import OnSuccessUploadPOST
+from app.resources.executors import EXECUTOR_DISK
+from app.resources.executors import run_in_executor
+from app.resources.executors import shutdown_executors
+from app.resources.staging_gc import terminate_upload
+from app.routers.v1.api_data_upload import finalize_worker
+from app.routers.v1.api_data_upload import get_finalize_paths
+
+# milliseconds a worker waits for new finalize requests before it looks for stalled ones again
+_READ_BLOCK = 5000
+_FINISHED_STATES = (EState.SUCCEED.name, EState.TERMINATED.name)
+# the heartbeat touches the finalizes in progress 3 times per claim idle time, after as many failed touches in a
+# row the other workers may take them over already
+_HEARTBEAT_MAX_FAILURES = 3
+
+
+def is_finalize_restartable(chunk_paths: list, merged_file: str) -> bool:
+    """return False once the merge or the streaming of the chunks started, the chunks read so far are removed."""
+    if not chunk_paths:
+        return True
+    return not os.path.exists(merged_file) and all(os.path.isfile(chunk_path) for chunk_path in chunk_paths)
+
+
+async def process_finalize(logger, entry_id: str, message: dict, deliveries: int):
+    """finalize the job of a queued request, ack the request once the job is finalized or failed."""
+    try:
+        status_mgr = await get_fsm_object_by_key(message['job_key'])
+    except Exception as exce:
+        logger.error('Finalize request {} dropped: {}'.format(entry_id, str(exce)))
+        await finalize_queue_ack(entry_id)
+        return
+    if status_mgr.status in _FINISHED_STATES:
+        logger.info('Job {} is already {}'.format(status_mgr.job_id, status_mgr.status))
+        await finalize_queue_ack(entry_id)
+        return
+
+    request_payload = OnSuccessUploadPOST(**message['finalize_request'])
+    chunk_paths, file_full_path, temp_dir = await get_finalize_paths(request_payload, status_mgr)
+    # the finalize of a worker which stopped is only run again if it can start over
+    if deliveries > 1:
+        merged_file = os.path.join(temp_dir, request_payload.resumable_filename)
+        reason = None
+        if deliveries > ConfigClass.FINALIZE_QUEUE_MAX_DELIVERIES:
+            reason = 'Finalize was interrupted {} times'.format(deliveries - 1)
+        elif not await run_in_executor(EXECUTOR_DISK, is_finalize_restartable, chunk_paths, merged_file):
+            reason = 'Finalize was interrupted while the chunks were merged'
+        if reason:
+            logger.error('Job {} terminated: {}'.format(status_mgr.job_id, reason))
+            _, _, job = status_mgr.get_kv_entity()
+            await terminate_upload(logger, job, reason)
+            await finalize_queue_ack(entry_id)
+            return
+
+    try:
+        await finalize_worker(
+            logger,
+            request_payload,
+            status_mgr,
+            chunk_paths,
+            file_full_path,
+            temp_dir,
+            message['access_token'],
+            message['refresh_token'],
+        )
+    except Exception as exce:
+        # finalize_worker already marked the job TERMINATED
+        logger.error('Finalize of job {} failed: {}'.format(status_mgr.job_id, str(exce)))
+    await finalize_queue_ack(entry_id)
+
+
+async def keep_alive(logger, consumer: str, in_flight: dict):
+    """reset the idle time of the finalizes in progress until cancelled, so no other worker takes them over.
+
+    a failed touch is logged and tried again at the next beat, the heartbeat returns once the touches failed for
+    the whole claim idle time.
+    """
+    failures = 0
+    while failures < _HEARTBEAT_MAX_FAILURES:
+        await asyncio.sleep(ConfigClass.FINALIZE_QUEUE_CLAIM_IDLE / _HEARTBEAT_MAX_FAILURES)
+        try:
+            await finalize_queue_touch(consumer, list(in_flight))
+            failures = 0
+        except Exception as exce:
+            failures += 1
+            logger.error('Finalize heartbeat of {} failed: {}'.format(consumer, str(exce)))
+
+
+async def run_finalize_worker(logger, consumer: str, stop: asyncio.Event):
+    """run up to FINALIZE_WORKER_CONCURRENCY queued finalizes at once until stop is set or the heartbeat stops.
+
+    the stalled finalizes of the other workers are taken over before the new ones. The finalizes in progress are
+    finished before it returns, the others stay in the queue.
+    """
+    await finalize_queue_create_group()
+    in_flight = {}
+    heartbeat = asyncio.ensure_future(keep_alive(logger, consumer, in_flight))
+    try:
+        while not stop.is_set() and not heartbeat.done():
+            free = ConfigClass.FINALIZE_WORKER_CONCURRENCY - len(in_flight)
+            if free <= 0:
+                await asyncio.wait(list(in_flight.values()), return_when=asyncio.FIRST_COMPLETED)
+                continue
+            entries = await finalize_queue_claim(consumer, ConfigClass.FINALIZE_QUEUE_CLAIM_IDLE * 1000, free)
+            if not entries:
+                entries = await finalize_queue_read(consumer, free, _READ_BLOCK)
+            for entry_id, message, deliveries in entries:
+                logger.info('Finalize request {} taken, delivery {}'.format(entry_id, deliveries))
+                task = asyncio.ensure_future(process_finalize(logger, entry_id, message, deliveries))
+                in_flight[entry_id] = task
+                task.add_done_callback(lambda _, entry_id=entry_id: in_flight.pop(entry_id, None))
+        if heartbeat.done():
+            # the finalizes taken from now on could run twice
+            logger.error('Finalize heartbeat of {} stopped, no more finalize requests are taken'.format(consumer))
+        if in_flight:
+            await asyncio.wait(list(in_flight.values()))
+    finally:
+        heartbeat.cancel()
+
+
+def main():
+    logger = SrvLoggerFactory('finalize_worker').get_logger()
+    consumer = '{}-{}'.format(socket.gethostname(), os.getpid())
+    loop = asyncio.get_event_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    logger.info('Finalize worker {} started'.format(consumer))
+    try:
+        loop.run_until_complete(run_finalize_worker(logger, consumer, stop))
+    finally:
+        shutdown_executors()
+    logger.info('Finalize worker {} stopped'.format(consumer))
+
+
+if __name__ == '__main__':
+    main()
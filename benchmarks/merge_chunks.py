@@ -0,0 +1,95 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+"""compare the chunk merge of the finalize step when chunks are read into memory and when they are copied in the kernel.
+
+the chunks are written to a temporary directory on the staging disk, then merged by a fresh process with each method so
+the peak RSS printed is the one of the merge alone. Run it from the root of the repository with the settings of the
+service in the environment. Example:
+
+    python benchmarks/merge_chunks.py --dir /data/upload/tmp --chunks 200 --chunk-size 16777216
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.resources.staging import append_chunk
+from app.resources.staging import generate_chunk_name
+
+
+def read_chunk(target_file, chunk_path: str):
+    """the merge before the kernel copy, every chunk goes through the memory of the process."""
+    with open(chunk_path, 'rb') as chunk_file:
+        target_file.write(chunk_file.read())
+    os.unlink(chunk_path)
+
+
+def write_chunks(work_dir: str, chunks: int, chunk_size: int):
+    chunk = os.urandom(chunk_size)
+    for chunk_number in range(1, chunks + 1):
+        with open(os.path.join(work_dir, generate_chunk_name('any', chunk_number)), 'wb') as f:
+            f.write(chunk)
+
+
+def merge(method: str, work_dir: str, chunks: int) -> tuple:
+    append = {'read': read_chunk, 'kernel': append_chunk}[method]
+    start = time.perf_counter()
+    with open(os.path.join(work_dir, 'any'), 'wb') as target_file:
+        for chunk_number in range(1, chunks + 1):
+            append(target_file, os.path.join(work_dir, generate_chunk_name('any', chunk_number)))
+        os.fsync(target_file.fileno())
+    elapsed = time.perf_counter() - start
+    os.unlink(os.path.join(work_dir, 'any'))
+    # ru_maxrss is in KiB on linux
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=None, help='directory on the staging disk, the system temp dir by default')
+    parser.add_argument('--chunks', type=int, default=100)
+    parser.add_argument('--chunk-size', type=int, default=16 * 1024 * 1024)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger('benchmark')
+
+    work_dir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        for method in ('read', 'kernel'):
+            write_chunks(work_dir, args.chunks, args.chunk_size)
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                elapsed, peak_rss = executor.submit(merge, method, work_dir, args.chunks).result()
+            logger.info(
+                '{:<8} {:>6} chunks in {:>7.2f}s {:>9.1f} MiB/s peak RSS {:>8.1f} MiB'.format(
+                    method, args.chunks, elapsed, args.chunks * args.chunk_size / elapsed / 2**20, peak_rss
+                )
+            )
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+"""compare the throughput of the finalize upload to minio with an increasing number of parts uploaded at once.
+
+by default the object goes to a stand-in of the S3 multipart api started by the script, which only counts the bytes
+and limits every connection to --stream-bandwidth MiB/s like a single stream to a remote minio is. --endpoint, with
+--access-key and --secret-key, sends it to a real minio instead. Run it from the root of the repository with the
+settings of the service in the environment. Example:
+
+    python benchmarks/parallel_upload.py --size 1073741824 --part-size 16777216 --concurrency 1 2 4 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from minio import Minio
+
+from app.commons.service_connection.minio_client import MultipartUploadMixin
+from app.config import ConfigClass
+from app.resources.object_upload import upload_object_parts
+
+_S3_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """the S3 calls of a multipart upload, the parts are read and dropped."""
+
+    protocol_version = 'HTTP/1.1'
+    stream_bandwidth = 50
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status: int, body: str = '', headers: dict = None):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self, throttle: bool = False) -> int:
+        remaining = int(self.headers.get('Content-Length', 0))
+        start = time.perf_counter()
+        received = 0
+        while remaining:
+            piece = self.rfile.read(min(remaining, 1024 * 1024))
+            received += len(piece)
+            remaining -= len(piece)
+            if throttle:
+                # keep the connection under stream_bandwidth MiB/s
+                time.sleep(max(0, received / 2**20 / self.stream_bandwidth - (time.perf_counter() - start)))
+        return received
+
+    def do_POST(self):
+        query = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+        self.read_body()
+        if 'uploads' in query:
+            self.reply(
+                200,
+                '<InitiateMultipartUploadResult xmlns="{}"><UploadId>stand-in</UploadId>'
+                '</InitiateMultipartUploadResult>'.format(_S3_XMLNS),
+            )
+        else:
+            self.reply(
+                200,
+                '<CompleteMultipartUploadResult xmlns="{}"><ETag>"stand-in"</ETag>'
+                '</CompleteMultipartUploadResult>'.format(_S3_XMLNS),
+                {'x-amz-version-id': 'stand-in'},
+            )
+
+    def do_PUT(self):
+        self.read_body(throttle=True)
+        self.reply(200, headers={'ETag': '"stand-in"'})
+
+    def do_DELETE(self):
+        self.reply(204)
+
+
+class BenchmarkClient(MultipartUploadMixin):
+    def __init__(self, client: Minio):
+        self.client = client
+
+
+class RandomSource:
+    """file-like source of size bytes, the same random MiB over and over."""
+
+    def __init__(self, size: int):
+        self.block = os.urandom(1024 * 1024)
+        self.remaining = size
+
+    def read(self, size: int) -> bytes:
+        size = min(size, self.remaining)
+        self.remaining -= size
+        return (self.block * (size // len(self.block) + 1))[:size]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint', default=None, help='host:port of a minio, the stand-in by default')
+    parser.add_argument('--access-key', default=None)
+    parser.add_argument('--secret-key', default=None)
+    parser.add_argument('--bucket', default='benchmark')
+    parser.add_argument('--size', type=int, default=512 * 1024 * 1024)
+    parser.add_argument('--part-size', type=int, default=16 * 1024 * 1024)
+    # the minio client keeps 10 connections per host
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--stream-bandwidth', type=float, default=50, help='MiB/s of a stand-in connection')
+    args = parser.parse_args()
+
+    endpoint = args.endpoint
+    if endpoint is None:
+        StandInHandler.stream_bandwidth = args.stream_bandwidth
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = '127.0.0.1:{}'.format(server.server_address[1])
+    client = BenchmarkClient(
+        Minio(
+            endpoint,
+            access_key=args.access_key or 'stand-in',
+            secret_key=args.secret_key or 'stand-in',
+            secure=False,
+            region='us-east-1',
+        )
+    )
+    ConfigClass.FINALIZE_PART_SIZE = args.part_size
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger('benchmark')
+
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        await upload_object_parts(
+            logger, client, args.bucket, 'parallel_upload', RandomSource(args.size), args.size, concurrency
+        )
+        elapsed = time.perf_counter() - start
+        logger.info(
+            '{:>3} parts at once {:>7.2f}s {:>9.1f} MiB/s'.format(concurrency, elapsed, args.size / elapsed / 2**20)
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+"""compare the throughput of the small chunk upload transports of a running upload service.
+
+the chunks are uploaded to an existing CHUNKS upload job (created with POST /v1/files/jobs) once through
+POST /v1/files/chunks and once through the /v1/files/chunks/ws channel, then the chunks per second of both are
+printed. Example:
+
+    python benchmarks/small_chunks.py --url http://localhost:5079 --session-id 1234 --project-code any \
+        --operator me --resumable-identifier <job geid> --resumable-filename any --chunks 2000 --chunk-size 4096
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import httpx
+import websockets
+
+
+async def upload_with_form(args, chunk: bytes):
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        for chunk_number in range(1, args.chunks + 1):
+            response = await client.post(
+                '/v1/files/chunks',
+                headers={'Session-Id': args.session_id},
+                data={
+                    'project_code': args.project_code,
+                    'operator': args.operator,
+                    'resumable_identifier': args.resumable_identifier,
+                    'resumable_filename': args.resumable_filename,
+                    'resumable_chunk_number': str(chunk_number),
+                    'resumable_total_chunks': str(args.chunks),
+                    'resumable_total_size': str(args.chunks * args.chunk_size),
+                },
+                files={'chunk_data': ('chunk', chunk, 'application/octet-stream')},
+            )
+            response.raise_for_status()
+
+
+async def upload_with_websocket(args, chunk: bytes):
+    url = args.url.replace('http', 'ws', 1) + '/v1/files/chunks/ws'
+    async with websockets.connect(url, max_size=None) as websocket:
+        await websocket.send(
+            json.dumps({'session_id': args.session_id, 'project_code': args.project_code, 'operator': args.operator})
+        )
+        json.loads(await websocket.recv())
+        for chunk_number in range(1, args.chunks + 1):
+            header = json.dumps(
+                {
+                    'resumable_identifier': args.resumable_identifier,
+                    'resumable_filename': args.resumable_filename,
+                    'resumable_chunk_number': chunk_number,
+                }
+            ).encode('utf-8')
+            await websocket.send(len(header).to_bytes(4, 'big') + header + chunk)
+            ack = json.loads(await websocket.recv())
+            if ack['code'] != 200:
+                raise Exception(ack['error_msg'])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5079')
+    parser.add_argument('--session-id', required=True)
+    parser.add_argument('--project-code', required=True)
+    parser.add_argument('--operator', required=True)
+    parser.add_argument('--resumable-identifier', required=True)
+    parser.add_argument('--resumable-filename', required=True)
+    parser.add_argument('--chunks', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, default=4096)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger('benchmark')
+
+    chunk = os.urandom(args.chunk_size)
+    for name, upload in (('form', upload_with_form), ('websocket', upload_with_websocket)):
+        start = time.perf_counter()
+        await upload(args, chunk)
+        elapsed = time.perf_counter() - start
+        logger.info(
+            '{:<10} {:>8} chunks in {:>7.2f}s {:>9.1f} chunks/s {:>7.2f} MiB/s'.format(
+                name, args.chunks, elapsed, args.chunks / elapsed, args.chunks * args.chunk_size / elapsed / 2**20
+            )
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
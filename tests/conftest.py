@@ -72,11 +72,19 @@ async def clean_up_redis():
     await cache.flushall()
 
 
+@pytest.fixture(autouse=True)
+def clean_up_manifest_cache():
+    from app.resources.upload_manifest import _manifest_cache
+
+    _manifest_cache.clear()
+
+
 @pytest.fixture(autouse=True)
 def mock_settings(monkeypatch):
     from app.config import ConfigClass
 
     monkeypatch.setattr(ConfigClass, 'TEMP_BASE', './tests/')
+    monkeypatch.setattr(ConfigClass, 'STAGING_SHARD_LEVELS', 0)
 
 
 @pytest.fixture
@@ -117,8 +125,7 @@ def create_job_folder():
         shutil.rmtree(folder_path)
 
 
-@pytest.fixture
-async def create_fake_job(monkeypatch):
+def set_fake_job(monkeypatch, status='PRE_UPLOADED', **extra_payload):
     from app.commons.data_providers.redis import SrvAioRedisSingleton
 
     fake_job = {
@@ -126,7 +133,7 @@ async def create_fake_job(monkeypatch):
         'job_id': 'fake_global_entity_id',
         'source': 'any',
         'action': 'data_upload',
-        'status': 'PRE_UPLOADED',
+        'status': status,
         'project_code': 'any',
         'operator': 'me',
         'progress': 0,
@@ -134,6 +141,7 @@ async def create_fake_job(monkeypatch):
             'task_id': 'fake_global_entity_id',
             'resumable_identifier': 'fake_global_entity_id',
             'parent_folder_geid': None,
+            **extra_payload,
         },
         'update_timestamp': '1643041439',
     }
@@ -144,6 +152,125 @@ async def create_fake_job(monkeypatch):
     monkeypatch.setattr(SrvAioRedisSingleton, 'mget_by_prefix', fake_return)
 
 
+@pytest.fixture
+async def create_fake_job(monkeypatch):
+    set_fake_job(monkeypatch)
+
+
+@pytest.fixture
+async def create_fake_succeed_job(monkeypatch):
+    set_fake_job(monkeypatch, status='SUCCEED')
+
+
+@pytest.fixture
+async def create_fake_preallocated_job(monkeypatch):
+    set_fake_job(monkeypatch, upload_mode='PREALLOCATED', total_size=2048, chunk_size=1024)
+
+
+@pytest.fixture
+async def create_fake_estimated_job(monkeypatch):
+    set_fake_job(monkeypatch, staging_estimated=True)
+
+
+@pytest.fixture
+async def create_fake_memory_job(monkeypatch):
+    set_fake_job(monkeypatch, staging_tier='memory', total_size=10)
+
+
+@pytest.fixture
+async def create_fake_auto_finalize_job(monkeypatch):
+    set_fake_job(
+        monkeypatch,
+        finalize_request={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_relative_path': '',
+            'resumable_total_chunks': 1,
+            'resumable_total_size': 10,
+        },
+    )
+
+
+@pytest.fixture
+async def create_fake_tus_job(monkeypatch):
+    set_fake_job(
+        monkeypatch,
+        upload_mode='TUS',
+        total_size=10,
+        chunk_size=None,
+        finalize_request={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_relative_path': '',
+            'resumable_total_chunks': 1,
+            'resumable_total_size': 10,
+        },
+    )
+
+
+@pytest.fixture
+async def create_fake_multipart_job(monkeypatch):
+    set_fake_job(
+        monkeypatch,
+        upload_mode='MULTIPART',
+        total_size=2048,
+        chunk_size=1024,
+        bucket='core-any',
+        object_path='any',
+        upload_id='fake_upload_id',
+    )
+
+
+@pytest.fixture
+async def create_fake_presigned_job(monkeypatch):
+    set_fake_job(
+        monkeypatch,
+        upload_mode='PRESIGNED',
+        total_size=2048,
+        chunk_size=1024,
+        bucket='core-any',
+        object_path='any',
+        upload_id='fake_upload_id',
+    )
+
+
+@pytest.fixture
+async def create_fake_manifest_job():
+    """job and manifest recorded in redis the way pre upload does."""
+    from app.commons.data_providers import session_job_set_status
+    from app.commons.data_providers import upload_manifest_set
+
+    payload = {
+        'task_id': 'fake_global_entity_id',
+        'resumable_identifier': 'fake_global_entity_id',
+        'parent_folder_geid': None,
+        'upload_mode': 'CHUNKS',
+    }
+    await session_job_set_status(
+        '1234', 'fake_global_entity_id', 'any', 'data_upload', 'PRE_UPLOADED', 'any', 'me', payload
+    )
+    await upload_manifest_set(
+        'fake_global_entity_id',
+        {
+            'session_id': '1234',
+            'job_key': 'dataaction:1234:fake_global_entity_id:data_upload:any:me:any',
+            'finalize_request': {
+                'project_code': 'any',
+                'operator': 'me',
+                'resumable_identifier': 'fake_global_entity_id',
+                'resumable_filename': 'any',
+                'resumable_relative_path': '',
+                'resumable_total_chunks': 2,
+                'resumable_total_size': 20,
+            },
+        },
+    )
+
+
 @pytest.fixture
 def mock_minio(monkeypatch):
     from app.commons.service_connection.minio_client import Minio
@@ -160,3 +287,61 @@ def mock_minio(monkeypatch):
     monkeypatch.setattr(Minio, 'get_object', lambda x, y, z: http_response)
     monkeypatch.setattr(Minio, 'list_buckets', lambda x: [])
     monkeypatch.setattr(Minio, 'fget_object', lambda *x: [])
+
+
+@pytest.fixture
+def mock_minio_multipart(monkeypatch):
+    """in memory stand-in for the minio multipart api."""
+    from minio.datatypes import Part
+
+    from app.commons.service_connection.minio_client import Minio
+
+    class FakeCompleteResult:
+        version_id = 'fake_version_id'
+
+    class FakeListPartsResult:
+        is_truncated = False
+        next_part_number_marker = None
+
+        def __init__(self, parts):
+            self.parts = [Part(part_number, 'etag_%d' % part_number) for part_number in sorted(parts)]
+
+    uploads = {}
+
+    def create_multipart_upload(self, bucket, obj_path, headers):
+        uploads['fake_upload_id'] = {'bucket': bucket, 'object_path': obj_path, 'parts': {}}
+        return 'fake_upload_id'
+
+    def upload_part(self, bucket, obj_path, data, headers, upload_id, part_number):
+        uploads.setdefault(upload_id, {'bucket': bucket, 'object_path': obj_path, 'parts': {}})
+        uploads[upload_id]['parts'][part_number] = data
+        return 'etag_%d' % part_number
+
+    def complete_multipart_upload(self, bucket, obj_path, upload_id, parts):
+        upload = uploads[upload_id]
+        upload['object'] = b''.join(upload['parts'][part.part_number] for part in parts)
+        return FakeCompleteResult()
+
+    def list_parts(self, bucket, obj_path, upload_id, part_number_marker=None):
+        return FakeListPartsResult(uploads[upload_id]['parts'])
+
+    def get_presigned_url(self, method, bucket, obj_path, expires, extra_query_params):
+        return 'http://minio/%s/%s?uploadId=%s&partNumber=%s' % (
+            bucket,
+            obj_path,
+            extra_query_params['uploadId'],
+            extra_query_params['partNumber'],
+        )
+
+    def abort_multipart_upload(self, bucket, obj_path, upload_id):
+        uploads.pop(upload_id, None)
+
+    monkeypatch.setattr(Minio, '_create_multipart_upload', create_multipart_upload)
+    monkeypatch.setattr(Minio, '_upload_part', upload_part)
+    monkeypatch.setattr(Minio, '_complete_multipart_upload', complete_multipart_upload)
+    monkeypatch.setattr(Minio, '_list_parts', list_parts)
+    monkeypatch.setattr(Minio, 'get_presigned_url', get_presigned_url)
+    monkeypatch.setattr(Minio, '_abort_multipart_upload', abort_multipart_upload)
+    # the token check of the client of the user
+    monkeypatch.setattr(Minio, 'list_buckets', lambda self: [])
+    return uploads
@@ -0,0 +1,55 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+from app.resources.chunk_advisor import get_session_rates
+from app.resources.chunk_advisor import recommend_chunking
+
+MIB = 1024 * 1024
+
+
+def test_get_session_rates_should_return_throughput_and_error_rate():
+    assert get_session_rates({'bytes': '2048', 'active_ms': '1000', 'chunks': '3', 'errors': '1'}) == (2048, 0.25)
+    assert get_session_rates({}) == (None, 0.0)
+
+
+def test_recommend_chunking_should_use_default_chunk_size_without_throughput():
+    assert recommend_chunking(100 * MIB, 'CHUNKS') == {'chunk_size': 8 * MIB, 'total_chunks': 12, 'parallelism': 4}
+
+
+def test_recommend_chunking_should_follow_session_throughput():
+    assert recommend_chunking(100 * MIB, 'CHUNKS', 4 * MIB) == {
+        'chunk_size': 5 * MIB,
+        'total_chunks': 20,
+        'parallelism': 4,
+    }
+
+
+def test_recommend_chunking_should_shrink_chunks_and_parallelism_on_errors():
+    assert recommend_chunking(100 * MIB, 'CHUNKS', error_rate=0.1) == {
+        'chunk_size': 2 * MIB,
+        'total_chunks': 50,
+        'parallelism': 1,
+    }
+    # minio does not take multipart parts under 5 MiB
+    assert recommend_chunking(100 * MIB, 'MULTIPART', error_rate=0.1)['chunk_size'] == 5 * MIB
+
+
+def test_recommend_chunking_should_send_small_file_in_one_chunk():
+    assert recommend_chunking(1000, 'CHUNKS') == {'chunk_size': 1000, 'total_chunks': 1, 'parallelism': 1}
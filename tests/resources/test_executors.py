@@ -0,0 +1,70 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import contextvars
+import threading
+
+import pytest
+
+from app.resources.executors import EXECUTOR_DISK
+from app.resources.executors import EXECUTOR_HTTP
+from app.resources.executors import get_executor
+from app.resources.executors import get_executor_stats
+from app.resources.executors import run_in_executor
+from app.resources.executors import shutdown_executors
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+@pytest.fixture(autouse=True)
+def clean_up_executors():
+    shutdown_executors()
+    yield
+    shutdown_executors()
+
+
+async def test_run_in_executor_should_run_in_thread_of_its_executor():
+    thread_name = await run_in_executor(EXECUTOR_DISK, lambda: threading.current_thread().name)
+    assert thread_name.startswith('disk-executor')
+
+
+async def test_run_in_executor_should_keep_context_of_caller():
+    request_id.set('any')
+    assert await run_in_executor(EXECUTOR_HTTP, request_id.get) == 'any'
+
+
+async def test_get_executor_should_use_configured_size(monkeypatch):
+    from app.config import ConfigClass
+
+    monkeypatch.setattr(ConfigClass, 'EXECUTOR_HTTP_WORKERS', 2)
+    assert get_executor(EXECUTOR_HTTP).max_workers == 2
+
+
+async def test_get_executor_stats_should_count_work_of_every_executor():
+    await run_in_executor(EXECUTOR_DISK, sum, [1, 2])
+    await run_in_executor(EXECUTOR_DISK, sum, [3, 4])
+
+    stats = get_executor_stats()
+    assert list(stats) == [EXECUTOR_DISK]
+    assert stats[EXECUTOR_DISK]['completed'] == 2
+    assert stats[EXECUTOR_DISK]['queued'] == 0
+    assert stats[EXECUTOR_DISK]['active'] == 0
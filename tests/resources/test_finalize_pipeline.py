@@ -0,0 +1,137 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+from unittest import mock
+
+import pytest
+
+from app.commons.data_providers import upload_chunks_set
+from app.commons.data_providers import upload_parts_get
+from app.commons.data_providers import upload_pipeline_claim
+from app.commons.data_providers import upload_pipeline_get
+from app.commons.data_providers import upload_pipeline_release
+from app.config import ConfigClass
+from app.resources import finalize_pipeline
+from app.resources.finalize_pipeline import advance_pipeline
+from app.resources.finalize_pipeline import finish_pipeline
+from app.resources.finalize_pipeline import run_pipeline
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+CHUNK_SIZE = 3 * 1024 * 1024
+
+
+@pytest.fixture
+def pipelined_job(monkeypatch, tmp_path, mock_minio_multipart):
+    monkeypatch.setattr(ConfigClass, 'FINALIZE_PART_SIZE', 5 * 1024 * 1024)
+    chunks = [b'1' * CHUNK_SIZE, b'2' * CHUNK_SIZE, b'3' * 1024]
+    for chunk_number, chunk in enumerate(chunks, 1):
+        with open(tmp_path / 'any_part_{:03d}'.format(chunk_number), 'wb') as f:
+            f.write(chunk)
+    mock_minio_multipart['fake_upload_id'] = {'bucket': 'core-any', 'object_path': 'any', 'parts': {}}
+    yield {
+        'resumable_identifier': 'fake_global_entity_id',
+        'staging_dir': str(tmp_path),
+        'pipelined': True,
+        'bucket': 'core-any',
+        'object_path': 'any',
+        'upload_id': 'fake_upload_id',
+        'total_size': 2 * CHUNK_SIZE + 1024,
+        'total_chunks': 3,
+    }, chunks
+
+
+async def test_advance_pipeline_forwards_contiguous_chunks_as_parts(pipelined_job, mock_minio_multipart, tmp_path):
+    job_payload, chunks = pipelined_job
+    for chunk_number in (1, 2, 3):
+        await upload_chunks_set('fake_global_entity_id', chunk_number)
+    claim = await upload_pipeline_claim('fake_global_entity_id')
+
+    position = await advance_pipeline(mock.MagicMock(), job_payload, 'any', 3, 'token', 'refresh_token', claim)
+
+    # the last chunk is shorter than a part so it waits for the finalize
+    assert position == {'next_chunk': 3, 'next_part': 2}
+    assert mock_minio_multipart['fake_upload_id']['parts'] == {1: chunks[0] + chunks[1]}
+    assert await upload_parts_get('fake_global_entity_id') == {1: 'etag_1'}
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['any_part_003']
+
+
+async def test_advance_pipeline_stops_at_first_missing_chunk(pipelined_job, mock_minio_multipart, tmp_path):
+    job_payload, _ = pipelined_job
+    await upload_chunks_set('fake_global_entity_id', 1)
+    await upload_chunks_set('fake_global_entity_id', 3)
+    claim = await upload_pipeline_claim('fake_global_entity_id')
+
+    position = await advance_pipeline(
+        mock.MagicMock(), job_payload, 'any', 3, 'token', 'refresh_token', claim, final=True
+    )
+
+    assert position == {'next_chunk': 1, 'next_part': 1}
+    assert mock_minio_multipart['fake_upload_id']['parts'] == {}
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+async def test_finish_pipeline_forwards_tail_as_last_part(pipelined_job, mock_minio_multipart, tmp_path):
+    job_payload, chunks = pipelined_job
+    for chunk_number in (1, 2, 3):
+        await upload_chunks_set('fake_global_entity_id', chunk_number)
+    await run_pipeline(mock.MagicMock(), job_payload, 'any', 3, 'token', 'refresh_token')
+
+    total_parts = await finish_pipeline(mock.MagicMock(), job_payload, 'any', 3, 'token', 'refresh_token')
+
+    assert total_parts == 2
+    assert mock_minio_multipart['fake_upload_id']['parts'] == {1: chunks[0] + chunks[1], 2: chunks[2]}
+    assert await upload_pipeline_get('fake_global_entity_id') == {'next_chunk': 4, 'next_part': 3}
+    assert list(tmp_path.iterdir()) == []
+    # the claim is released for the next caller
+    assert await upload_pipeline_claim('fake_global_entity_id')
+
+
+async def test_advance_pipeline_stops_when_claim_was_lost(pipelined_job, mock_minio_multipart, tmp_path):
+    job_payload, _ = pipelined_job
+    for chunk_number in (1, 2, 3):
+        await upload_chunks_set('fake_global_entity_id', chunk_number)
+    await upload_pipeline_claim('fake_global_entity_id')
+
+    with pytest.raises(Exception) as excinfo:
+        await advance_pipeline(mock.MagicMock(), job_payload, 'any', 3, 'token', 'refresh_token', 'expired_claim')
+    assert str(excinfo.value) == 'pipeline of fake_global_entity_id was claimed by another request'
+    assert mock_minio_multipart['fake_upload_id']['parts'] == {}
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+async def test_upload_pipeline_release_keeps_claim_of_another_caller():
+    claim = await upload_pipeline_claim('fake_global_entity_id')
+
+    await upload_pipeline_release('fake_global_entity_id', 'expired_claim')
+    assert not await upload_pipeline_claim('fake_global_entity_id')
+
+    await upload_pipeline_release('fake_global_entity_id', claim)
+    assert await upload_pipeline_claim('fake_global_entity_id')
+
+
+async def test_finish_pipeline_raises_when_claim_is_held_past_timeout(pipelined_job, monkeypatch):
+    job_payload, _ = pipelined_job
+    monkeypatch.setattr(finalize_pipeline, '_CLAIM_TIMEOUT', 0)
+    await upload_pipeline_claim('fake_global_entity_id')
+
+    with pytest.raises(Exception) as excinfo:
+        await finish_pipeline(mock.MagicMock(), job_payload, 'any', 3, 'token', 'refresh_token')
+    assert str(excinfo.value) == 'pipeline of fake_global_entity_id is still claimed after 0 seconds'
@@ -0,0 +1,106 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+from io import BytesIO
+from unittest import mock
+
+import pytest
+
+from app.commons.service_connection.minio_client import Minio
+from app.commons.service_connection.minio_client import Minio_Client
+from app.config import ConfigClass
+from app.resources import object_upload
+from app.resources.object_upload import get_part_size
+from app.resources.object_upload import upload_object_parts
+
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    monkeypatch.setattr(ConfigClass, 'FINALIZE_PART_SIZE', 5 * 1024 * 1024)
+    monkeypatch.setattr(object_upload, 'PART_RETRY_DELAY', 0)
+
+
+def test_get_part_size_should_stay_within_part_count_limit(monkeypatch):
+    monkeypatch.setattr(ConfigClass, 'FINALIZE_PART_SIZE', 16 * 1024 * 1024)
+
+    assert get_part_size(50 * 1024**3) == 16 * 1024 * 1024
+    assert get_part_size(1024**4) == 105 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_upload_object_parts_should_assemble_parts_in_order(mock_minio_multipart, small_parts):
+    data = b'0' * 5 * 1024 * 1024 + b'1' * 5 * 1024 * 1024 + b'2' * 1024
+
+    version_id = await upload_object_parts(
+        mock.MagicMock(), Minio_Client(), 'core-any', 'any', BytesIO(data), len(data), 2
+    )
+
+    assert version_id == 'fake_version_id'
+    assert mock_minio_multipart['fake_upload_id']['object'] == data
+
+
+@pytest.mark.asyncio
+async def test_upload_object_parts_should_report_progress_after_every_part(mock_minio_multipart, small_parts):
+    data = b'0' * 5 * 1024 * 1024 + b'1' * 1024
+    reported = []
+
+    async def progress(done, total):
+        reported.append((done, total))
+
+    await upload_object_parts(
+        mock.MagicMock(), Minio_Client(), 'core-any', 'any', BytesIO(data), len(data), 1, progress=progress
+    )
+
+    assert reported == [(1, 2), (2, 2)]
+
+
+@pytest.mark.asyncio
+async def test_upload_object_parts_should_retry_failed_part(monkeypatch, mock_minio_multipart, small_parts):
+    upload_part = Minio._upload_part
+    failures = []
+
+    def flaky_upload_part(self, bucket, obj_path, data, headers, upload_id, part_number):
+        if part_number == 2 and not failures:
+            failures.append(part_number)
+            raise Exception('connection reset')
+        return upload_part(self, bucket, obj_path, data, headers, upload_id, part_number)
+
+    monkeypatch.setattr(Minio, '_upload_part', flaky_upload_part)
+    data = b'0' * 5 * 1024 * 1024 + b'1' * 1024
+
+    await upload_object_parts(mock.MagicMock(), Minio_Client(), 'core-any', 'any', BytesIO(data), len(data))
+
+    assert failures == [2]
+    assert mock_minio_multipart['fake_upload_id']['object'] == data
+
+
+@pytest.mark.asyncio
+async def test_upload_object_parts_should_abort_upload_when_part_keeps_failing(
+    monkeypatch, mock_minio_multipart, small_parts
+):
+    def failing_upload_part(self, bucket, obj_path, data, headers, upload_id, part_number):
+        raise Exception('connection reset')
+
+    monkeypatch.setattr(Minio, '_upload_part', failing_upload_part)
+
+    with pytest.raises(Exception, match='connection reset'):
+        await upload_object_parts(mock.MagicMock(), Minio_Client(), 'core-any', 'any', BytesIO(b'0' * 1024), 1024)
+
+    assert mock_minio_multipart == {}
@@ -0,0 +1,250 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import base64
+import errno
+import gzip
+import hashlib
+import os
+from io import BytesIO
+
+import pytest
+
+from app.config import ConfigClass
+from app.resources import staging
+from app.resources.staging import ChainedChunkReader
+from app.resources.staging import ChunkDigestError
+from app.resources.staging import ChunkEncodingError
+from app.resources.staging import ChunkFileSink
+from app.resources.staging import ChunkRequestError
+from app.resources.staging import DecodingSink
+from app.resources.staging import DigestSink
+from app.resources.staging import OffsetFileSink
+from app.resources.staging import append_chunk
+from app.resources.staging import choose_staging_dir
+from app.resources.staging import copy_file_data
+from app.resources.staging import copy_to_sink
+from app.resources.staging import get_chunk_offset
+from app.resources.staging import get_merkle_root
+from app.resources.staging import get_staging_dir
+from app.resources.staging import open_chunk_sink
+from app.resources.staging import preallocate_file
+from app.resources.staging import stream_to_sink
+from app.resources.staging import write_at_offset
+
+
+def test_get_chunk_offset_should_return_offset_of_chunk_number():
+    assert get_chunk_offset(1, 1024) == 0
+    assert get_chunk_offset(3, 1024) == 2048
+
+
+def test_write_at_offset_should_write_chunks_in_any_order(tmp_path):
+    target_file = str(tmp_path / 'any')
+    preallocate_file(target_file, 10)
+
+    write_at_offset(target_file, get_chunk_offset(2, 4), BytesIO(b'efgh'), 10)
+    write_at_offset(target_file, get_chunk_offset(3, 4), BytesIO(b'ij'), 10)
+    write_at_offset(target_file, get_chunk_offset(1, 4), BytesIO(b'abcd'), 10)
+
+    with open(target_file, 'rb') as f:
+        assert f.read() == b'abcdefghij'
+
+
+def test_write_at_offset_should_raise_when_chunk_exceeds_total_size(tmp_path):
+    target_file = str(tmp_path / 'any')
+    preallocate_file(target_file, 4)
+
+    with pytest.raises(ChunkRequestError):
+        write_at_offset(target_file, 2, BytesIO(b'abcd'), 4)
+
+
+def test_open_chunk_sink_should_return_sink_of_upload_mode(tmp_path):
+    preallocate_file(str(tmp_path / 'any'), 10)
+
+    sink = open_chunk_sink({}, str(tmp_path), 'any', 1)
+    sink.close()
+    assert isinstance(sink, ChunkFileSink)
+    assert (tmp_path / 'any_part_001').exists()
+
+    sink = open_chunk_sink({'upload_mode': 'PREALLOCATED', 'chunk_size': 4, 'total_size': 10}, str(tmp_path), 'any', 2)
+    sink.close()
+    assert isinstance(sink, OffsetFileSink)
+    assert sink.offset == 4
+
+
+@pytest.mark.asyncio
+async def test_stream_to_sink_should_write_every_piece_of_the_stream(tmp_path):
+    async def stream():
+        for piece in (b'ab', b'cd', b'e'):
+            yield piece
+
+    await stream_to_sink(stream(), ChunkFileSink(str(tmp_path / 'any')))
+
+    with open(str(tmp_path / 'any'), 'rb') as f:
+        assert f.read() == b'abcde'
+
+
+def test_digest_sink_should_raise_when_content_md5_does_not_match(tmp_path):
+    sink = DigestSink(ChunkFileSink(str(tmp_path / 'any')))
+    sink.write(b'abcd')
+    sink.close()
+
+    sink.check_md5(base64.b64encode(hashlib.md5(b'abcd').digest()).decode())
+    with pytest.raises(ChunkDigestError):
+        sink.check_md5(base64.b64encode(hashlib.md5(b'other').digest()).decode())
+
+
+def test_get_merkle_root_should_hash_pairs_and_promote_odd_node():
+    leaves = [hashlib.sha256(chunk).digest() for chunk in (b'a', b'b', b'c')]
+    expected = hashlib.sha256(hashlib.sha256(leaves[0] + leaves[1]).digest() + leaves[2]).hexdigest()
+
+    assert get_merkle_root([leaf.hex() for leaf in leaves]) == expected
+    assert get_merkle_root([leaves[0].hex()]) == leaves[0].hex()
+
+
+def test_decoding_sink_should_write_decompressed_gzip_data(tmp_path):
+    data = b'0123456789' * 300000
+    sink = DecodingSink(ChunkFileSink(str(tmp_path / 'any')), 'gzip', len(data))
+
+    copy_to_sink(BytesIO(gzip.compress(data)), sink)
+    sink.check_complete()
+
+    with open(tmp_path / 'any', 'rb') as f:
+        assert f.read() == data
+
+
+def test_decoding_sink_should_raise_when_decompressed_data_exceeds_max_size(tmp_path):
+    sink = DecodingSink(ChunkFileSink(str(tmp_path / 'any')), 'gzip', 1024)
+
+    with pytest.raises(ChunkEncodingError):
+        copy_to_sink(BytesIO(gzip.compress(b'0' * 1025)), sink)
+
+
+def test_decoding_sink_should_write_every_gzip_member(tmp_path):
+    sink = DecodingSink(ChunkFileSink(str(tmp_path / 'any')), 'gzip', 1024)
+
+    copy_to_sink(BytesIO(gzip.compress(b'first ') + gzip.compress(b'second')), sink)
+    sink.check_complete()
+
+    with open(tmp_path / 'any', 'rb') as f:
+        assert f.read() == b'first second'
+
+
+def test_decoding_sink_should_raise_when_zstd_frame_is_truncated(tmp_path):
+    import zstandard
+
+    sink = DecodingSink(ChunkFileSink(str(tmp_path / 'any')), 'zstd', 1024)
+    copy_to_sink(BytesIO(zstandard.ZstdCompressor().compress(b'0123456789' * 50)[:-4]), sink)
+
+    with pytest.raises(ChunkEncodingError):
+        sink.check_complete()
+
+
+def test_choose_staging_dir_should_shard_identifier_over_volumes(monkeypatch, tmp_path):
+    monkeypatch.setattr(ConfigClass, 'STAGING_VOLUMES', '{0}/a, {0}/b'.format(tmp_path))
+    monkeypatch.setattr(ConfigClass, 'STAGING_SHARD_LEVELS', 2)
+    digest = hashlib.sha1(b'fake_global_entity_id').hexdigest()
+
+    staging_dir = choose_staging_dir('fake_global_entity_id')
+
+    volume = ['{}/a'.format(tmp_path), '{}/b'.format(tmp_path)][int(digest, 16) % 2]
+    assert staging_dir == os.path.join(volume, digest[:2], digest[2:4], 'fake_global_entity_id')
+    assert choose_staging_dir('fake_global_entity_id') == staging_dir
+
+
+def test_get_staging_dir_should_fall_back_to_flat_layout_for_older_jobs():
+    assert get_staging_dir('fake_global_entity_id', {'staging_dir': '/volume/ab/cd/fake_global_entity_id'}) == (
+        '/volume/ab/cd/fake_global_entity_id'
+    )
+    assert get_staging_dir('fake_global_entity_id', {}) == os.path.join(ConfigClass.TEMP_BASE, 'fake_global_entity_id')
+
+
+def test_append_chunk_should_append_chunks_in_order_and_remove_them(tmp_path):
+    for chunk_number in (1, 2):
+        with open(tmp_path / 'any_part_00{}'.format(chunk_number), 'wb') as f:
+            f.write(str(chunk_number).encode() * 1024)
+
+    with open(tmp_path / 'any', 'wb') as target_file:
+        append_chunk(target_file, str(tmp_path / 'any_part_001'))
+        append_chunk(target_file, str(tmp_path / 'any_part_002'))
+
+    with open(tmp_path / 'any', 'rb') as f:
+        assert f.read() == b'1' * 1024 + b'2' * 1024
+    assert not os.path.exists(tmp_path / 'any_part_001')
+    assert not os.path.exists(tmp_path / 'any_part_002')
+
+
+def test_copy_file_data_should_fall_back_when_kernel_copy_is_not_supported(monkeypatch, tmp_path):
+    def copy_file_range(src, dst, count, offset_src=None, offset_dst=None):
+        raise OSError(errno.EINVAL, 'unsupported')
+
+    def sendfile(out_fd, in_fd, offset, count):
+        raise OSError(errno.ENOSYS, 'unsupported')
+
+    copy_buffered = staging._copy_buffered
+    buffered_copies = []
+
+    def counting_copy_buffered(source_fd, target_fd, count):
+        buffered_copies.append(count)
+        return copy_buffered(source_fd, target_fd, count)
+
+    monkeypatch.setattr(os, 'copy_file_range', copy_file_range, raising=False)
+    monkeypatch.setattr(os, 'sendfile', sendfile, raising=False)
+    monkeypatch.setattr(staging, '_copy_buffered', counting_copy_buffered)
+    with open(tmp_path / 'any_part_001', 'wb') as f:
+        f.write(os.urandom(3 * 1024 * 1024 + 1))
+
+    with open(tmp_path / 'any_part_001', 'rb') as source, open(tmp_path / 'any', 'wb') as target:
+        assert copy_file_data(source.fileno(), target.fileno(), 3 * 1024 * 1024 + 1) == 3 * 1024 * 1024 + 1
+
+    # the copy was done in COPY_BUFFER_SIZE pieces once the kernel copies were refused
+    assert len(buffered_copies) == 4
+    with open(tmp_path / 'any_part_001', 'rb') as source, open(tmp_path / 'any', 'rb') as target:
+        assert target.read() == source.read()
+
+
+def test_chained_chunk_reader_should_read_chunks_in_order_and_remove_them(tmp_path):
+    chunk_paths = []
+    for chunk_number in (1, 2, 3):
+        chunk_paths.append(str(tmp_path / 'any_part_00{}'.format(chunk_number)))
+        with open(chunk_paths[-1], 'wb') as f:
+            f.write(str(chunk_number).encode() * 5)
+    reader = ChainedChunkReader(chunk_paths)
+
+    assert reader.length == 15
+    assert reader.read(7) == b'1111122'
+    assert not os.path.exists(chunk_paths[0])
+    assert os.path.exists(chunk_paths[1])
+    assert reader.read() == b'22233333'
+    assert reader.read(7) == b''
+    assert not any(os.path.exists(chunk_path) for chunk_path in chunk_paths)
+
+
+def test_chained_chunk_reader_should_keep_chunks_not_read_when_closed(tmp_path):
+    chunk_paths = [str(tmp_path / 'any_part_001'), str(tmp_path / 'any_part_002')]
+    for chunk_path in chunk_paths:
+        with open(chunk_path, 'wb') as f:
+            f.write(b'0' * 5)
+    reader = ChainedChunkReader(chunk_paths)
+
+    reader.read(3)
+    reader.close()
+
+    assert all(os.path.exists(chunk_path) for chunk_path in chunk_paths)
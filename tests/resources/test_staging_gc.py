@@ -0,0 +1,134 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import json
+import os
+from unittest import mock
+
+import pytest
+from aioredis import StrictRedis
+from starlette.config import environ
+
+from app.commons.data_providers import upload_progress_set_signed
+from app.config import ConfigClass
+from app.resources.staging_gc import get_last_activity
+from app.resources.staging_gc import get_sweep_stats
+from app.resources.staging_gc import remove_staging_dir
+from app.resources.staging_gc import sweep_staging
+
+_JOB_KEY = 'dataaction:1234:fake_global_entity_id:data_upload:any:me:any'
+
+
+def get_job_record(status, update_timestamp):
+    return json.dumps(
+        {
+            'session_id': '1234',
+            'job_id': 'fake_global_entity_id',
+            'source': 'any',
+            'action': 'data_upload',
+            'status': status,
+            'project_code': 'any',
+            'operator': 'me',
+            'progress': 0,
+            'payload': {'task_id': 'fake_global_entity_id', 'resumable_identifier': 'fake_global_entity_id'},
+            'update_timestamp': str(update_timestamp),
+        }
+    )
+
+
+def test_remove_staging_dir_should_return_bytes_written(tmp_path):
+    staging_dir = tmp_path / 'fake_global_entity_id'
+    staging_dir.mkdir()
+    (staging_dir / 'any_part_001').write_bytes(b'0' * 8192)
+
+    assert remove_staging_dir(str(staging_dir)) >= 8192
+    assert not staging_dir.exists()
+    assert remove_staging_dir(str(staging_dir)) == 0
+
+
+def test_get_last_activity_should_prefer_latest_chunk_progress():
+    job = {'update_timestamp': '1000'}
+
+    assert get_last_activity(job, {}) == 1000
+    assert get_last_activity(job, {'updated_at': '2000500'}) == 2000.5
+
+
+def test_get_last_activity_should_keep_presigned_upload_live_while_part_urls_are_valid():
+    job = {'update_timestamp': '1000'}
+
+    last_activity = get_last_activity(job, {'updated_at': '2000000', 'signed_at': '3000000'})
+
+    assert last_activity == 3000 + ConfigClass.MINIO_PRESIGNED_URL_EXPIRY
+
+
+@pytest.mark.asyncio
+async def test_sweep_staging_terminates_inactive_upload(httpx_mock, create_job_folder):
+    httpx_mock.add_response(
+        method='DELETE', url='http://data_ops_util_service/v2/resource/lock/', json={}, status_code=200
+    )
+    cache = StrictRedis(host=environ.get('REDIS_HOST'))
+    await cache.set(_JOB_KEY, get_job_record('PRE_UPLOADED', 1000))
+
+    stats = await sweep_staging(mock.MagicMock())
+
+    assert stats['reclaimed_jobs'] == 1
+    assert stats['reclaimed_bytes'] > 0
+    assert not os.path.exists('tests/fake_global_entity_id')
+    record = json.loads(await cache.get(_JOB_KEY))
+    assert record['status'] == 'TERMINATED'
+    assert record['payload']['error_msg'].startswith('Upload inactive for more than')
+    assert (await get_sweep_stats())['reclaimed_jobs'] == 1
+    # the next sweep belongs to the instance which leads the next interval
+    assert await sweep_staging(mock.MagicMock()) == {}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('status', ['CHUNK_UPLOADED', 'FINALIZED'])
+async def test_sweep_staging_skips_finalizing_upload(status):
+    cache = StrictRedis(host=environ.get('REDIS_HOST'))
+    await cache.set(_JOB_KEY, get_job_record(status, 1000))
+
+    stats = await sweep_staging(mock.MagicMock())
+
+    assert stats['reclaimed_jobs'] == 0
+    assert json.loads(await cache.get(_JOB_KEY))['status'] == status
+
+
+@pytest.mark.asyncio
+async def test_sweep_staging_skips_presigned_upload_with_valid_part_urls():
+    cache = StrictRedis(host=environ.get('REDIS_HOST'))
+    await cache.set(_JOB_KEY, get_job_record('PRE_UPLOADED', 1000))
+    await upload_progress_set_signed('fake_global_entity_id')
+
+    stats = await sweep_staging(mock.MagicMock())
+
+    assert stats['reclaimed_jobs'] == 0
+    assert json.loads(await cache.get(_JOB_KEY))['status'] == 'PRE_UPLOADED'
+
+
+@pytest.mark.asyncio
+async def test_sweep_staging_drops_old_finished_job_records():
+    cache = StrictRedis(host=environ.get('REDIS_HOST'))
+    await cache.set(_JOB_KEY, get_job_record('SUCCEED', 1000))
+
+    stats = await sweep_staging(mock.MagicMock())
+
+    assert stats['dropped_records'] == 1
+    assert await cache.get(_JOB_KEY) is None
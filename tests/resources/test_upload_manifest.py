@@ -0,0 +1,69 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import pytest
+
+from app.commons.data_providers import upload_manifest_get
+from app.commons.data_providers import upload_manifest_set
+from app.commons.data_providers import upload_state_delete
+from app.resources.upload_manifest import cache_upload_manifest
+from app.resources.upload_manifest import drop_upload_manifest
+from app.resources.upload_manifest import get_upload_manifest
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+
+async def test_get_upload_manifest_should_read_redis_once(monkeypatch):
+    await upload_manifest_set('any', {'session_id': '1234'})
+    assert await get_upload_manifest('any') == {'session_id': '1234'}
+
+    async def fail(resumable_identifier):
+        raise AssertionError('manifest read again')
+
+    monkeypatch.setattr('app.resources.upload_manifest.upload_manifest_get', fail)
+    assert await get_upload_manifest('any') == {'session_id': '1234'}
+
+
+async def test_get_upload_manifest_should_return_empty_manifest_when_not_recorded():
+    assert await get_upload_manifest('any') == {}
+    assert await upload_manifest_get('any') == {}
+
+
+async def test_cache_upload_manifest_should_forget_least_recently_used(monkeypatch):
+    from app.config import ConfigClass
+
+    monkeypatch.setattr(ConfigClass, 'MANIFEST_CACHE_SIZE', 2)
+    cache_upload_manifest('first', {'session_id': '1'})
+    cache_upload_manifest('second', {'session_id': '2'})
+    assert await get_upload_manifest('first') == {'session_id': '1'}
+    cache_upload_manifest('third', {'session_id': '3'})
+
+    assert await get_upload_manifest('first') == {'session_id': '1'}
+    assert await get_upload_manifest('second') == {}
+
+
+async def test_drop_upload_manifest_should_read_redis_again(monkeypatch):
+    await upload_manifest_set('any', {'session_id': '1234'})
+    assert await get_upload_manifest('any') == {'session_id': '1234'}
+
+    await upload_state_delete('any')
+    drop_upload_manifest('any')
+
+    assert await get_upload_manifest('any') == {}
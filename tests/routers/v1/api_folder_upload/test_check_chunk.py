@@ -0,0 +1,123 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import pytest
+
+from app.commons.data_providers import get_missing_chunks
+from app.commons.data_providers import upload_chunks_set
+from app.commons.data_providers import upload_session_stats_get
+from app.commons.data_providers import upload_session_stats_record
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+
+async def test_check_chunk_return_400_when_session_id_header_is_missing(test_async_client, httpx_mock):
+    response = await test_async_client.get(
+        '/v1/files/chunks',
+        query_string={'resumable_identifier': 'fake_global_entity_id', 'resumable_chunk_number': 1},
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Invalid Session ID: None'
+
+
+async def test_check_chunk_return_404_when_chunk_is_not_received(test_async_client, httpx_mock):
+    response = await test_async_client.get(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234'},
+        query_string={'resumable_identifier': 'fake_global_entity_id', 'resumable_chunk_number': 1},
+    )
+    assert response.status_code == 404
+    assert response.json()['result'] == {
+        'resumable_identifier': 'fake_global_entity_id',
+        'resumable_chunk_number': 1,
+        'received': False,
+    }
+
+
+async def test_check_chunk_return_200_when_chunk_is_received(test_async_client, httpx_mock):
+    await upload_chunks_set('fake_global_entity_id', 1)
+
+    response = await test_async_client.get(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234'},
+        query_string={'resumable_identifier': 'fake_global_entity_id', 'resumable_chunk_number': 1},
+    )
+    assert response.status_code == 200
+    assert response.json()['result']['received'] is True
+
+
+async def test_get_chunks_bitmap_return_received_and_missing_chunks(test_async_client, httpx_mock):
+    await upload_chunks_set('fake_global_entity_id', 1)
+    await upload_chunks_set('fake_global_entity_id', 3)
+
+    response = await test_async_client.get(
+        '/v1/files/chunks/bitmap',
+        headers={'Session-Id': '1234'},
+        query_string={'resumable_identifier': 'fake_global_entity_id', 'resumable_total_chunks': 4},
+    )
+    assert response.status_code == 200
+    assert response.json()['result'] == {
+        'resumable_identifier': 'fake_global_entity_id',
+        'bitmap': 'oA==',
+        'received_chunks': 2,
+        'missing_chunks': [2, 4],
+    }
+
+
+async def test_get_chunks_bitmap_return_400_when_total_chunks_is_out_of_range(test_async_client, httpx_mock):
+    response = await test_async_client.get(
+        '/v1/files/chunks/bitmap',
+        headers={'Session-Id': '1234'},
+        query_string={'resumable_identifier': 'fake_global_entity_id', 'resumable_total_chunks': 10**9},
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'resumable_total_chunks must be between 1 and 10000'
+
+
+def test_get_missing_chunks_should_read_bits_most_significant_first():
+    assert get_missing_chunks(b'\xa0', 4) == [2, 4]
+    assert get_missing_chunks(b'\xff', 10) == [9, 10]
+    assert get_missing_chunks(b'', 2) == [1, 2]
+
+
+async def test_upload_chunks_set_count_the_chunk_in_the_session_stats():
+    await upload_chunks_set('fake_global_entity_id', 1, '', 1024, session_id='1234')
+    await upload_chunks_set('fake_global_entity_id', 2, '', 1024, session_id='1234')
+
+    stats = await upload_session_stats_get('1234')
+    assert stats['chunks'] == '2'
+    assert stats['bytes'] == '2048'
+    assert 'errors' not in stats
+
+
+async def test_get_chunk_advice_return_recommendation_from_session_stats(test_async_client, httpx_mock):
+    await upload_session_stats_record('1234', 4 * 1024 * 1024)
+    await upload_session_stats_record('1234', 0, failed=True)
+
+    response = await test_async_client.get(
+        '/v1/files/chunks/advice',
+        headers={'Session-Id': '1234'},
+        query_string={'resumable_total_size': 100 * 1024 * 1024},
+    )
+    assert response.status_code == 200
+    result = response.json()['result']
+    assert result['error_rate'] == 0.5
+    assert result['parallelism'] == 1
+    assert result['chunk_size'] * result['total_chunks'] <= 100 * 1024 * 1024
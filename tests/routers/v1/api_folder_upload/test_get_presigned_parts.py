@@ -0,0 +1,101 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import pytest
+
+from app.commons.data_providers import upload_progress_get_many
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+
+async def test_get_presigned_parts_return_400_when_session_id_header_is_missing(test_async_client, httpx_mock):
+    response = await test_async_client.get(
+        '/v1/files/parts',
+        query_string={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_total_chunks': 2,
+        },
+    )
+    assert response.status_code == 400
+    assert response.json() == {
+        'code': 400,
+        'error_msg': 'Invalid Session ID: None',
+        'page': 0,
+        'total': 1,
+        'num_of_pages': 1,
+        'result': {},
+    }
+
+
+async def test_get_presigned_parts_return_401_when_authorization_header_is_missing(test_async_client, httpx_mock):
+    response = await test_async_client.get(
+        '/v1/files/parts',
+        headers={'Session-Id': '1234'},
+        query_string={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_total_chunks': 2,
+        },
+    )
+    assert response.status_code == 401
+    assert response.json()['error_msg'] == 'Authorization is required to sign the part urls'
+
+
+async def test_get_presigned_parts_return_400_when_job_is_not_presigned(test_async_client, httpx_mock, create_fake_job):
+    response = await test_async_client.get(
+        '/v1/files/parts',
+        headers={'Session-Id': '1234', 'Authorization': 'token', 'Refresh-Token': 'refresh_token'},
+        query_string={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_total_chunks': 2,
+        },
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Job fake_global_entity_id is not a PRESIGNED upload'
+
+
+async def test_get_presigned_parts_return_200_with_part_urls(
+    test_async_client, httpx_mock, create_fake_presigned_job, mock_minio_multipart
+):
+    response = await test_async_client.get(
+        '/v1/files/parts',
+        headers={'Session-Id': '1234', 'Authorization': 'token', 'Refresh-Token': 'refresh_token'},
+        query_string={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_total_chunks': 2,
+        },
+    )
+    assert response.status_code == 200
+    result = response.json()['result']
+    assert result['upload_id'] == 'fake_upload_id'
+    assert result['expires_in'] == 3600
+    assert result['parts'] == [
+        {'part_number': 1, 'url': 'http://minio/core-any/any?uploadId=fake_upload_id&partNumber=1'},
+        {'part_number': 2, 'url': 'http://minio/core-any/any?uploadId=fake_upload_id&partNumber=2'},
+    ]
+    progress = (await upload_progress_get_many(['fake_global_entity_id']))[0]
+    assert int(progress['signed_at']) > 0
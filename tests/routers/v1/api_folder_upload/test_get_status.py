@@ -18,7 +18,15 @@
 # permissions and limitations under the Licence.
 # 
 
+import json
+
 import pytest
+from aioredis import StrictRedis
+from starlette.config import environ
+
+from app.commons.data_providers import get_upload_progress
+from app.commons.data_providers import upload_chunks_set
+from app.commons.data_providers import upload_progress_set_stage
 
 pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
 
@@ -58,3 +66,40 @@ async def test_get_files_jobs_return_200_and_job_data_in_results(test_async_clie
     assert result['operator'] == 'me'
     assert result['payload']['task_id'] == 'fake_global_entity_id'
     assert result['payload']['resumable_identifier'] == 'fake_global_entity_id'
+
+
+async def test_get_files_jobs_return_live_progress_of_the_upload(test_async_client, httpx_mock, create_fake_job):
+    await upload_chunks_set('fake_global_entity_id', 1, '', 1024)
+    await upload_progress_set_stage('fake_global_entity_id', 'merging', 1, 4)
+
+    response = await test_async_client.get(
+        '/v1/files/jobs', headers={'Session-Id': '1234'}, query_string={'project_code': 'any', 'operator': 'me'}
+    )
+    assert response.status_code == 200
+    progress = response.json()['result'][0]['payload']['progress']
+    assert progress['bytes_received'] == 1024
+    assert progress['stage'] == 'merging'
+    assert progress['stage_progress'] == 25
+
+
+async def test_upload_chunks_set_writes_progress_behind_into_job_record():
+    cache = StrictRedis(host=environ.get('REDIS_HOST'))
+    job_key = 'dataaction:1234:fake_global_entity_id:data_upload:any:me:any'
+    await cache.set(job_key, json.dumps({'status': 'CHUNK_UPLOADED', 'progress': 0}))
+
+    await upload_chunks_set('fake_global_entity_id', 1, '', 1024, 4, job_key)
+    assert json.loads(await cache.get(job_key)) == {'status': 'CHUNK_UPLOADED', 'progress': 25}
+
+    # the next chunks are coalesced until the upload is complete
+    await upload_chunks_set('fake_global_entity_id', 2, '', 1024, 4, job_key)
+    assert json.loads(await cache.get(job_key))['progress'] == 25
+    await upload_chunks_set('fake_global_entity_id', 3, '', 1024, 4, job_key)
+    await upload_chunks_set('fake_global_entity_id', 4, '', 1024, 4, job_key)
+    assert json.loads(await cache.get(job_key)) == {'status': 'CHUNK_UPLOADED', 'progress': 100}
+
+
+def test_get_upload_progress_computes_throughput_and_eta():
+    raw_progress = {'bytes_received': '2048', 'started_at': '1000', 'updated_at': '3000'}
+
+    assert get_upload_progress(raw_progress, 4096) == {'bytes_received': 2048, 'throughput': 1024, 'eta': 2.0}
+    assert get_upload_progress({}) == {'bytes_received': 0, 'throughput': None, 'eta': None}
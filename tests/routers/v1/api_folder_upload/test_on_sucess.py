@@ -18,6 +18,8 @@
 # permissions and limitations under the Licence.
 # 
 
+import hashlib
+
 import mock
 import pytest
 
@@ -100,3 +102,204 @@ async def test_on_success_return_200_when_success(
     assert result['operator'] == 'me'
     assert result['payload']['task_id'] == 'fake_global_entity_id'
     assert result['payload']['resumable_identifier'] == 'fake_global_entity_id'
+
+
+async def test_complete_multipart_upload_assembles_recorded_parts(mock_minio_multipart):
+    from app.commons.data_providers import upload_parts_set
+    from app.models.fsm_file_upload import FsmMgrUpload
+    from app.routers.v1.api_data_upload import complete_multipart_upload
+
+    mock_minio_multipart['fake_upload_id'] = {'bucket': 'core-any', 'object_path': 'any', 'parts': {1: b'a', 2: b'b'}}
+    await upload_parts_set('fake_global_entity_id', 1, 'etag_1')
+    await upload_parts_set('fake_global_entity_id', 2, 'etag_2')
+    status_mgr = FsmMgrUpload('1234', 'any', 'data_upload', 'me', 'fake_global_entity_id')
+    status_mgr.payload = {
+        'resumable_identifier': 'fake_global_entity_id',
+        'bucket': 'core-any',
+        'object_path': 'any',
+        'upload_id': 'fake_upload_id',
+    }
+
+    version_id = await complete_multipart_upload(mock.MagicMock(), status_mgr, 2, 'token', 'refresh_token')
+
+    assert version_id == 'fake_version_id'
+    assert mock_minio_multipart['fake_upload_id']['object'] == b'ab'
+    assert status_mgr.payload['parts'] == {'1': 'etag_1', '2': 'etag_2'}
+
+
+async def test_complete_multipart_upload_raises_when_parts_are_missing(mock_minio_multipart):
+    from app.commons.data_providers import upload_parts_set
+    from app.models.fsm_file_upload import FsmMgrUpload
+    from app.routers.v1.api_data_upload import complete_multipart_upload
+
+    await upload_parts_set('fake_global_entity_id', 1, 'etag_1')
+    status_mgr = FsmMgrUpload('1234', 'any', 'data_upload', 'me', 'fake_global_entity_id')
+    status_mgr.payload = {'resumable_identifier': 'fake_global_entity_id'}
+
+    with pytest.raises(Exception) as excinfo:
+        await complete_multipart_upload(mock.MagicMock(), status_mgr, 3, 'token', 'refresh_token')
+    assert str(excinfo.value) == 'multipart upload is missing parts: [2, 3]'
+
+
+async def test_complete_multipart_upload_lists_parts_of_presigned_upload(mock_minio_multipart):
+    from app.models.fsm_file_upload import FsmMgrUpload
+    from app.routers.v1.api_data_upload import complete_multipart_upload
+
+    mock_minio_multipart['fake_upload_id'] = {'bucket': 'core-any', 'object_path': 'any', 'parts': {1: b'a', 2: b'b'}}
+    status_mgr = FsmMgrUpload('1234', 'any', 'data_upload', 'me', 'fake_global_entity_id')
+    status_mgr.payload = {
+        'resumable_identifier': 'fake_global_entity_id',
+        'upload_mode': 'PRESIGNED',
+        'bucket': 'core-any',
+        'object_path': 'any',
+        'upload_id': 'fake_upload_id',
+    }
+
+    version_id = await complete_multipart_upload(mock.MagicMock(), status_mgr, 2, 'token', 'refresh_token')
+
+    assert version_id == 'fake_version_id'
+    assert mock_minio_multipart['fake_upload_id']['object'] == b'ab'
+    assert status_mgr.payload['parts'] == {'1': 'etag_1', '2': 'etag_2'}
+
+
+async def test_on_success_return_400_when_chunks_are_missing(
+    test_async_client, httpx_mock, create_fake_preallocated_job
+):
+    response = await test_async_client.post(
+        '/v1/files',
+        headers={'Session-Id': '1234'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_relative_path': './',
+            'resumable_total_chunks': 2,
+            'resumable_total_size': 2048,
+        },
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Chunks are missing for job fake_global_entity_id'
+    assert response.json()['result'] == {'missing_chunks': [1, 2]}
+
+
+@mock.patch('app.routers.v1.api_data_upload.finalize_worker')
+async def test_on_success_does_not_finalize_twice(fake_finalize_worker, test_async_client, httpx_mock, create_fake_job):
+    from app.commons.data_providers import upload_finalize_claim
+
+    assert await upload_finalize_claim('fake_global_entity_id')
+
+    response = await test_async_client.post(
+        '/v1/files',
+        headers={'Session-Id': '1234'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_relative_path': './',
+            'resumable_total_chunks': 1,
+            'resumable_total_size': 10,
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()['result']['status'] == 'PRE_UPLOADED'
+    fake_finalize_worker.assert_not_called()
+
+
+@mock.patch('app.routers.v1.api_data_upload.finalize_worker')
+async def test_on_success_does_not_finalize_succeed_job_again(
+    fake_finalize_worker, test_async_client, httpx_mock, create_fake_succeed_job
+):
+    response = await test_async_client.post(
+        '/v1/files',
+        headers={'Session-Id': '1234'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_relative_path': './',
+            'resumable_total_chunks': 1,
+            'resumable_total_size': 10,
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()['result']['status'] == 'SUCCEED'
+    fake_finalize_worker.assert_not_called()
+
+
+async def test_on_success_return_400_when_merkle_root_does_not_match(test_async_client, httpx_mock, create_fake_job):
+    from app.commons.data_providers import upload_chunks_set
+
+    digest = hashlib.sha256(b'chunk').hexdigest()
+    await upload_chunks_set('fake_global_entity_id', 1, digest)
+
+    response = await test_async_client.post(
+        '/v1/files',
+        headers={'Session-Id': '1234'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_relative_path': './',
+            'resumable_total_chunks': 1,
+            'resumable_total_size': 10,
+            'merkle_root': 'any',
+        },
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Merkle root mismatch for job fake_global_entity_id'
+    assert response.json()['result'] == {'merkle_root': digest}
+
+
+async def test_on_success_by_identifier_return_404_when_job_has_no_manifest(test_async_client, httpx_mock):
+    response = await test_async_client.post('/v1/files/fake_global_entity_id/finalize', headers={'Session-Id': '1234'})
+    assert response.status_code == 404
+    assert response.json()['error_msg'] == 'Upload manifest not found: fake_global_entity_id'
+
+
+async def test_on_success_by_identifier_checks_chunks_of_manifest(
+    test_async_client, httpx_mock, create_fake_manifest_job
+):
+    from app.commons.data_providers import upload_chunks_set
+
+    await upload_chunks_set('fake_global_entity_id', 1)
+
+    response = await test_async_client.post('/v1/files/fake_global_entity_id/finalize', headers={'Session-Id': '1234'})
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Chunks are missing for job fake_global_entity_id'
+    assert response.json()['result'] == {'missing_chunks': [2]}
+
+
+@mock.patch('app.routers.v1.api_data_upload.finalize_worker')
+async def test_on_success_queues_finalize_when_finalize_queue_is_enabled(
+    fake_finalize_worker, monkeypatch, test_async_client, httpx_mock, create_fake_job
+):
+    from app.commons.data_providers import finalize_queue_create_group
+    from app.commons.data_providers import finalize_queue_read
+    from app.config import ConfigClass
+
+    monkeypatch.setattr(ConfigClass, 'FINALIZE_QUEUE_ENABLED', True)
+    await finalize_queue_create_group()
+
+    response = await test_async_client.post(
+        '/v1/files',
+        headers={'Session-Id': '1234', 'Authorization': 'token'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_relative_path': './',
+            'resumable_total_chunks': 1,
+            'resumable_total_size': 10,
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()['result']['status'] == 'CHUNK_UPLOADED'
+    fake_finalize_worker.assert_not_called()
+    [(_, message, _)] = await finalize_queue_read('any', 1, 1)
+    assert message['job_key'] == 'dataaction:1234:fake_global_entity_id:data_upload:any:me:any'
+    assert message['access_token'] == 'token'
@@ -18,8 +18,12 @@
 # permissions and limitations under the Licence.
 # 
 
+import mock
 import pytest
 
+from app.commons.data_providers import staging_reserve
+from app.routers.v1 import api_data_upload
+
 pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
 
 
@@ -100,3 +104,179 @@ async def test_upload_chunks_return_error_when_when_fails(test_async_client, htt
         'num_of_pages': 1,
         'result': None,
     }
+
+
+async def test_upload_chunks_preallocated_writes_chunk_at_its_offset(
+    test_async_client, httpx_mock, create_job_folder, create_fake_preallocated_job
+):
+    target_file = 'tests/fake_global_entity_id/any'
+    with open(target_file, 'wb') as f:
+        f.truncate(2048)
+    with open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb') as f:
+        chunk = f.read()
+
+    response = await test_async_client.post(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234'},
+        files={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_chunk_number': str(2),
+            'resumable_total_chunks': str(2),
+            'resumable_total_size': str(2048),
+            'chunk_data': ('chunk.txt', open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb'), 'text/plain'),
+        },
+    )
+    assert response.status_code == 200
+    with open(target_file, 'rb') as f:
+        content = f.read()
+    assert len(content) == 2048
+    assert content[:1024] == bytes(1024)
+    assert content[1024:].startswith(chunk)
+
+
+async def test_upload_chunks_return_400_when_chunk_number_exceeds_chunks_of_job(
+    test_async_client, httpx_mock, create_job_folder, create_fake_preallocated_job
+):
+    response = await test_async_client.post(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234'},
+        files={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_chunk_number': str(3),
+            'resumable_total_chunks': str(2),
+            'resumable_total_size': str(2048),
+            'chunk_data': ('chunk.txt', open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb'), 'text/plain'),
+        },
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Chunk number 3 exceeds the 2 chunks of the job'
+
+
+@pytest.mark.parametrize('other_reserved,status_code', [(0, 200), (1000, 400)])
+async def test_upload_chunks_grows_estimated_staging_reservation_until_staging_is_full(
+    test_async_client,
+    httpx_mock,
+    create_job_folder,
+    create_fake_estimated_job,
+    monkeypatch,
+    other_reserved,
+    status_code,
+):
+    monkeypatch.setattr(api_data_upload, 'get_staging_space', lambda: (1024, 1024))
+    await staging_reserve({'fake_global_entity_id': 16, 'other_global_entity_id': other_reserved}, 1024)
+    response = await test_async_client.post(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234'},
+        files={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_chunk_number': str(1),
+            'resumable_total_chunks': str(1),
+            'chunk_data': ('chunk.txt', open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb'), 'text/plain'),
+        },
+    )
+    assert response.status_code == status_code
+    if status_code == 400:
+        assert response.json()['error_msg'] == 'Upload of 718 bytes exceeds the staging capacity, retry later'
+
+
+async def test_upload_chunks_multipart_forwards_chunk_as_part(
+    test_async_client, httpx_mock, create_fake_multipart_job, mock_minio_multipart
+):
+    from app.commons.data_providers import upload_parts_get
+
+    with open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb') as f:
+        chunk = f.read()
+
+    response = await test_async_client.post(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234', 'Authorization': 'token', 'Refresh-Token': 'refresh_token'},
+        files={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_chunk_number': str(2),
+            'resumable_total_chunks': str(2),
+            'resumable_total_size': str(2048),
+            'chunk_data': ('chunk.txt', open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb'), 'text/plain'),
+        },
+    )
+    assert response.status_code == 200
+    assert mock_minio_multipart['fake_upload_id']['parts'][2] == chunk
+    assert await upload_parts_get('fake_global_entity_id') == {2: 'etag_2'}
+
+
+async def test_upload_chunks_multipart_return_400_when_authorization_header_is_missing(
+    test_async_client, httpx_mock, create_fake_multipart_job, mock_minio_multipart
+):
+    response = await test_async_client.post(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234'},
+        files={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_chunk_number': str(2),
+            'resumable_total_chunks': str(2),
+            'resumable_total_size': str(2048),
+            'chunk_data': ('chunk.txt', open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb'), 'text/plain'),
+        },
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Authorization is required to upload the chunks to minio'
+    assert 'fake_upload_id' not in mock_minio_multipart
+
+
+@pytest.mark.parametrize('chunk_number', [0, 10001])
+async def test_upload_chunks_multipart_return_400_when_chunk_number_is_out_of_range(
+    test_async_client, httpx_mock, create_fake_multipart_job, mock_minio_multipart, chunk_number
+):
+    response = await test_async_client.post(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234', 'Authorization': 'token', 'Refresh-Token': 'refresh_token'},
+        files={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_chunk_number': str(chunk_number),
+            'resumable_total_chunks': str(2),
+            'resumable_total_size': str(2048),
+            'chunk_data': ('chunk.txt', open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb'), 'text/plain'),
+        },
+    )
+    assert response.status_code == 400
+    assert 'fake_upload_id' not in mock_minio_multipart
+
+
+@mock.patch('app.routers.v1.api_data_upload.finalize_worker')
+async def test_upload_chunks_starts_finalize_when_last_chunk_lands(
+    fake_finalize_worker, test_async_client, httpx_mock, create_job_folder, create_fake_auto_finalize_job
+):
+    response = await test_async_client.post(
+        '/v1/files/chunks',
+        headers={'Session-Id': '1234', 'Authorization': 'token', 'Refresh-Token': 'refresh_token'},
+        files={
+            'project_code': 'any',
+            'operator': 'me',
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_chunk_number': str(1),
+            'resumable_total_chunks': str(1),
+            'resumable_total_size': str(10),
+            'chunk_data': ('chunk.txt', open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb'), 'text/plain'),
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()['result'] == {'msg': 'Succeed', 'auto_finalize': True}
+    fake_finalize_worker.assert_called_once()
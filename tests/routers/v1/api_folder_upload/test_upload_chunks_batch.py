@@ -0,0 +1,76 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import json
+
+import pytest
+from urllib3 import encode_multipart_formdata
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+
+def batch_body(chunks, chunk_files):
+    fields = [('project_code', 'any'), ('operator', 'me'), ('chunks', json.dumps(chunks))]
+    fields += [('chunk_data', ('chunk', chunk_file, 'application/octet-stream')) for chunk_file in chunk_files]
+    return encode_multipart_formdata(fields)
+
+
+async def test_upload_chunks_batch_return_400_when_chunks_do_not_match_files(test_async_client, httpx_mock):
+    body, content_type = batch_body(
+        [{'resumable_identifier': 'fake_global_entity_id', 'resumable_filename': 'any', 'resumable_chunk_number': 1}],
+        [b'chunk 1', b'chunk 2'],
+    )
+    response = await test_async_client.post(
+        '/v1/files/chunks/batch', headers={'Session-Id': '1234', 'Content-Type': content_type}, data=body
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Invalid chunks: 2 chunk_data files for 1 chunks'
+
+
+async def test_upload_chunks_batch_return_result_entry_per_chunk(
+    test_async_client, httpx_mock, create_job_folder, create_fake_job
+):
+    body, content_type = batch_body(
+        [
+            {'resumable_identifier': 'fake_global_entity_id', 'resumable_filename': 'any', 'resumable_chunk_number': 1},
+            {'resumable_identifier': 'fake_global_entity_id', 'resumable_filename': 'any', 'resumable_chunk_number': 2},
+        ],
+        [b'chunk 1', b'chunk 2'],
+    )
+    response = await test_async_client.post(
+        '/v1/files/chunks/batch', headers={'Session-Id': '1234', 'Content-Type': content_type}, data=body
+    )
+    assert response.status_code == 200
+    assert response.json()['result'] == [
+        {
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_chunk_number': 1,
+            'result': {'msg': 'Succeed'},
+            'code': 200,
+        },
+        {
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_chunk_number': 2,
+            'result': {'msg': 'Succeed'},
+            'code': 200,
+        },
+    ]
+    with open('tests/fake_global_entity_id/any_part_002', 'rb') as f:
+        assert f.read() == b'chunk 2'
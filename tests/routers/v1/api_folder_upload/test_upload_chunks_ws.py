@@ -0,0 +1,102 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import json
+
+import pytest
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+
+def chunk_frame(chunk_number, chunk):
+    header = json.dumps(
+        {
+            'resumable_identifier': 'fake_global_entity_id',
+            'resumable_filename': 'any',
+            'resumable_chunk_number': chunk_number,
+        }
+    ).encode('utf-8')
+    return len(header).to_bytes(4, 'big') + header + chunk
+
+
+async def test_upload_chunks_ws_refuses_channel_without_session_id(test_async_client, httpx_mock):
+    async with test_async_client.websocket_connect('/v1/files/chunks/ws') as websocket:
+        await websocket.send_json({'project_code': 'any', 'operator': 'me'})
+        assert await websocket.receive_json() == {'code': 400, 'error_msg': 'Invalid Session ID: None'}
+
+
+async def test_upload_chunks_ws_acknowledges_every_chunk(
+    test_async_client, httpx_mock, create_job_folder, create_fake_job
+):
+    async with test_async_client.websocket_connect('/v1/files/chunks/ws') as websocket:
+        await websocket.send_json({'session_id': '1234', 'project_code': 'any', 'operator': 'me'})
+        assert await websocket.receive_json() == {'code': 200, 'result': {'msg': 'Ready'}}
+
+        for chunk_number in (1, 2):
+            await websocket.send_bytes(chunk_frame(chunk_number, b'chunk %d' % chunk_number))
+            assert await websocket.receive_json() == {
+                'resumable_identifier': 'fake_global_entity_id',
+                'resumable_chunk_number': chunk_number,
+                'result': {'msg': 'Succeed'},
+                'code': 200,
+            }
+
+    with open('tests/fake_global_entity_id/any_part_002', 'rb') as f:
+        assert f.read() == b'chunk 2'
+
+
+async def test_upload_chunks_ws_refuses_channel_message_which_is_not_json(test_async_client, httpx_mock):
+    async with test_async_client.websocket_connect('/v1/files/chunks/ws') as websocket:
+        await websocket.send_str('session_id=1234')
+        response = await websocket.receive_json()
+    assert response['code'] == 400
+    assert response['error_msg'].startswith('Invalid channel message: ')
+
+
+async def test_upload_chunks_ws_refuses_text_message_instead_of_chunk_frame(
+    test_async_client, httpx_mock, create_job_folder, create_fake_job
+):
+    async with test_async_client.websocket_connect('/v1/files/chunks/ws') as websocket:
+        await websocket.send_json({'session_id': '1234', 'project_code': 'any', 'operator': 'me'})
+        assert await websocket.receive_json() == {'code': 200, 'result': {'msg': 'Ready'}}
+
+        await websocket.send_str('chunk 1')
+        assert await websocket.receive_json() == {
+            'code': 400,
+            'error_msg': 'Invalid chunk frame: expected a bytes message',
+        }
+
+
+async def test_upload_chunks_ws_sends_internal_error_when_chunk_can_not_be_saved(
+    test_async_client, httpx_mock, create_job_folder, create_fake_job, monkeypatch
+):
+    async def fail(*args, **kwargs):
+        raise Exception('redis is gone')
+
+    monkeypatch.setattr('app.routers.v1.api_data_upload.save_session_chunk', fail)
+    async with test_async_client.websocket_connect('/v1/files/chunks/ws') as websocket:
+        await websocket.send_json({'session_id': '1234', 'project_code': 'any', 'operator': 'me'})
+        assert await websocket.receive_json() == {'code': 200, 'result': {'msg': 'Ready'}}
+
+        await websocket.send_bytes(chunk_frame(1, b'chunk 1'))
+        assert await websocket.receive_json() == {
+            'code': 500,
+            'error_msg': '[Internal] api_data_upload redis is gone',
+        }
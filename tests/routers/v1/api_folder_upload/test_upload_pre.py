@@ -22,6 +22,12 @@ from unittest import mock
 
 import pytest
 
+from app.commons.data_providers import memory_reserve
+from app.commons.data_providers import staging_grow
+from app.commons.data_providers import staging_release
+from app.commons.data_providers import staging_reserve
+from app.config import ConfigClass
+from app.routers.v1 import api_data_upload
 from app.routers.v1.api_data_upload import FolderMgr
 from app.routers.v1.api_data_upload import FsmMgrUpload
 
@@ -60,6 +66,40 @@ async def test_files_jobs_return_400_when_session_job_type_is_wrong(test_async_c
     }
 
 
+async def test_files_jobs_return_400_when_preallocated_upload_misses_sizes(test_async_client, httpx_mock):
+    response = await test_async_client.post(
+        '/v1/files/jobs',
+        headers={'Session-Id': '1234'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'job_type': 'AS_FILE',
+            'upload_mode': 'PREALLOCATED',
+            'data': [{'resumable_filename': 'any'}],
+        },
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == (
+        'resumable_total_size and resumable_chunk_size are required for PREALLOCATED upload: any'
+    )
+
+
+async def test_files_jobs_return_401_when_multipart_upload_misses_authorization(test_async_client, httpx_mock):
+    response = await test_async_client.post(
+        '/v1/files/jobs',
+        headers={'Session-Id': '1234'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'job_type': 'AS_FILE',
+            'upload_mode': 'MULTIPART',
+            'data': [{'resumable_filename': 'any', 'resumable_total_size': 1024, 'resumable_chunk_size': 1024}],
+        },
+    )
+    assert response.status_code == 401
+    assert response.json()['error_msg'] == 'Authorization is required for MULTIPART upload'
+
+
 async def test_files_jobs_return_404_when_project_info_not_found(test_async_client, httpx_mock):
     httpx_mock.add_response(
         method='POST',
@@ -471,3 +511,138 @@ async def test_files_jobs_should_return_error_when_FsmMgrUpload_raise_exception(
         'num_of_pages': 1,
         'result': None,
     }
+
+
+@mock.patch.object(FsmMgrUpload, 'get_kv_entity')
+async def test_files_jobs_aborts_multipart_upload_when_job_creation_fails(
+    fake_get_kv_entity, test_async_client, httpx_mock, mock_get_geid_request, create_job_folder, mock_minio_multipart
+):
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Container/query',
+        json=[{'any': 'any', 'global_entity_id': 'fake_global_entity_id'}],
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Core/query',
+        json={},
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST',
+        url='http://data_ops_util_service/v2/resource/lock/',
+        json={},
+        status_code=200,
+    )
+    fake_get_kv_entity.side_effect = Exception()
+    response = await test_async_client.post(
+        '/v1/files/jobs',
+        headers={'Session-Id': '1234', 'Authorization': 'token', 'Refresh-Token': 'refresh_token'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'job_type': 'AS_FILE',
+            'upload_mode': 'MULTIPART',
+            'data': [{'resumable_filename': 'any', 'resumable_total_size': 1024, 'resumable_chunk_size': 1024}],
+        },
+    )
+    assert response.status_code == 500
+    assert 'fake_upload_id' not in mock_minio_multipart
+
+
+async def test_files_jobs_return_503_with_retry_after_when_staging_disk_is_reserved(
+    test_async_client, httpx_mock, mock_get_geid_request, monkeypatch
+):
+    # the file is too large for the memory tier so it needs the staging disk
+    monkeypatch.setattr(ConfigClass, 'MEMORY_STAGING_MAX_SIZE', 0)
+    monkeypatch.setattr(api_data_upload, 'get_staging_space', lambda: (100, 100))
+    await staging_reserve({'other_global_entity_id': 90}, 100)
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Container/query',
+        json=[{'any': 'any', 'global_entity_id': 'fake_global_entity_id'}],
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Core/query',
+        json={},
+        status_code=200,
+    )
+    response = await test_async_client.post(
+        '/v1/files/jobs',
+        headers={'Session-Id': '1234'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'job_type': 'AS_FILE',
+            'data': [{'resumable_filename': 'any', 'resumable_total_size': 20}],
+        },
+    )
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+    assert response.json()['error_msg'] == 'Staging disk is full, retry later'
+
+
+@pytest.mark.parametrize('memory_reserved,staging_tier', [(0, 'memory'), (100, None)])
+async def test_files_jobs_stage_small_file_in_memory_until_memory_budget_is_full(
+    test_async_client, httpx_mock, mock_get_geid_request, create_job_folder, monkeypatch, memory_reserved, staging_tier
+):
+    monkeypatch.setattr(ConfigClass, 'MEMORY_STAGING_BUDGET', 100)
+    monkeypatch.setattr(api_data_upload, 'get_staging_space', lambda: (100, 100))
+    if memory_reserved:
+        await memory_reserve({'other_global_entity_id': memory_reserved}, 100)
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Container/query',
+        json=[{'any': 'any', 'global_entity_id': 'fake_global_entity_id'}],
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Core/query',
+        json={},
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST',
+        url='http://data_ops_util_service/v2/resource/lock/',
+        json={},
+        status_code=200,
+    )
+    response = await test_async_client.post(
+        '/v1/files/jobs',
+        headers={'Session-Id': '1234'},
+        json={
+            'project_code': 'any',
+            'operator': 'me',
+            'job_type': 'AS_FILE',
+            'data': [{'resumable_filename': 'any', 'resumable_total_size': 20, 'resumable_total_chunks': 1}],
+        },
+    )
+    assert response.status_code == 200
+    payload = response.json()['result'][0]['payload']
+    assert payload.get('staging_tier') == staging_tier
+    # a file spilled to the disk tier gets a staging dir instead
+    assert ('staging_dir' in payload) == (staging_tier is None)
+
+
+async def test_staging_reserve_reserves_all_or_none_of_the_files():
+    assert await staging_reserve({'first': 60, 'second': 30}, 100) is True
+    assert await staging_reserve({'third': 5, 'fourth': 10}, 100) is False
+    assert await staging_reserve({'third': 5}, 100) is True
+
+    await staging_release(['first', 'second'])
+
+    assert await staging_reserve({'fourth': 90}, 100) is True
+
+
+async def test_staging_grow_grows_reservation_within_budget():
+    await staging_reserve({'first': 10, 'second': 60}, 100)
+
+    assert await staging_grow('first', 5, 10, 100) is True
+    # grown up to the step ahead of the needed bytes, as far as the budget goes
+    assert await staging_grow('first', 20, 10, 100) is True
+    assert await staging_reserve({'third': 11}, 100) is False
+    assert await staging_grow('first', 41, 10, 100) is False
@@ -0,0 +1,201 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import base64
+import gzip
+import hashlib
+import os
+
+import mock
+import pytest
+
+from app.commons.data_providers import upload_memory_chunks_get
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+
+async def test_upload_raw_chunk_return_400_when_session_id_header_is_missing(test_async_client, httpx_mock):
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/1',
+        headers={'Project-Code': 'any', 'Operator': 'me', 'Resumable-Filename': 'any'},
+        data=b'any',
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Invalid Session ID: None'
+
+
+async def test_upload_raw_chunk_return_400_when_metadata_headers_are_missing(test_async_client, httpx_mock):
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/1', headers={'Session-Id': '1234'}, data=b'any'
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Project-Code, Operator and Resumable-Filename headers are required'
+
+
+async def test_upload_raw_chunk_saves_body_as_chunk(test_async_client, httpx_mock, create_job_folder, create_fake_job):
+    with open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb') as f:
+        chunk = f.read()
+
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/1',
+        headers={
+            'Session-Id': '1234',
+            'Project-Code': 'any',
+            'Operator': 'me',
+            'Resumable-Filename': 'any',
+            'Content-Type': 'application/octet-stream',
+        },
+        data=chunk,
+    )
+    assert response.status_code == 200
+    assert response.json()['result'] == {'msg': 'Succeed'}
+    with open('tests/fake_global_entity_id/any_part_001', 'rb') as f:
+        assert f.read() == chunk
+
+
+async def test_upload_raw_chunk_preallocated_writes_body_at_its_offset(
+    test_async_client, httpx_mock, create_job_folder, create_fake_preallocated_job
+):
+    target_file = 'tests/fake_global_entity_id/any'
+    with open(target_file, 'wb') as f:
+        f.truncate(2048)
+
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/2',
+        headers={'Session-Id': '1234', 'Project-Code': 'any', 'Operator': 'me', 'Resumable-Filename': 'any'},
+        data=b'abcd',
+    )
+    assert response.status_code == 200
+    with open(target_file, 'rb') as f:
+        content = f.read()
+    assert content[1024:1028] == b'abcd'
+
+
+async def test_upload_raw_chunk_return_400_when_content_md5_does_not_match(
+    test_async_client, httpx_mock, create_job_folder, create_fake_job
+):
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/1',
+        headers={
+            'Session-Id': '1234',
+            'Project-Code': 'any',
+            'Operator': 'me',
+            'Resumable-Filename': 'any',
+            'Content-MD5': base64.b64encode(hashlib.md5(b'other').digest()).decode(),
+        },
+        data=b'abcd',
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'].startswith('Content-MD5 mismatch')
+
+
+async def test_upload_raw_chunk_saves_gzip_body_decompressed(
+    test_async_client, httpx_mock, create_job_folder, create_fake_job
+):
+    with open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb') as f:
+        chunk = f.read()
+
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/1',
+        headers={
+            'Session-Id': '1234',
+            'Project-Code': 'any',
+            'Operator': 'me',
+            'Resumable-Filename': 'any',
+            'Content-Encoding': 'gzip',
+            'Content-MD5': base64.b64encode(hashlib.md5(chunk).digest()).decode(),
+        },
+        data=gzip.compress(chunk),
+    )
+    assert response.status_code == 200
+    with open('tests/fake_global_entity_id/any_part_001', 'rb') as f:
+        assert f.read() == chunk
+
+
+async def test_upload_raw_chunk_return_415_when_content_encoding_is_not_supported(test_async_client, httpx_mock):
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/1',
+        headers={
+            'Session-Id': '1234',
+            'Project-Code': 'any',
+            'Operator': 'me',
+            'Resumable-Filename': 'any',
+            'Content-Encoding': 'br',
+        },
+        data=b'any',
+    )
+    assert response.status_code == 415
+    assert response.json()['error_msg'] == 'Unsupported Content-Encoding: br'
+
+
+async def test_upload_raw_chunk_return_400_when_gzip_body_is_truncated(
+    test_async_client, httpx_mock, create_job_folder, create_fake_job
+):
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/1',
+        headers={
+            'Session-Id': '1234',
+            'Project-Code': 'any',
+            'Operator': 'me',
+            'Resumable-Filename': 'any',
+            'Content-Encoding': 'gzip',
+        },
+        data=gzip.compress(b'abcd' * 100)[:-8],
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Truncated gzip chunk'
+
+
+async def test_upload_raw_chunk_keeps_chunk_of_memory_staged_upload_in_redis(
+    test_async_client, httpx_mock, create_fake_memory_job
+):
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/2',
+        headers={'Session-Id': '1234', 'Project-Code': 'any', 'Operator': 'me', 'Resumable-Filename': 'any'},
+        data=b'abcd',
+    )
+    assert response.status_code == 200
+    assert await upload_memory_chunks_get('fake_global_entity_id', 2) == [None, b'abcd']
+    assert not os.path.exists('tests/fake_global_entity_id/any_part_002')
+
+
+@mock.patch('app.routers.v1.api_data_upload.staging_release')
+async def test_upload_raw_chunk_return_400_and_keep_job_when_chunk_exceeds_memory_reserved(
+    fake_staging_release, test_async_client, httpx_mock, create_fake_memory_job
+):
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/1',
+        headers={'Session-Id': '1234', 'Project-Code': 'any', 'Operator': 'me', 'Resumable-Filename': 'any'},
+        data=b'abcdefghijk',
+    )
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'chunk exceeds the 10 bytes reserved in memory'
+    fake_staging_release.assert_not_called()
+
+
+async def test_upload_raw_chunk_needs_only_session_id_header_when_job_has_manifest(
+    test_async_client, httpx_mock, create_job_folder, create_fake_manifest_job
+):
+    response = await test_async_client.put(
+        '/v1/files/fake_global_entity_id/chunks/2', headers={'Session-Id': '1234'}, data=b'abcd'
+    )
+    assert response.status_code == 200
+    with open('tests/fake_global_entity_id/any_part_002', 'rb') as f:
+        assert f.read() == b'abcd'
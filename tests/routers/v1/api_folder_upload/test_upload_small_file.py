@@ -0,0 +1,126 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import pytest
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+
+def small_file_form():
+    return {
+        'project_code': 'any',
+        'operator': 'me',
+        'resumable_filename': 'any',
+        'file_data': ('chunk.txt', open('tests/routers/v1/api_folder_upload/chunk.txt', 'rb'), 'text/plain'),
+    }
+
+
+async def test_upload_small_file_return_400_when_session_id_header_is_missing(test_async_client, httpx_mock):
+    response = await test_async_client.post('/v1/files/small', files=small_file_form())
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Invalid Session ID: None'
+
+
+async def test_upload_small_file_return_413_when_file_is_above_threshold(test_async_client, httpx_mock, monkeypatch):
+    from app.config import ConfigClass
+
+    monkeypatch.setattr(ConfigClass, 'SMALL_FILE_MAX_SIZE', 100)
+    response = await test_async_client.post('/v1/files/small', headers={'Session-Id': '1234'}, files=small_file_form())
+    assert response.status_code == 413
+    assert response.json()['error_msg'] == 'File is larger than 100 bytes, use the chunk upload'
+
+
+async def test_upload_small_file_return_409_when_file_exists(test_async_client, httpx_mock):
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Container/query',
+        json=[{'any': 'any', 'global_entity_id': 'fake_global_entity_id'}],
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Core/query',
+        json={'any': 'any'},
+        status_code=200,
+    )
+    response = await test_async_client.post('/v1/files/small', headers={'Session-Id': '1234'}, files=small_file_form())
+    assert response.status_code == 409
+    assert response.json()['result'] == {'failed': [{'name': 'any', 'relative_path': '', 'type': 'File'}]}
+
+
+async def test_upload_small_file_return_401_when_authorization_header_is_missing(test_async_client, httpx_mock):
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Container/query',
+        json=[{'any': 'any', 'global_entity_id': 'fake_global_entity_id'}],
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Core/query',
+        json=[],
+        status_code=200,
+    )
+    response = await test_async_client.post('/v1/files/small', headers={'Session-Id': '1234'}, files=small_file_form())
+    assert response.status_code == 401
+    assert response.json()['error_msg'] == 'Authorization is required for small file upload'
+
+
+async def test_upload_small_file_should_remove_object_when_registration_fails(
+    test_async_client, httpx_mock, mock_minio, monkeypatch
+):
+    from app.commons.service_connection.minio_client import Minio
+
+    class FakePutResult:
+        version_id = 'fake_version_id'
+
+    removed = []
+    monkeypatch.setattr(Minio, 'put_object', lambda *args: FakePutResult())
+    monkeypatch.setattr(Minio, 'remove_object', lambda self, *args: removed.append(args))
+
+    async def register_uploaded_file(*args):
+        raise Exception('registration failed')
+
+    monkeypatch.setattr('app.routers.v1.api_data_upload.register_uploaded_file', register_uploaded_file)
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Container/query',
+        json=[{'any': 'any', 'global_entity_id': 'fake_global_entity_id'}],
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST',
+        url='http://neo4j_service/v1/neo4j/nodes/Core/query',
+        json=[],
+        status_code=200,
+    )
+    httpx_mock.add_response(
+        method='POST', url='http://data_ops_util_service/v2/resource/lock/', json={}, status_code=200
+    )
+    httpx_mock.add_response(
+        method='DELETE', url='http://data_ops_util_service/v2/resource/lock/', json={}, status_code=200
+    )
+    response = await test_async_client.post(
+        '/v1/files/small',
+        headers={'Session-Id': '1234', 'Authorization': 'token', 'Refresh-Token': 'refresh_token'},
+        files=small_file_form(),
+    )
+    assert response.status_code == 500
+    assert [args[1:] for args in removed] == [('any', 'fake_version_id')]
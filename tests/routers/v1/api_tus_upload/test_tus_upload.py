@@ -0,0 +1,196 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import base64
+
+import mock
+import pytest
+
+pytestmark = pytest.mark.asyncio  # set the mark to all tests in this file.
+
+
+def encode_metadata(**metadata):
+    return ','.join('%s %s' % (key, base64.b64encode(value.encode()).decode()) for key, value in metadata.items())
+
+
+async def create_tus_resource(test_async_client):
+    return await test_async_client.post(
+        '/v1/files/tus',
+        headers={
+            'Session-Id': '1234',
+            'Tus-Resumable': '1.0.0',
+            'Upload-Length': '10',
+            'Upload-Metadata': encode_metadata(
+                resumable_identifier='fake_global_entity_id', project_code='any', operator='me'
+            ),
+        },
+    )
+
+
+async def test_tus_create_return_412_when_tus_resumable_header_is_missing(test_async_client, httpx_mock):
+    response = await test_async_client.post('/v1/files/tus', headers={'Session-Id': '1234'})
+    assert response.status_code == 412
+    assert response.headers['Tus-Version'] == '1.0.0'
+
+
+async def test_tus_create_return_400_when_job_is_not_a_tus_upload(test_async_client, httpx_mock, create_fake_job):
+    response = await create_tus_resource(test_async_client)
+    assert response.status_code == 400
+    assert response.json()['error_msg'] == 'Job fake_global_entity_id is not a TUS upload'
+
+
+async def test_tus_create_return_201_with_location(test_async_client, httpx_mock, create_fake_tus_job):
+    response = await create_tus_resource(test_async_client)
+    assert response.status_code == 201
+    assert response.headers['Location'] == '/v1/files/tus/fake_global_entity_id'
+    assert response.headers['Upload-Offset'] == '0'
+
+
+async def test_tus_offset_return_offset_after_append(
+    test_async_client, httpx_mock, create_job_folder, create_fake_tus_job
+):
+    with open('tests/fake_global_entity_id/any', 'wb') as f:
+        f.truncate(10)
+    await create_tus_resource(test_async_client)
+
+    response = await test_async_client.patch(
+        '/v1/files/tus/fake_global_entity_id',
+        headers={
+            'Session-Id': '1234',
+            'Operator': 'me',
+            'Tus-Resumable': '1.0.0',
+            'Upload-Offset': '0',
+            'Content-Type': 'application/offset+octet-stream',
+        },
+        data=b'abcd',
+    )
+    assert response.status_code == 204
+    assert response.headers['Upload-Offset'] == '4'
+
+    response = await test_async_client.head(
+        '/v1/files/tus/fake_global_entity_id',
+        headers={'Session-Id': '1234', 'Operator': 'me', 'Tus-Resumable': '1.0.0'},
+    )
+    assert response.status_code == 200
+    assert response.headers['Upload-Offset'] == '4'
+
+
+async def test_tus_append_return_409_when_offset_does_not_match(
+    test_async_client, httpx_mock, create_job_folder, create_fake_tus_job
+):
+    await create_tus_resource(test_async_client)
+
+    response = await test_async_client.patch(
+        '/v1/files/tus/fake_global_entity_id',
+        headers={
+            'Session-Id': '1234',
+            'Operator': 'me',
+            'Tus-Resumable': '1.0.0',
+            'Upload-Offset': '4',
+            'Content-Type': 'application/offset+octet-stream',
+        },
+        data=b'efgh',
+    )
+    assert response.status_code == 409
+    assert response.json()['result'] == {'upload_offset': 0}
+
+
+async def test_tus_offset_return_403_when_operator_does_not_own_the_upload(
+    test_async_client, httpx_mock, create_job_folder, create_fake_tus_job
+):
+    await create_tus_resource(test_async_client)
+
+    response = await test_async_client.head(
+        '/v1/files/tus/fake_global_entity_id',
+        headers={'Session-Id': '1234', 'Operator': 'someone_else', 'Tus-Resumable': '1.0.0'},
+    )
+    assert response.status_code == 403
+
+
+async def test_tus_append_return_403_when_session_does_not_own_the_upload(
+    test_async_client, httpx_mock, create_job_folder, create_fake_tus_job
+):
+    await create_tus_resource(test_async_client)
+
+    response = await test_async_client.patch(
+        '/v1/files/tus/fake_global_entity_id',
+        headers={
+            'Session-Id': '5678',
+            'Operator': 'me',
+            'Tus-Resumable': '1.0.0',
+            'Upload-Offset': '0',
+            'Content-Type': 'application/offset+octet-stream',
+        },
+        data=b'abcd',
+    )
+    assert response.status_code == 403
+    assert response.json()['error_msg'] == 'Session or operator does not own the tus upload'
+
+
+async def test_tus_append_return_409_when_another_append_holds_the_upload(
+    test_async_client, httpx_mock, create_job_folder, create_fake_tus_job
+):
+    from app.commons.data_providers import upload_tus_claim
+    from app.commons.data_providers import upload_tus_get
+
+    await create_tus_resource(test_async_client)
+    await upload_tus_claim('fake_global_entity_id')
+
+    response = await test_async_client.patch(
+        '/v1/files/tus/fake_global_entity_id',
+        headers={
+            'Session-Id': '1234',
+            'Operator': 'me',
+            'Tus-Resumable': '1.0.0',
+            'Upload-Offset': '0',
+            'Content-Type': 'application/offset+octet-stream',
+        },
+        data=b'abcd',
+    )
+    assert response.status_code == 409
+    assert response.json()['error_msg'] == 'Concurrent append to fake_global_entity_id'
+    assert (await upload_tus_get('fake_global_entity_id'))['offset'] == '0'
+
+
+@mock.patch('app.routers.v1.api_data_upload.finalize_worker')
+async def test_tus_append_starts_finalize_when_last_byte_lands(
+    fake_finalize_worker, test_async_client, httpx_mock, create_job_folder, create_fake_tus_job
+):
+    with open('tests/fake_global_entity_id/any', 'wb') as f:
+        f.truncate(10)
+    await create_tus_resource(test_async_client)
+
+    response = await test_async_client.patch(
+        '/v1/files/tus/fake_global_entity_id',
+        headers={
+            'Session-Id': '1234',
+            'Operator': 'me',
+            'Tus-Resumable': '1.0.0',
+            'Upload-Offset': '0',
+            'Content-Type': 'application/offset+octet-stream',
+            'Authorization': 'token',
+        },
+        data=b'abcdefghij',
+    )
+    assert response.status_code == 204
+    assert response.headers['Upload-Offset'] == '10'
+    fake_finalize_worker.assert_called_once()
+    with open('tests/fake_global_entity_id/any', 'rb') as f:
+        assert f.read() == b'abcdefghij'
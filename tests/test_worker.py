@@ -0,0 +1,142 @@
+# Copyright 2022 Indoc Research
+# 
+# Licensed under the EUPL, Version 1.2 or – as soon they
+# will be approved by the European Commission - subsequent
+# versions of the EUPL (the "Licence");
+# You may not use this work except in compliance with the
+# Licence.
+# You may obtain a copy of the Licence at:
+# 
+# https://joinup.ec.europa.eu/collection/eupl/eupl-text-eupl-12
+# 
+# Unless required by applicable law or agreed to in
+# writing, software distributed under the Licence is
+# distributed on an "AS IS" basis,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied.
+# See the Licence for the specific language governing
+# permissions and limitations under the Licence.
+# 
+
+import asyncio
+import json
+import os
+from unittest import mock
+
+import pytest
+from aioredis import StrictRedis
+from starlette.config import environ
+
+from app.commons.data_providers import finalize_queue_add
+from app.commons.data_providers import finalize_queue_create_group
+from app.commons.data_providers import finalize_queue_read
+from app.config import ConfigClass
+from app.worker import is_finalize_restartable
+from app.worker import keep_alive
+from app.worker import process_finalize
+from app.worker import run_finalize_worker
+
+_JOB_KEY = 'dataaction:1234:fake_global_entity_id:data_upload:any:me:any'
+_FINALIZE_REQUEST = {
+    'project_code': 'any',
+    'operator': 'me',
+    'resumable_identifier': 'fake_global_entity_id',
+    'resumable_filename': 'any',
+    'resumable_relative_path': '',
+    'resumable_total_chunks': 1,
+    'resumable_total_size': 10,
+}
+
+
+async def queue_finalize(status):
+    cache = StrictRedis(host=environ.get('REDIS_HOST'))
+    await cache.set(
+        _JOB_KEY,
+        json.dumps(
+            {
+                'session_id': '1234',
+                'job_id': 'fake_global_entity_id',
+                'source': 'any',
+                'action': 'data_upload',
+                'status': status,
+                'project_code': 'any',
+                'operator': 'me',
+                'progress': 100,
+                'payload': {'task_id': 'fake_global_entity_id', 'resumable_identifier': 'fake_global_entity_id'},
+                'update_timestamp': '1000',
+            }
+        ),
+    )
+    await finalize_queue_create_group()
+    await finalize_queue_add(_JOB_KEY, _FINALIZE_REQUEST, 'token', None)
+    [(entry_id, message, deliveries)] = await finalize_queue_read('any', 1, 1)
+    assert message['finalize_request'] == _FINALIZE_REQUEST
+    assert message['refresh_token'] is None
+    return cache, entry_id, message
+
+
+def test_is_finalize_restartable_should_be_false_once_merge_started(tmp_path):
+    chunk_path = tmp_path / 'any_part_001'
+    chunk_path.write_bytes(b'any')
+
+    assert is_finalize_restartable([], str(tmp_path / 'any'))
+    assert is_finalize_restartable([str(chunk_path)], str(tmp_path / 'any'))
+    (tmp_path / 'any').write_bytes(b'')
+    assert not is_finalize_restartable([str(chunk_path)], str(tmp_path / 'any'))
+
+
+@pytest.mark.asyncio
+async def test_process_finalize_acks_request_of_finished_job():
+    cache, entry_id, message = await queue_finalize('SUCCEED')
+
+    with mock.patch('app.worker.finalize_worker') as fake_finalize_worker:
+        await process_finalize(mock.MagicMock(), entry_id, message, 1)
+
+    fake_finalize_worker.assert_not_called()
+    assert await cache.xlen('finalizequeue') == 0
+
+
+@pytest.mark.asyncio
+async def test_process_finalize_terminates_job_interrupted_during_merge(httpx_mock, create_job_folder):
+    httpx_mock.add_response(
+        method='DELETE', url='http://data_ops_util_service/v2/resource/lock/', json={}, status_code=200
+    )
+    cache, entry_id, message = await queue_finalize('CHUNK_UPLOADED')
+    # the first chunk was merged and removed before the worker stopped
+    with open('tests/fake_global_entity_id/any', 'wb') as merged_file:
+        merged_file.write(b'any')
+    os.unlink('tests/fake_global_entity_id/any_part_001')
+
+    with mock.patch('app.worker.finalize_worker') as fake_finalize_worker:
+        await process_finalize(mock.MagicMock(), entry_id, message, 2)
+
+    fake_finalize_worker.assert_not_called()
+    record = json.loads(await cache.get(_JOB_KEY))
+    assert record['status'] == 'TERMINATED'
+    assert record['payload']['error_msg'] == 'Finalize was interrupted while the chunks were merged'
+    assert await cache.xlen('finalizequeue') == 0
+
+
+@pytest.mark.asyncio
+async def test_keep_alive_logs_failed_touches_and_stops_after_claim_idle_time(monkeypatch):
+    monkeypatch.setattr(ConfigClass, 'FINALIZE_QUEUE_CLAIM_IDLE', 0)
+    fake_logger = mock.MagicMock()
+
+    with mock.patch('app.worker.finalize_queue_touch', side_effect=Exception('redis is gone')) as fake_touch:
+        await asyncio.wait_for(keep_alive(fake_logger, 'any', {}), 1)
+
+    assert fake_touch.call_count == 3
+    assert fake_logger.error.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_run_finalize_worker_stops_taking_requests_when_heartbeat_stops():
+    async def stopped_heartbeat(logger, consumer, in_flight):
+        return
+
+    with mock.patch('app.worker.keep_alive', stopped_heartbeat), mock.patch(
+        'app.worker.finalize_queue_claim', return_value=[]
+    ) as fake_claim, mock.patch('app.worker.finalize_queue_read', return_value=[]):
+        await asyncio.wait_for(run_finalize_worker(mock.MagicMock(), 'any', asyncio.Event()), 1)
+
+    assert fake_claim.call_count <= 1